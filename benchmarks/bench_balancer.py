@@ -0,0 +1,75 @@
+'''
+Simulation of the balancers with replicas of different speeds
+
+    python benchmarks/bench_balancer.py
+
+Requests arrive as a Poisson process and each replica serves its queue in
+FIFO order with exponential service times, one replica being several times
+slower than the others. Round-robin keeps sending it 1/8 of the requests,
+more than it can serve, so its queue and the tail latency grow without bound.
+'''
+import heapq
+import random
+
+import numpy as np
+
+from serving_utils.balancer import (
+    LatencyAwareBalancer,
+    PowerOfTwoChoicesBalancer,
+    RoundRobinBalancer,
+)
+
+
+N_REQUESTS = 100000
+# mean service time of each replica, in ms
+REPLICA_SERVICE_MS = [1., 1., 1., 1., 1., 1., 1., 4.]
+LOADS = [0.5, 0.7, 0.85]
+
+
+def simulate(balancer, load, seed=0):
+    rng = random.Random(seed)
+    random.seed(seed)
+    for i in range(len(REPLICA_SERVICE_MS)):
+        balancer[i] = i
+
+    capacity = sum(1 / service_ms for service_ms in REPLICA_SERVICE_MS)  # requests per ms
+    mean_interarrival = 1 / (load * capacity)
+    free_at = [0.] * len(REPLICA_SERVICE_MS)
+    completions = []  # (time, replica, latency)
+    latencies = np.empty(N_REQUESTS)
+
+    now = 0.
+    # the latency-aware balancer decays its estimates on the simulated clock
+    balancer._clock = lambda: now / 1000
+    for n in range(N_REQUESTS):
+        now += rng.expovariate(1 / mean_interarrival)
+        while completions and completions[0][0] <= now:
+            _, replica, latency = heapq.heappop(completions)
+            balancer.finished(replica, latency / 1000)
+
+        replica, _ = balancer.pick()
+        balancer.started(replica)
+        start = max(now, free_at[replica])
+        free_at[replica] = start + rng.expovariate(1 / REPLICA_SERVICE_MS[replica])
+        latencies[n] = free_at[replica] - now
+        heapq.heappush(completions, (free_at[replica], replica, latencies[n]))
+    return latencies
+
+
+def main():
+    balancers = [
+        ('round-robin', RoundRobinBalancer),
+        ('power-of-two-choices', PowerOfTwoChoicesBalancer),
+        ('latency-aware (EWMA)', LatencyAwareBalancer),
+    ]
+    print(f"replica service times (ms): {REPLICA_SERVICE_MS}")
+    print(f"{'load':>5} {'balancer':<22} {'p50':>8} {'p90':>8} {'p99':>8} {'p99.9':>8} (ms)")
+    for load in LOADS:
+        for name, balancer_class in balancers:
+            latencies = simulate(balancer_class(), load)
+            p50, p90, p99, p999 = np.percentile(latencies, [50, 90, 99, 99.9])
+            print(f"{load:>5} {name:<22} {p50:8.2f} {p90:8.2f} {p99:8.2f} {p999:8.2f}")
+
+
+if __name__ == '__main__':
+    main()
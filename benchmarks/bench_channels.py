@@ -0,0 +1,114 @@
+'''
+Throughput of async_predict against the channels per address, with multi-MB tensors
+
+    python benchmarks/bench_channels.py
+
+A grpcio server in another process answers c = a + 2 * b, the client keeps
+CONCURRENCY requests in flight to this single address. With one channel all
+of them share one HTTP/2 connection, its flow control window and its framing.
+'''
+import asyncio
+from concurrent import futures
+import multiprocessing
+import socket
+import time
+
+import grpc
+import numpy as np
+
+from serving_utils import Client, StaticResolver
+from serving_utils.protos import predict_pb2, prediction_service_pb2_grpc
+from serving_utils.tensor_utils import make_ndarray, make_tensor_proto
+
+
+PAYLOAD_MB = [1, 4]
+CHANNELS_PER_ADDRESS = [1, 2, 4, 8]
+CONCURRENCY = 16
+DURATION_SECONDS = 3
+UNLIMITED_MESSAGES = [
+    ('grpc.max_receive_message_length', -1),
+    ('grpc.max_send_message_length', -1),
+]
+
+
+class Servicer(prediction_service_pb2_grpc.PredictionServiceServicer):
+
+    def Predict(self, request, context):
+        a = make_ndarray(request.inputs['a'])
+        b = make_ndarray(request.inputs['b'])
+        response = predict_pb2.PredictResponse()
+        make_tensor_proto(a + 2 * b, response.outputs['c'])
+        return response
+
+
+def serve(port, ready):
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=32), options=UNLIMITED_MESSAGES)
+    prediction_service_pb2_grpc.add_PredictionServiceServicer_to_server(Servicer(), server)
+    server.add_insecure_port(f'127.0.0.1:{port}')
+    server.start()
+    ready.set()
+    server.wait_for_termination()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def run(port, payload_mb, channels_per_address):
+    client = Client(
+        host=None,
+        port=port,
+        resolver=StaticResolver(['127.0.0.1']),
+        channel_mode='async',
+        channels_per_address=channels_per_address,
+    )
+    n_floats = payload_mb * 1024 * 1024 // 4 // 2
+    data = {
+        'a': np.ones((1, n_floats), np.float32),
+        'b': np.ones((1, n_floats), np.float32),
+    }
+    await client.async_predict(data)  # connect
+
+    n_requests = 0
+    deadline = time.monotonic() + DURATION_SECONDS
+
+    async def worker():
+        nonlocal n_requests
+        while time.monotonic() < deadline:
+            await client.async_predict(data)
+            n_requests += 1
+
+    start = time.monotonic()
+    await asyncio.gather(*[worker() for _ in range(CONCURRENCY)])
+    elapsed = time.monotonic() - start
+    for conn in client._pool.values():
+        for channel in conn.channels(is_async=True):
+            channel.channel.close()
+    return n_requests / elapsed
+
+
+def main():
+    port = free_port()
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(port, ready), daemon=True)
+    server.start()
+    ready.wait()
+    loop = asyncio.get_event_loop()
+    try:
+        print(f"{CONCURRENCY} requests in flight to one address")
+        print(f"{'request MB':>10} {'channels':>8} {'requests/s':>10} {'MB/s':>8}")
+        for payload_mb in PAYLOAD_MB:
+            for channels_per_address in CHANNELS_PER_ADDRESS:
+                throughput = loop.run_until_complete(run(port, payload_mb, channels_per_address))
+                print(
+                    f"{payload_mb:>10} {channels_per_address:>8} {throughput:>10.1f} "
+                    f"{throughput * payload_mb:>8.1f}"
+                )
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
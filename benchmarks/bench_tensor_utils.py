@@ -0,0 +1,95 @@
+'''
+Benchmark of TensorProto encoding and decoding
+
+    python benchmarks/bench_tensor_utils.py
+
+Compares `serving_utils.tensor_utils.make_tensor_proto` writing in place into
+`PredictRequest.inputs` with the former `tf.make_tensor_proto` + `copy_message` path,
+and `make_ndarray` with `tf.make_ndarray` on predict outputs.
+'''
+import timeit
+
+import numpy as np
+
+from serving_utils.protos import predict_pb2
+from serving_utils.tensor_utils import make_tensor_proto, make_ndarray
+
+try:
+    import tensorflow.compat.v1 as tf
+except ImportError:
+    try:
+        import tensorflow as tf
+    except ImportError:
+        tf = None
+
+
+SHAPES = [(1,), (1, 128), (32, 128), (32, 768), (256, 768)]
+DTYPES = [np.float32, np.int32, np.int64, np.float16, np.bool_]
+STRING_SHAPES = [(1,), (32,), (256,)]
+EMBEDDING_BATCH_SIZES = [1, 32, 256, 1024]
+MAX_NUMBER = 1000
+
+
+def encode_native(value):
+    req = predict_pb2.PredictRequest()
+    make_tensor_proto(value, req.inputs['x'])
+
+
+def encode_tf(value):
+    req = predict_pb2.PredictRequest()
+    req.inputs['x'].ParseFromString(tf.make_tensor_proto(value).SerializeToString())
+
+
+def decode_native(tensor_proto):
+    make_ndarray(tensor_proto)
+
+
+def decode_tf(tensor_proto):
+    tf.make_ndarray(tensor_proto)
+
+
+def best_of(fn, value, number):
+    timer = timeit.Timer(lambda: fn(value))
+    return min(timer.repeat(repeat=5, number=number)) / number
+
+
+def bench(value, label, native_fn=encode_native, tf_fn=encode_tf, nbytes=None):
+    if nbytes is None:
+        nbytes = value.nbytes
+    # about 1MB encoded per repeat, and a bounded number of calls for tiny arrays
+    number = min(max(1, int(1e6 // max(nbytes, 1))), MAX_NUMBER)
+    native = best_of(native_fn, value, number)
+    if tf is None:
+        print(f"{label:<28} native {native * 1e6:>10.1f} us")
+        return
+    baseline = best_of(tf_fn, value, number)
+    print(
+        f"{label:<28} native {native * 1e6:>10.1f} us"
+        f"    tf {baseline * 1e6:>10.1f} us    speedup {baseline / native:>6.1f}x"
+    )
+
+
+def main():
+    print("encode")
+    for dtype in DTYPES:
+        for shape in SHAPES:
+            value = (np.random.rand(*shape) * 100).astype(dtype)
+            bench(value, f"{np.dtype(dtype).name} {shape}")
+    for shape in STRING_SHAPES:
+        value = np.array([f"sentence number {i}".encode() for i in range(np.prod(shape))])
+        bench(value.reshape(shape), f"bytes {shape}")
+
+    print("decode")
+    for batch_size in EMBEDDING_BATCH_SIZES:
+        value = np.random.rand(batch_size, 768).astype(np.float32)
+        bench(
+            make_tensor_proto(value),
+            f"float32 ({batch_size}, 768)",
+            native_fn=decode_native,
+            tf_fn=decode_tf,
+            nbytes=value.nbytes,
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,55 @@
+import sys
+
 from .client import Client, PredictInput
-from .saver import Saver
-from .loader import Loader
+from .balancer import (
+    ConsistentHashBalancer,
+    LatencyAwareBalancer,
+    PowerOfTwoChoicesBalancer,
+    RoundRobinBalancer,
+)
+from .batching import BatchingPolicy
+from .cache import ResponseCache, RowCache
+from .circuit_breaker import CircuitBreakerPolicy
+from .health import HealthCheckPolicy
+from .hedging import HedgingPolicy
+from .pipeline import PredictResult
+from .resolver import (
+    DnsResolver,
+    Endpoint,
+    FileResolver,
+    SrvResolver,
+    StaticResolver,
+)
+from .retry import RetryPolicy
+from .warmup import WarmupRequest
+
+
+# Saver and Loader need tensorflow, they are imported on first access
+# so that the client can be used without tensorflow installed.
+_LAZY_ATTRS = {
+    'Saver': 'saver',
+    'Loader': 'loader',
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        import importlib
+        module = importlib.import_module(f'.{_LAZY_ATTRS[name]}', __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
+
+
+if sys.version_info < (3, 7):
+    # module-level __getattr__ (PEP 562) is not supported before python 3.7
+    try:
+        from .saver import Saver
+        from .loader import Loader
+    except ImportError:
+        pass
@@ -0,0 +1,527 @@
+'''
+Load balancing over the connections of a Client
+
+A balancer is the pool of connections by address, and picks the connection
+of each request in O(1). Calls report their start and end so that balancers
+can route on in-flight counts or latencies. Connections may have weights,
+their relative share of the calls (e.g. the weights of DNS SRV records).
+'''
+import asyncio
+import bisect
+import collections
+import contextlib
+import functools
+import hashlib
+import math
+import random
+import threading
+import time
+from typing import Collection, Hashable, Tuple
+
+
+class EmptyPool(Exception):
+    pass
+
+
+class Balancer(collections.abc.MutableMapping):
+    '''Base of balancers, a mapping of address => connection
+
+    Subclasses implement `_choose`.
+    '''
+
+    # slots of the heaviest key in the weighted order, lighter keys get a proportional
+    # number of them (at least one), so ratios are followed within about 1 / MAX_SLOTS
+    MAX_SLOTS = 100
+
+    def __init__(self):
+        self._container = {}
+        self._keys = []  # for O(1) choice by index
+        self._positions = {}  # key => index in _keys
+        self._in_flight = {}  # key => calls in flight
+        self._total_in_flight = 0
+        self._weights = {}  # key => weight, 1 if missing
+        # keys appearing in proportion to their weights, _keys itself if unweighted
+        self._slots = self._keys
+        # if set, an OutlierDetector whose ejected keys are not picked
+        self.outlier_detector = None
+        # if set, tells whether the exception of a call is an error of its connection
+        self.error_filter = None
+        self._unhealthy = set()  # keys failing their health checks
+        self._lock = threading.Lock()
+
+    def __getitem__(self, k):
+        return self._container[k]
+
+    def __setitem__(self, k, v):
+        with self._lock:
+            if k not in self._container:
+                self._positions[k] = len(self._keys)
+                self._keys.append(k)
+                self._in_flight[k] = 0
+                self._added(k)
+                if self._weights:
+                    self._update_slots()
+            self._container[k] = v
+
+    def __delitem__(self, k):
+        with self._lock:
+            del self._container[k]
+            # swap with the last key to remove in O(1)
+            position = self._positions.pop(k)
+            last = self._keys.pop()
+            if last != k:
+                self._keys[position] = last
+                self._positions[last] = position
+            self._total_in_flight -= self._in_flight.pop(k)
+            self._removed(k)
+            if self.outlier_detector is not None:
+                self.outlier_detector.forget(k)
+            self._unhealthy.discard(k)
+            if self._weights:
+                self._weights.pop(k, None)
+                self._update_slots()
+
+    def __iter__(self):
+        return iter(self._container)
+
+    def __len__(self):
+        return len(self._container)
+
+    def snapshot(self):
+        '''List of the (key, value) items, safe to iterate while keys are added or removed'''
+        with self._lock:
+            return list(self._container.items())
+
+    def in_flight(self, k) -> int:
+        return self._in_flight.get(k, 0)
+
+    def weight(self, k) -> float:
+        return self._weights.get(k, 1.)
+
+    def set_weight(self, k, weight: float):
+        '''Set the share of the calls of `k` relative to the others, 1 by default'''
+        if weight <= 0:
+            raise ValueError("weight should be positive")
+        with self._lock:
+            if k not in self._container:
+                raise KeyError(k)
+            if weight == self.weight(k):
+                return
+            if weight == 1.:
+                del self._weights[k]
+            else:
+                self._weights[k] = weight
+            self._update_slots()
+            self._reweighted(k)
+
+    def _update_slots(self):
+        if not self._weights:
+            self._slots = self._keys
+            return
+        weights = [self.weight(k) for k in self._keys]
+        largest = max(weights)
+        counts = [max(round(weight / largest * self.MAX_SLOTS), 1) for weight in weights]
+        divisor = functools.reduce(math.gcd, counts)
+        counts = [count // divisor for count in counts]
+        # smooth weighted round-robin order, so that heavy keys are spread out
+        total = sum(counts)
+        current = [0] * len(counts)
+        slots = []
+        for _ in range(total):
+            for i, count in enumerate(counts):
+                current[i] += count
+            best = max(range(len(counts)), key=current.__getitem__)
+            current[best] -= total
+            slots.append(self._keys[best])
+        self._slots = slots
+
+    def _load(self, k) -> float:
+        '''Calls in flight on `k` relative to its weight'''
+        return self._in_flight[k] / self.weight(k)
+
+    def pick(
+            self,
+            exclude: Collection[Hashable] = (),
+            routing_key=None,
+        ) -> Tuple[Hashable, object]:
+        '''(address, connection) for the next call, avoiding the addresses in `exclude`
+
+        `routing_key` is only used by balancers routing on it (ConsistentHashBalancer).
+        Connections ejected by the outlier detector are avoided too, and unhealthy
+        ones unless all of them are.
+        '''
+        with self._lock:
+            ejected = ()
+            if self.outlier_detector is not None:
+                ejected = self.outlier_detector.unavailable()
+            if self._unhealthy and len(self._unhealthy) < len(self._keys):
+                ejected = self._unhealthy.union(ejected)
+            if routing_key is not None:
+                key = self._choose_for_key(
+                    routing_key, set(exclude) | ejected if ejected else exclude)
+                if key is not None:
+                    return key, self._container[key]
+            if not exclude:
+                keys = self._slots
+                if ejected:
+                    keys = [k for k in keys if k not in ejected]
+                if not keys:
+                    raise EmptyPool("no connections")
+                key = self._choose(keys)
+            else:
+                keys = [k for k in self._keys if k not in exclude and k not in ejected]
+                if not keys:
+                    raise EmptyPool("no connections")
+                key = self._choose_other(keys)
+            return key, self._container[key]
+
+    def set_healthy(self, k, healthy: bool):
+        '''Mark `k` as passing or failing its health checks'''
+        with self._lock:
+            if healthy:
+                self._unhealthy.discard(k)
+            elif k in self._container:
+                self._unhealthy.add(k)
+
+    def healthy(self, k) -> bool:
+        return k not in self._unhealthy
+
+    def started(self, k):
+        with self._lock:
+            if k in self._in_flight:
+                self._in_flight[k] += 1
+                self._total_in_flight += 1
+                if self.outlier_detector is not None:
+                    self.outlier_detector.started(k)
+
+    def finished(self, k, latency_seconds: float = None, error: bool = False):
+        '''End of a call started on `k`, `latency_seconds` is None if it was cancelled'''
+        with self._lock:
+            if k in self._in_flight:
+                self._in_flight[k] -= 1
+                self._total_in_flight -= 1
+                self._record(k, latency_seconds, error)
+                if self.outlier_detector is not None:
+                    self.outlier_detector.finished(
+                        k, None if latency_seconds is None else error, len(self._keys))
+
+    @contextlib.contextmanager
+    def track(self, k):
+        '''Report the call run in the `with` block as started and finished on `k`'''
+        self.started(k)
+        start = time.monotonic()
+        latency_seconds = None
+        error = False
+        try:
+            yield
+            latency_seconds = time.monotonic() - start
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            latency_seconds = time.monotonic() - start
+            error = self._is_error(e)
+            raise
+        finally:
+            self.finished(k, latency_seconds, error)
+
+    def track_future(self, k, future):
+        '''Report `future` (grpc future or asyncio task) as started and finished on `k`'''
+        self.started(k)
+        start = time.monotonic()
+
+        def on_done(future):
+            if future.cancelled():
+                self.finished(k)
+            else:
+                exception = future.exception()
+                error = exception is not None and self._is_error(exception)
+                self.finished(k, time.monotonic() - start, error)
+
+        future.add_done_callback(on_done)
+        return future
+
+    def _is_error(self, exception):
+        return self.error_filter is None or self.error_filter(exception)
+
+    def _choose(self, keys):
+        '''Choice among `keys`, where weighted keys appear in proportion to their weights'''
+        raise NotImplementedError
+
+    def _choose_for_key(self, routing_key, exclude):
+        '''Connection of a call with `routing_key`, None to choose as if there was no key'''
+        return None
+
+    def _choose_other(self, keys):
+        '''Choice among the non-excluded `keys` (for hedges and retries), least loaded'''
+        lowest = min(self._load(k) for k in keys)
+        return random.choice([k for k in keys if self._load(k) == lowest])
+
+    def _added(self, k):
+        '''Hook called, under the lock, when `k` joins the pool'''
+
+    def _removed(self, k):
+        '''Hook called, under the lock, when `k` leaves the pool'''
+
+    def _reweighted(self, k):
+        '''Hook called, under the lock, when the weight of `k` changes'''
+
+    def _record(self, k, latency_seconds, error):
+        '''Hook called, under the lock, at the end of each call'''
+
+
+class RoundRobinBalancer(Balancer):
+    '''Every connection in turn, the former behavior of the client'''
+
+    def __init__(self):
+        super().__init__()
+        self._cursor = 0
+
+    def _choose(self, keys):
+        key = keys[self._cursor % len(keys)]
+        self._cursor += 1
+        return key
+
+
+class PowerOfTwoChoicesBalancer(Balancer):
+    '''Least in-flight calls of two candidates
+
+    The first candidate is the next one in round-robin order, the second one
+    is drawn at random among the others, and the first is kept unless the second
+    has strictly fewer calls in flight. Without concurrent calls this is plain
+    round-robin, while a connection stuck on slow calls keeps being skipped.
+    With weights, candidates are drawn in proportion to them and calls in flight
+    are compared relative to them.
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self._cursor = 0
+
+    def _choose(self, keys):
+        n_keys = len(keys)
+        position = self._cursor % n_keys
+        self._cursor += 1
+        first = keys[position]
+        if n_keys == 1:
+            return first
+        other = random.randrange(n_keys - 1)
+        second = keys[other if other < position else other + 1]
+        if self._load(second) < self._load(first):
+            return second
+        return first
+
+
+class _EndpointStats:
+
+    __slots__ = ('latency', 'error_rate', 'updated_at')
+
+    def __init__(self, latency, now):
+        self.latency = latency
+        self.error_rate = 0.
+        self.updated_at = now
+
+
+class LatencyAwareBalancer(Balancer):
+
+    def __init__(
+            self,
+            smoothing: float = 0.2,
+            decay_seconds: float = 10.,
+            probe_probability: float = 0.02,
+            initial_latency_seconds: float = 0.01,
+        ):
+        """Routes in proportion to the capacity estimated from latencies and errors
+
+        Each connection keeps exponentially weighted moving averages (EWMA) of its
+        latency and error rate. Its capacity is (1 - error rate) / (latency * (in flight + 1)).
+        Of two candidates (as in PowerOfTwoChoicesBalancer, drawn in proportion to
+        the weights), one is picked with a probability proportional to its capacity.
+
+        Args:
+            smoothing (float) : weight of each new sample in the EWMAs
+            decay_seconds (float) : estimates of a connection without new samples fade
+                with this time constant towards the average latency of all calls and
+                no errors, so that a connection avoided once slow gets traffic again
+            probe_probability (float) : fraction of calls sent to a random connection
+                whatever its estimates, to keep them fresh
+            initial_latency_seconds (float) : latency assumed before the first call ends
+        """
+        if not 0 < smoothing <= 1:
+            raise ValueError("smoothing should be in (0, 1]")
+        super().__init__()
+        self.smoothing = smoothing
+        self.decay_seconds = decay_seconds
+        self.probe_probability = probe_probability
+        self.initial_latency_seconds = initial_latency_seconds
+        self._cursor = 0
+        self._clock = time.monotonic
+        self._stats = {}  # key => _EndpointStats
+        # EWMA of the latency of all calls, the estimate of unknown connections
+        self._mean = None
+
+    def _freshness(self, stats, now):
+        return math.exp(-(now - stats.updated_at) / self.decay_seconds)
+
+    def estimates(self, k, now: float = None) -> Tuple[float, float]:
+        '''(latency, error rate) currently estimated for `k`'''
+        if now is None:
+            now = self._clock()
+        stats = self._stats.get(k)
+        mean_latency = self.initial_latency_seconds if self._mean is None else self._mean.latency
+        if stats is None:
+            return mean_latency, 0.
+        freshness = self._freshness(stats, now)
+        latency = mean_latency + (stats.latency - mean_latency) * freshness
+        return latency, stats.error_rate * freshness
+
+    def capacity(self, k, now: float = None) -> float:
+        latency, error_rate = self.estimates(k, now)
+        # a connection failing every call keeps a little traffic to notice its recovery
+        success_rate = max(1. - error_rate, 0.01)
+        return success_rate / (max(latency, 1e-6) * (self._in_flight[k] + 1))
+
+    def _choose(self, keys):
+        n_keys = len(keys)
+        if n_keys == 1:
+            return keys[0]
+        if random.random() < self.probe_probability:
+            return random.choice(keys)
+
+        position = self._cursor % n_keys
+        self._cursor += 1
+        first = keys[position]
+        other = random.randrange(n_keys - 1)
+        second = keys[other if other < position else other + 1]
+
+        now = self._clock()
+        first_capacity = self.capacity(first, now)
+        second_capacity = self.capacity(second, now)
+        if random.random() * (first_capacity + second_capacity) < first_capacity:
+            return first
+        return second
+
+    def _choose_other(self, keys):
+        now = self._clock()
+        return max(keys, key=lambda k: self.capacity(k, now))
+
+    def _update(self, stats, latency_seconds, error, now):
+        # start from the faded estimates if the last sample is old
+        freshness = self._freshness(stats, now)
+        if self._mean is not None and stats is not self._mean:
+            stats.latency = self._mean.latency + (stats.latency - self._mean.latency) * freshness
+        stats.error_rate *= freshness
+        alpha = self.smoothing
+        if not error:
+            stats.latency += alpha * (latency_seconds - stats.latency)
+        stats.error_rate += alpha * (float(error) - stats.error_rate)
+        stats.updated_at = now
+
+    def _removed(self, k):
+        self._stats.pop(k, None)
+
+    def _record(self, k, latency_seconds, error):
+        if latency_seconds is None:
+            return  # cancelled
+        now = self._clock()
+        if not error:
+            if self._mean is None:
+                self._mean = _EndpointStats(latency_seconds, now)
+            else:
+                self._update(self._mean, latency_seconds, False, now)
+
+        stats = self._stats.get(k)
+        if stats is None:
+            latency = latency_seconds
+            if error:
+                latency = self.estimates(k, now)[0]
+            stats = self._stats[k] = _EndpointStats(latency, now)
+            stats.error_rate = float(error)
+        else:
+            self._update(stats, latency_seconds, error, now)
+
+
+def _ring_hash(value) -> int:
+    if not isinstance(value, bytes):
+        value = str(value).encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), 'big')
+
+
+class ConsistentHashBalancer(PowerOfTwoChoicesBalancer):
+
+    def __init__(self, n_virtual_nodes: int = 100, load_factor: float = None):
+        """Calls with the same routing key go to the same connection
+
+        Addresses are placed on a hash ring at `n_virtual_nodes` points each, and
+        a call goes to the first address after the hash of its routing key. When an
+        address joins or leaves the pool, only about 1/N of the keys move.
+        Weighted addresses get points in proportion to their weights.
+        Calls without a routing key are balanced as by PowerOfTwoChoicesBalancer.
+
+        Args:
+            n_virtual_nodes (int) : points of each address on the ring
+            load_factor (float) : if given, bounded loads: an address with more than
+                load_factor * (average calls in flight + 1) calls in flight is skipped
+                for the next ones on the ring, so a hot key can not overwhelm it
+        """
+        if load_factor is not None and load_factor < 1:
+            raise ValueError("load_factor should be at least 1")
+        super().__init__()
+        self.n_virtual_nodes = n_virtual_nodes
+        self.load_factor = load_factor
+        self._ring_hashes = []  # sorted hashes of the virtual nodes
+        self._ring_keys = []  # address of each virtual node
+
+    def _n_nodes(self, k, mean_weight):
+        return max(round(self.n_virtual_nodes * self.weight(k) / mean_weight), 1)
+
+    def _rebuild_ring(self):
+        mean_weight = 1.
+        if self._weights:
+            mean_weight = sum(self.weight(k) for k in self._keys) / len(self._keys)
+        ring = sorted(
+            (_ring_hash(f'{k}#{i}'), k)
+            for k in self._keys
+            for i in range(self._n_nodes(k, mean_weight))
+        )
+        self._ring_hashes = [h for h, _ in ring]
+        self._ring_keys = [k for _, k in ring]
+
+    def _added(self, k):
+        self._rebuild_ring()
+
+    def _removed(self, k):
+        self._rebuild_ring()
+
+    def _reweighted(self, k):
+        self._rebuild_ring()
+
+    def _max_in_flight(self):
+        '''Max calls in flight per unit of weight, None if unbounded'''
+        if self.load_factor is None:
+            return None
+        total_weight = len(self._keys)
+        if self._weights:
+            total_weight = sum(self.weight(k) for k in self._keys)
+        return self.load_factor * (self._total_in_flight + 1) / total_weight
+
+    def _choose_for_key(self, routing_key, exclude):
+        n_nodes = len(self._ring_hashes)
+        if not n_nodes:
+            return None
+        max_in_flight = self._max_in_flight()
+        start = bisect.bisect(self._ring_hashes, _ring_hash(routing_key))
+        seen = set()
+        for i in range(n_nodes):
+            k = self._ring_keys[(start + i) % n_nodes]
+            if k in seen:
+                continue
+            seen.add(k)
+            if k in exclude:
+                continue
+            if max_in_flight is None:
+                return k
+            if self._in_flight[k] < math.ceil(max_in_flight * self.weight(k)):
+                return k
+            if len(seen) == len(self._keys):
+                break
+        return None
@@ -0,0 +1,365 @@
+'''
+Client-side micro-batching
+
+Concurrent predict calls to the same model/signature/output filter whose
+inputs have compatible trailing shapes are concatenated along axis 0, sent as
+one PredictRequest, and each caller gets its rows of the outputs back as views.
+'''
+import asyncio
+import collections
+from concurrent import futures
+import threading
+import time
+from typing import Mapping
+
+import numpy as np
+
+
+class BatchingPolicy:
+
+    def __init__(
+            self,
+            max_batch_size: int = 32,
+            max_wait_seconds: float = 0.002,
+            pad_values: Mapping[str, object] = None,
+            max_concurrent_batches: int = 4,
+        ):
+        """When to flush a batch and how to merge inputs
+
+        Args:
+            max_batch_size (int) : a batch is sent as soon as it has this many rows
+            max_wait_seconds (float) : a batch is sent at most this long after its first call
+            pad_values (dict) : input name => pad value, for variable-length inputs.
+                Those inputs are padded on the non-batch axes to the longest one in the
+                batch, so outputs of such batches keep the padded length.
+            max_concurrent_batches (int) : number of batches the sync `predict` dispatcher
+                can have in flight at once
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size should be positive")
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.pad_values = dict(pad_values or {})
+        self.max_concurrent_batches = max_concurrent_batches
+
+
+class _PendingCall:
+
+    __slots__ = ('data', 'n_rows', 'future', 'deadline')
+
+    def __init__(self, data, n_rows, future, deadline=None):
+        self.data = data
+        self.n_rows = n_rows
+        self.future = future
+        self.deadline = deadline
+
+
+def _count_rows(calls):
+    return sum(call.n_rows for call in calls)
+
+
+def _batch_deadline(calls):
+    '''Deadline of a batch: the latest of its calls, None if one of them has none'''
+    deadlines = [call.deadline for call in calls]
+    if None in deadlines:
+        return None
+    return max(deadlines)
+
+
+def _time_left(deadline):
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.)
+
+
+class BaseBatcher:
+    '''Grouping, merging and splitting shared by the async and threaded batchers'''
+
+    def __init__(self, policy: BatchingPolicy):
+        self.policy = policy
+        self.call_count = 0
+        self.batch_count = 0
+        self.row_count = 0
+        # number of calls per batch => number of batches
+        self.batch_sizes = collections.Counter()
+
+    @property
+    def mean_batch_size(self) -> float:
+        '''Average number of calls per sent batch'''
+        if self.batch_count == 0:
+            return 0.
+        return self.call_count / self.batch_count
+
+    def batch_key(self, data, output_names, model_name, model_signature_name):
+        '''Key of the batch `data` can join, None if it can not be batched'''
+        n_rows = None
+        inputs_key = []
+        for name in sorted(data):
+            value = data[name]
+            if not isinstance(value, np.ndarray) or value.ndim == 0:
+                return None
+            if n_rows is None:
+                n_rows = value.shape[0]
+            elif value.shape[0] != n_rows:
+                return None
+            if name in self.policy.pad_values:
+                inputs_key.append((name, value.dtype, value.ndim))
+            else:
+                inputs_key.append((name, value.dtype, value.shape[1:]))
+        if n_rows is None:
+            return None
+        output_key = None if output_names is None else tuple(output_names)
+        return (model_name, model_signature_name, output_key, tuple(inputs_key))
+
+    @staticmethod
+    def n_rows(data) -> int:
+        return next(iter(data.values())).shape[0]
+
+    def merge(self, calls):
+        '''Concatenate the inputs of `calls` along axis 0'''
+        merged = {}
+        for name in calls[0].data:
+            values = [call.data[name] for call in calls]
+            if name in self.policy.pad_values:
+                merged[name] = self._pad_and_concatenate(values, self.policy.pad_values[name])
+            else:
+                merged[name] = np.concatenate(values, axis=0)
+        return merged
+
+    @staticmethod
+    def _pad_and_concatenate(values, pad_value):
+        trailing = np.max([value.shape[1:] for value in values], axis=0)
+        total_rows = sum(value.shape[0] for value in values)
+        merged = np.full((total_rows, *trailing), pad_value, dtype=values[0].dtype)
+        start = 0
+        for value in values:
+            stop = start + value.shape[0]
+            merged[(slice(start, stop), *(slice(0, size) for size in value.shape[1:]))] = value
+            start = stop
+        return merged
+
+    @staticmethod
+    def split(outputs, calls):
+        '''Slice `outputs` back into one dict of views per call'''
+        total_rows = _count_rows(calls)
+        for name, value in outputs.items():
+            if value.ndim == 0 or value.shape[0] != total_rows:
+                raise ValueError(
+                    f"Output {name!r} of shape {value.shape} can not be split "
+                    f"into a batch of {total_rows} rows"
+                )
+        results = []
+        start = 0
+        for call in calls:
+            stop = start + call.n_rows
+            results.append({name: value[start:stop] for name, value in outputs.items()})
+            start = stop
+        return results
+
+    def _record(self, calls):
+        self.batch_count += 1
+        self.call_count += len(calls)
+        self.row_count += _count_rows(calls)
+        self.batch_sizes[len(calls)] += 1
+
+
+class AsyncBatcher(BaseBatcher):
+    '''Coalesces concurrent `Client.async_predict` calls
+
+    Args:
+        send: coroutine function (data, output_names, model_name, model_signature_name,
+            deadline=) returning the decoded outputs of one request
+        policy: a BatchingPolicy
+        loop: asyncio event loop
+    '''
+
+    def __init__(self, send, policy: BatchingPolicy, loop: asyncio.AbstractEventLoop):
+        super().__init__(policy)
+        self._send = send
+        self._loop = loop
+        self._pending = {}
+        self._timers = {}
+
+    async def predict(self, data, output_names, model_name, model_signature_name, deadline=None):
+        '''Outputs of `data`, sent in a batch with the calls it can join
+
+        Raises asyncio.TimeoutError if `deadline` (of time.monotonic()) passes first.
+        '''
+        key = self.batch_key(data, output_names, model_name, model_signature_name)
+        if key is None:
+            return await self._send(
+                data, output_names, model_name, model_signature_name, deadline=deadline)
+
+        call = _PendingCall(data, self.n_rows(data), self._loop.create_future(), deadline)
+        pending = self._pending.get(key)
+        if pending and _count_rows(pending) + call.n_rows > self.policy.max_batch_size:
+            self._flush(key)
+            pending = None
+
+        if not pending:
+            self._pending[key] = [call]
+            self._timers[key] = self._loop.call_later(
+                self.policy.max_wait_seconds, self._flush, key)
+        else:
+            pending.append(call)
+
+        if _count_rows(self._pending[key]) >= self.policy.max_batch_size:
+            self._flush(key)
+
+        # a cancelled (or timed out) caller is dropped from its batch, the batch itself goes on
+        return await asyncio.wait_for(call.future, _time_left(deadline))
+
+    def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        calls = [call for call in self._pending.pop(key, []) if not call.future.done()]
+        if calls:
+            self._record(calls)
+            asyncio.ensure_future(self._run_batch(key, calls), loop=self._loop)
+
+    async def _run_batch(self, key, calls):
+        model_name, model_signature_name, output_names, _ = key
+        try:
+            outputs = await self._send(
+                self.merge(calls),
+                None if output_names is None else list(output_names),
+                model_name,
+                model_signature_name,
+                deadline=_batch_deadline(calls),
+            )
+            results = self.split(outputs, calls)
+        except asyncio.CancelledError:
+            for call in calls:
+                call.future.cancel()
+            raise
+        except Exception as e:
+            for call in calls:
+                if not call.future.done():
+                    call.future.set_exception(e)
+            return
+        for call, result in zip(calls, results):
+            if not call.future.done():
+                call.future.set_result(result)
+
+
+class ThreadBatcher(BaseBatcher):
+    '''Coalesces `Client.predict` calls made concurrently from several threads
+
+    A daemon dispatcher thread flushes batches when they are full or when
+    `max_wait_seconds` has passed, and sends them from a thread pool while the
+    calling threads block on their share of the outputs.
+
+    Args:
+        send: function (data, output_names, model_name, model_signature_name, deadline=)
+            returning the decoded outputs of one request
+        policy: a BatchingPolicy
+    '''
+
+    def __init__(self, send, policy: BatchingPolicy):
+        super().__init__(policy)
+        self._send = send
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._deadlines = {}
+        self._executor = futures.ThreadPoolExecutor(max_workers=policy.max_concurrent_batches)
+        self._dispatcher = None
+        self._closed = False
+
+    def predict(self, data, output_names, model_name, model_signature_name, deadline=None):
+        '''Outputs of `data`, sent in a batch with the calls it can join
+
+        Raises concurrent.futures.TimeoutError if `deadline` (of time.monotonic()) passes first.
+        '''
+        key = self.batch_key(data, output_names, model_name, model_signature_name)
+        if key is None:
+            return self._send(
+                data, output_names, model_name, model_signature_name, deadline=deadline)
+
+        call = _PendingCall(data, self.n_rows(data), futures.Future(), deadline)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("ThreadBatcher is closed")
+            self._start_dispatcher()
+            pending = self._pending.get(key)
+            if pending and _count_rows(pending) + call.n_rows > self.policy.max_batch_size:
+                self._flush(key)
+                pending = None
+
+            if not pending:
+                self._pending[key] = [call]
+                self._deadlines[key] = time.monotonic() + self.policy.max_wait_seconds
+                self._cond.notify()
+            else:
+                pending.append(call)
+
+            if _count_rows(self._pending[key]) >= self.policy.max_batch_size:
+                self._flush(key)
+
+        try:
+            return call.future.result(timeout=_time_left(deadline))
+        except futures.TimeoutError:
+            # dropped from its batch if it is not sent yet
+            call.future.cancel()
+            raise
+
+    def close(self):
+        '''Send what is pending and stop the dispatcher thread'''
+        with self._cond:
+            self._closed = True
+            for key in list(self._pending):
+                self._flush(key)
+            self._cond.notify()
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+
+    def _start_dispatcher(self):
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(
+                target=self._dispatch_loop,
+                name='serving_utils-batch-dispatcher',
+                daemon=True,
+            )
+            self._dispatcher.start()
+
+    def _dispatch_loop(self):
+        with self._cond:
+            while not self._closed:
+                now = time.monotonic()
+                for key, deadline in list(self._deadlines.items()):
+                    if deadline <= now:
+                        self._flush(key)
+                timeout = None
+                if self._deadlines:
+                    timeout = max(0., min(self._deadlines.values()) - now)
+                self._cond.wait(timeout)
+
+    def _flush(self, key):
+        # called with self._cond held
+        self._deadlines.pop(key, None)
+        calls = [
+            call for call in self._pending.pop(key, [])
+            if call.future.set_running_or_notify_cancel()
+        ]
+        if calls:
+            self._record(calls)
+            self._executor.submit(self._run_batch, key, calls)
+
+    def _run_batch(self, key, calls):
+        model_name, model_signature_name, output_names, _ = key
+        try:
+            outputs = self._send(
+                self.merge(calls),
+                None if output_names is None else list(output_names),
+                model_name,
+                model_signature_name,
+                deadline=_batch_deadline(calls),
+            )
+            results = self.split(outputs, calls)
+        except Exception as e:
+            for call in calls:
+                call.future.set_exception(e)
+            return
+        for call, result in zip(calls, results):
+            call.future.set_result(result)
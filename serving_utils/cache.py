@@ -0,0 +1,252 @@
+'''
+Response and row caches keyed on input content
+
+Keys are a hash of the model name, signature, output filter and of the
+dtype, shape and bytes of every input. Cached outputs are read-only arrays
+shared by every caller that hits the entry, each caller gets its own dict.
+
+The row cache keys every row (axis 0) of a batch on its own, for models
+whose outputs are row-independent, so that only missing rows are sent.
+'''
+import collections
+import hashlib
+import threading
+import time
+from typing import List, Mapping
+
+import numpy as np
+
+from .tensor_utils import _as_bytes, _to_ndarray
+
+
+def _update_with_array(digest, nparray):
+    # bytes, str and object arrays are all sent as DT_STRING
+    is_string = nparray.dtype.kind in ('S', 'U', 'O')
+    digest.update(b'string' if is_string else nparray.dtype.str.encode())
+    digest.update(repr(nparray.shape).encode())
+    if is_string:
+        for item in nparray.ravel().tolist():
+            item = _as_bytes(item)
+            digest.update(len(item).to_bytes(8, 'little'))
+            digest.update(item)
+    else:
+        digest.update(np.ascontiguousarray(nparray).data)
+
+
+def _request_digest(kind, output_names, model_name, model_signature_name):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((
+        kind,
+        model_name,
+        model_signature_name,
+        None if output_names is None else tuple(output_names),
+    )).encode())
+    return digest
+
+
+def make_cache_key(
+        data: Mapping,
+        output_names=None,
+        model_name: str = 'default',
+        model_signature_name: str = None,
+    ) -> bytes:
+    '''Hash of a predict call, equal for calls that would send the same request'''
+    digest = _request_digest('request', output_names, model_name, model_signature_name)
+    for name in sorted(data):
+        digest.update(name.encode('utf-8'))
+        _update_with_array(digest, _to_ndarray(data[name]))
+    return digest.digest()
+
+
+def batch_arrays(data: Mapping):
+    '''`data` as arrays sharing a non-empty axis 0, None if it has no common batch dimension'''
+    arrays = {name: _to_ndarray(value) for name, value in data.items()}
+    n_rows = {value.shape[0] if value.ndim else None for value in arrays.values()}
+    if len(n_rows) != 1 or not n_rows.pop():
+        return None
+    return arrays
+
+
+def make_row_cache_keys(
+        arrays: Mapping[str, np.ndarray],
+        output_names=None,
+        model_name: str = 'default',
+        model_signature_name: str = None,
+    ) -> List[bytes]:
+    '''One hash per row of `arrays` (from `batch_arrays`), in row order'''
+    prefix = _request_digest('row', output_names, model_name, model_signature_name)
+    names = sorted(arrays)
+    n_rows = len(arrays[names[0]])
+    keys = []
+    for row in range(n_rows):
+        digest = prefix.copy()
+        for name in names:
+            digest.update(name.encode('utf-8'))
+            _update_with_array(digest, arrays[name][row:row + 1])
+        keys.append(digest.digest())
+    return keys
+
+
+def _read_only_copy(outputs):
+    frozen = {}
+    for name, value in outputs.items():
+        value = np.array(value)
+        value.flags.writeable = False
+        frozen[name] = value
+    return frozen
+
+
+def _nbytes(outputs):
+    return sum(value.nbytes for value in outputs.values())
+
+
+class ResponseCache:
+
+    def __init__(
+            self,
+            max_entries: int = 1024,
+            max_bytes: int = 64 * 1024 * 1024,
+            ttl_seconds: float = None,
+        ):
+        """LRU cache of predict outputs
+
+        Args:
+            max_entries (int) : max number of cached responses, unbounded if None
+            max_bytes (int) : max total size of cached output arrays
+            ttl_seconds (float) : entries expire this long after being stored, never if None
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+
+        self._entries = collections.OrderedDict()  # key => (expires_at, nbytes, outputs)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.
+
+    def get(self, key: bytes):
+        '''Cached outputs of `key`, None on a miss'''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not None and entry[0] <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[2])
+
+    def put(self, key: bytes, outputs: Mapping[str, np.ndarray]):
+        '''Store read-only copies of `outputs`, returns them in a dict of the caller'''
+        outputs = _read_only_copy(outputs)
+        nbytes = _nbytes(outputs)
+        if nbytes > self.max_bytes:
+            return outputs
+        expires_at = None
+        if self.ttl_seconds is not None:
+            expires_at = time.monotonic() + self.ttl_seconds
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, nbytes, outputs)
+            self.nbytes += nbytes
+            while self._is_full():
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return dict(outputs)
+
+    def _is_full(self):
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            return True
+        return self.nbytes > self.max_bytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _remove(self, key):
+        _, nbytes, _ = self._entries.pop(key)
+        self.nbytes -= nbytes
+
+
+class RowCache(ResponseCache):
+
+    def __init__(
+            self,
+            max_bytes: int = 64 * 1024 * 1024,
+            max_entries: int = None,
+            ttl_seconds: float = None,
+        ):
+        """LRU cache of the outputs of single rows
+
+        Only for models whose outputs are row-independent (e.g. sentence encoders):
+        row i of every output must only depend on row i of the inputs.
+        Hits and misses are counted per row.
+
+        Args:
+            max_bytes (int) : max total size of cached output rows
+            max_entries (int) : max number of cached rows, unbounded if None
+            ttl_seconds (float) : entries expire this long after being stored, never if None
+        """
+        super().__init__(max_entries=max_entries, max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+
+    def get_rows(self, keys: List[bytes]) -> List[Mapping[str, np.ndarray]]:
+        '''Cached outputs of every row, None for the missing ones'''
+        return [self.get(key) for key in keys]
+
+    def put_rows(self, keys: List[bytes], outputs: Mapping[str, np.ndarray]):
+        '''Store row i of every output under keys[i]'''
+        for name, value in outputs.items():
+            if value.ndim == 0 or value.shape[0] != len(keys):
+                raise ValueError(
+                    f"Output {name!r} of shape {value.shape} can not be split "
+                    f"into {len(keys)} rows"
+                )
+        for row, key in enumerate(keys):
+            self.put(key, {name: value[row] for name, value in outputs.items()})
+
+
+def merge_rows(
+        cached_rows: List[Mapping[str, np.ndarray]],
+        fresh_outputs: Mapping[str, np.ndarray] = None,
+        fresh_positions: Mapping[int, int] = None,
+    ) -> Mapping[str, np.ndarray]:
+    '''Stitch cached and fresh rows back into batch outputs, in row order
+
+    Row i is cached_rows[i], or row fresh_positions[i] of `fresh_outputs` if
+    cached_rows[i] is None.
+    '''
+    if fresh_outputs is not None:
+        template = {name: value[0] for name, value in fresh_outputs.items()}
+    else:
+        template = cached_rows[0]
+    merged = {
+        name: np.empty((len(cached_rows), *value.shape), dtype=value.dtype)
+        for name, value in template.items()
+    }
+    for row, outputs in enumerate(cached_rows):
+        if outputs is None:
+            continue
+        for name, value in outputs.items():
+            merged[name][row] = value
+    if fresh_positions:
+        rows = list(fresh_positions)
+        positions = [fresh_positions[row] for row in rows]
+        for name, value in fresh_outputs.items():
+            merged[name][rows] = value[positions]
+    return merged
@@ -0,0 +1,199 @@
+'''
+Circuit breakers of the connections of a Client
+
+A connection failing many calls in a row, or too large a fraction of its
+recent calls, is ejected: its balancer skips it for a backoff period growing
+with each ejection. Then one call at a time probes it (half-open) until a
+success closes the circuit, a failure ejects it again. A cap on the fraction
+of ejected connections keeps the pool from emptying.
+'''
+import collections
+import math
+import time
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreakerPolicy:
+
+    def __init__(
+            self,
+            consecutive_failures: int = 5,
+            error_rate: float = 0.5,
+            window_size: int = 20,
+            min_calls: int = 10,
+            base_ejection_seconds: float = 1.,
+            max_ejection_seconds: float = 60.,
+            max_ejection_fraction: float = 0.5,
+        ):
+        """When connections are ejected and for how long
+
+        Args:
+            consecutive_failures (int) : failed calls in a row opening the circuit
+            error_rate (float) : fraction of failed calls in the window opening the circuit
+            window_size (int) : last calls of a connection the error rate is computed on
+            min_calls (int) : calls in the window before the error rate is considered
+            base_ejection_seconds (float) : first ejection period, doubled at each
+                ejection until a window of successful calls
+            max_ejection_seconds (float) : longest ejection period
+            max_ejection_fraction (float) : max fraction of the connections ejected at
+                once, at least one can be unless it is the last one
+        """
+        if not 0 < error_rate <= 1:
+            raise ValueError("error_rate should be in (0, 1]")
+        if not 0 <= max_ejection_fraction <= 1:
+            raise ValueError("max_ejection_fraction should be in [0, 1]")
+        self.consecutive_failures = consecutive_failures
+        self.error_rate = error_rate
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.base_ejection_seconds = base_ejection_seconds
+        self.max_ejection_seconds = max_ejection_seconds
+        self.max_ejection_fraction = max_ejection_fraction
+
+
+class CircuitBreaker:
+    '''State of the circuit of one connection'''
+
+    def __init__(self, policy: CircuitBreakerPolicy):
+        self.policy = policy
+        self.state = CLOSED
+        self.open_until = None
+        self.n_ejections = 0  # since the last full window of successes
+        self.probing = False  # a half-open call is in flight
+        self._outcomes = collections.deque(maxlen=policy.window_size)  # True for errors
+        self._n_errors = 0
+        self._consecutive_failures = 0
+        self._consecutive_successes = 0
+
+    def should_open(self) -> bool:
+        policy = self.policy
+        if self._consecutive_failures >= policy.consecutive_failures:
+            return True
+        n_calls = len(self._outcomes)
+        return n_calls >= policy.min_calls and self._n_errors >= policy.error_rate * n_calls
+
+    def open(self, now):
+        policy = self.policy
+        ejection_seconds = min(
+            policy.base_ejection_seconds * 2 ** self.n_ejections,
+            policy.max_ejection_seconds,
+        )
+        self.state = OPEN
+        self.open_until = now + ejection_seconds
+        self.n_ejections += 1
+        self.probing = False
+
+    def half_open(self):
+        self.state = HALF_OPEN
+        self.open_until = None
+
+    def close(self):
+        self.state = CLOSED
+        self._outcomes.clear()
+        self._n_errors = 0
+        self._consecutive_failures = 0
+        self._consecutive_successes = 0
+
+    def record(self, error: bool):
+        if len(self._outcomes) == self._outcomes.maxlen and self._outcomes[0]:
+            self._n_errors -= 1
+        self._outcomes.append(error)
+        if error:
+            self._n_errors += 1
+            self._consecutive_failures += 1
+            self._consecutive_successes = 0
+        else:
+            self._consecutive_failures = 0
+            self._consecutive_successes += 1
+            if self._consecutive_successes >= self.policy.window_size:
+                self.n_ejections = 0
+
+
+class OutlierDetector:
+
+    def __init__(self, policy: CircuitBreakerPolicy = None):
+        """Circuit breakers of the connections of a balancer
+
+        Not thread-safe, the balancer calls it under its lock.
+        """
+        if policy is None:
+            policy = CircuitBreakerPolicy()
+        self.policy = policy
+        self.ejection_count = 0
+        self._clock = time.monotonic
+        self._breakers = {}  # key => CircuitBreaker
+        self._unavailable = set()  # open keys and half-open keys with a probe in flight
+        self._next_half_open = math.inf
+
+    def state(self, k) -> str:
+        breaker = self._breakers.get(k)
+        return CLOSED if breaker is None else breaker.state
+
+    def _n_ejected(self):
+        return sum(1 for breaker in self._breakers.values() if breaker.state != CLOSED)
+
+    def _can_eject(self, n_keys):
+        allowed = max(math.floor(self.policy.max_ejection_fraction * n_keys), 1)
+        return self._n_ejected() < min(allowed, n_keys - 1)
+
+    def _open(self, k, breaker, now):
+        breaker.open(now)
+        self._unavailable.add(k)
+        self._next_half_open = min(self._next_half_open, breaker.open_until)
+        self.ejection_count += 1
+
+    def unavailable(self):
+        '''Keys the balancer should skip'''
+        now = self._clock()
+        if now >= self._next_half_open:
+            self._next_half_open = math.inf
+            for k, breaker in self._breakers.items():
+                if breaker.state != OPEN:
+                    continue
+                if now >= breaker.open_until:
+                    breaker.half_open()
+                    self._unavailable.discard(k)
+                else:
+                    self._next_half_open = min(self._next_half_open, breaker.open_until)
+        return self._unavailable
+
+    def started(self, k):
+        breaker = self._breakers.get(k)
+        if breaker is not None and breaker.state == HALF_OPEN:
+            breaker.probing = True
+            self._unavailable.add(k)
+
+    def finished(self, k, error, n_keys):
+        '''End of a call on `k`, `error` is None if it was cancelled'''
+        breaker = self._breakers.get(k)
+        if breaker is None:
+            if error is None:
+                return
+            breaker = self._breakers[k] = CircuitBreaker(self.policy)
+
+        if breaker.state == HALF_OPEN:
+            if not breaker.probing:
+                return  # a call started before the ejection
+            breaker.probing = False
+            self._unavailable.discard(k)
+            if error is None:
+                return
+            if error:
+                self._open(k, breaker, self._clock())
+            else:
+                breaker.close()
+            return
+        if breaker.state == OPEN or error is None:
+            return
+
+        breaker.record(error)
+        if error and breaker.should_open() and self._can_eject(n_keys):
+            self._open(k, breaker, self._clock())
+
+    def forget(self, k):
+        self._breakers.pop(k, None)
+        self._unavailable.discard(k)
@@ -1,7 +1,12 @@
+from concurrent import futures
+import contextlib
 from functools import partial
 import logging
+import queue
 import socket
-from typing import List, Union, Mapping
+import threading
+import time
+from typing import AsyncIterable, Dict, Iterable, Iterator, List, Union, Mapping
 
 import asyncio
 from collections import namedtuple
@@ -9,13 +14,34 @@ from collections import namedtuple
 import grpc
 from grpclib.client import Channel
 from grpclib.exceptions import GRPCError
-from grpclib.const import Status
-try:
-    import tensorflow.compat.v1 as tf
-except ImportError:
-    import tensorflow as tf
+import numpy as np
 
-from .round_robin_map import RoundRobinMap
+from .balancer import Balancer, EmptyPool, PowerOfTwoChoicesBalancer
+from .batching import AsyncBatcher, BatchingPolicy, ThreadBatcher
+from .circuit_breaker import CircuitBreakerPolicy, OutlierDetector
+from .health import HealthChecker, HealthCheckPolicy
+from .hedging import Hedger, HedgingPolicy
+from .cache import (
+    ResponseCache,
+    RowCache,
+    batch_arrays,
+    make_cache_key,
+    make_row_cache_keys,
+    merge_rows,
+)
+from .pipeline import PredictResult, bounded_map, async_bounded_map, async_stream_map
+from .refresh import AsyncRefresher, ThreadRefresher
+from .resolver import DnsResolver, Resolver
+from .retry import Retrier, RetryPolicy, RetryState, status_name
+from .single_flight import AsyncSingleFlight, SingleFlight
+from .sharding import DEFAULT_MAX_SHARD_BYTES, OutputGatherer, shard_batch
+from .request_plan import (
+    RequestPlan,
+    SerializedPredictionServiceStub,
+    AsyncSerializedPredictionServiceStub,
+)
+from .tensor_utils import make_tensor_proto, make_ndarray
+from .warmup import WarmupReport, WarmupRequest, async_warmup_connection, warmup_connection
 
 from .protos import predict_pb2, prediction_service_pb2_grpc, list_models_pb2, list_models_pb2_grpc
 from .protos import prediction_service_grpc
@@ -40,12 +66,83 @@ ORIGINAL_DATA_TYPE = List[PredictInput]
 NEW_DATA_TYPE = Mapping[str, 'np.ndarray']
 
 
+def _as_input_mapping(data):
+    '''`data` as a name => value dict, None if it is neither a mapping nor a list of inputs'''
+    if isinstance(data, Mapping):
+        return data
+    if isinstance(data, list) and all(isinstance(datum, PredictInput) for datum in data):
+        return {datum.name: datum.value for datum in data}
+    return None
+
+
+# errors of the request rather than of the server answering it
+_REQUEST_ERROR_CODES = {
+    'CANCELLED',
+    'INVALID_ARGUMENT',
+    'NOT_FOUND',
+    'ALREADY_EXISTS',
+    'PERMISSION_DENIED',
+    'FAILED_PRECONDITION',
+    'OUT_OF_RANGE',
+    'UNAUTHENTICATED',
+}
+
+
+def _is_connection_error(exception) -> bool:
+    '''Whether the exception of a call counts against the health of its connection'''
+    return status_name(exception) not in _REQUEST_ERROR_CODES
+
+
+def _is_model_not_found(exception) -> bool:
+    '''Whether the server has no such model, the error is raised as is without retrying'''
+    if status_name(exception) != 'NOT_FOUND':
+        return False
+    if isinstance(exception, GRPCError):
+        return "Model" in (exception.message or '')
+    return "Model" in (exception.details() or '')
+
+
+class SubChannel:
+    '''One channel of a Connection, its stubs and its calls in flight'''
+
+    def __init__(self, channel, stub, serialized_stub):
+        self.channel = channel
+        self.stub = stub
+        self.serialized_stub = serialized_stub
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def get_stub(self, is_serialized: bool = False):
+        return self.serialized_stub if is_serialized else self.stub
+
+    @contextlib.contextmanager
+    def track(self):
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def track_future(self, future):
+        with self._lock:
+            self.in_flight += 1
+
+        def on_done(_):
+            with self._lock:
+                self.in_flight -= 1
+
+        future.add_done_callback(on_done)
+        return future
+
+
 class Connection:
     '''
     An active connection to a model serving GRPC server
     '''
 
-    TIMEOUT_SECONDS = 5
+    MODES = (None, 'sync', 'async', 'lazy')
 
     def __init__(
             self,
@@ -54,35 +151,124 @@ class Connection:
             pem: str = None,
             channel_options: dict = None,
             loop: asyncio.AbstractEventLoop = None,
+            mode: str = None,
+            n_channels: int = 1,
         ):
+        """Channels and stubs to `addr`:`port`
 
+        Args:
+            mode (str) : 'sync' or 'async' to only make the channel of predict
+                (grpcio) or async_predict (grpclib), 'lazy' to make each one on first use,
+                None to make both right away
+            n_channels (int) : channels (HTTP/2 connections) of each flavor, calls go
+                to the one with the fewest calls in flight
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"mode should be one of {self.MODES}")
+        if n_channels < 1:
+            raise ValueError("n_channels should be positive")
         self.addr = addr
         self.port = port
-
+        self.mode = mode
+        self.n_channels = n_channels
+        self._pem = pem
         if channel_options is None:
             channel_options = {}
-        if pem is None:
-            make_sync_channel = partial(grpc.insecure_channel, options=channel_options)
+        self._channel_options = channel_options
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._loop = loop
+
+        self._sync = None  # SubChannels
+        self._async = None
+        self._lock = threading.Lock()
+        if mode in (None, 'sync'):
+            self._sync_channels()
+        if mode in (None, 'async'):
+            self._async_channels()
+
+    def _sync_channels(self):
+        if self._sync is None:
+            if self.mode == 'async':
+                raise ValueError("no sync channel in a Connection of mode 'async'")
+            with self._lock:
+                if self._sync is None:
+                    self._sync = [self._make_sync_channel() for _ in range(self.n_channels)]
+        return self._sync
+
+    def _make_sync_channel(self):
+        addr, port = self.addr, self.port
+        target = f"[{addr}]:{port}" if ':' in addr else f"{addr}:{port}"
+        options = self._channel_options
+        if self.n_channels > 1:
+            # grpcio shares the TCP connections of channels with the same target
+            # and arguments, unless each channel has its own pool of them
+            if isinstance(options, Mapping):
+                options = list(options.items())
+            options = list(options) + [('grpc.use_local_subchannel_pool', 1)]
+        if self._pem is None:
+            channel = grpc.insecure_channel(target, options=options)
         else:
-            creds = grpc.ssl_channel_credentials(pem)
-            make_sync_channel = partial(
-                grpc.secure_channel,
+            creds = grpc.ssl_channel_credentials(self._pem)
+            channel = grpc.secure_channel(
+                target,
                 credentials=creds,
-                options=channel_options,
+                options=options,
             )
+        return SubChannel(
+            channel,
+            prediction_service_pb2_grpc.PredictionServiceStub(channel),
+            SerializedPredictionServiceStub(channel),
+        )
 
-        if loop is None:
-            loop = asyncio.get_event_loop()
+    def _async_channels(self):
+        if self._async is None:
+            if self.mode == 'sync':
+                raise ValueError("no async channel in a Connection of mode 'sync'")
+            channels = []
+            for _ in range(self.n_channels):
+                channel = Channel(self.addr, self.port, loop=self._loop)
+                channels.append(SubChannel(
+                    channel,
+                    prediction_service_grpc.PredictionServiceStub(channel),
+                    AsyncSerializedPredictionServiceStub(channel),
+                ))
+            self._async = channels
+        return self._async
+
+    def channels(self, is_async: bool = False) -> List[SubChannel]:
+        return self._async_channels() if is_async else self._sync_channels()
+
+    def pick_channel(self, is_async: bool = False) -> SubChannel:
+        '''The channel of the flavor with the fewest calls in flight'''
+        channels = self.channels(is_async)
+        if len(channels) == 1:
+            return channels[0]
+        return min(channels, key=lambda channel: channel.in_flight)
 
-        self.sync_channel = make_sync_channel(f"{addr}:{port}")
-        self.async_channel = Channel(addr, port, loop=loop)
+    @property
+    def sync_channel(self):
+        return self._sync_channels()[0].channel
 
-        self.sync_stub = prediction_service_pb2_grpc.PredictionServiceStub(self.sync_channel)
-        self.async_stub = prediction_service_grpc.PredictionServiceStub(self.async_channel)
+    @property
+    def sync_stub(self):
+        return self._sync_channels()[0].stub
 
+    @property
+    def sync_serialized_stub(self):
+        return self._sync_channels()[0].serialized_stub
 
-class EmptyPool(Exception):
-    pass
+    @property
+    def async_channel(self):
+        return self._async_channels()[0].channel
+
+    @property
+    def async_stub(self):
+        return self._async_channels()[0].stub
+
+    @property
+    def async_serialized_stub(self):
+        return self._async_channels()[0].serialized_stub
 
 
 class RetryFailed(Exception):
@@ -111,19 +297,73 @@ class Client:
             channel_options: dict = None,
             loop: asyncio.AbstractEventLoop = None,
             logger: logging.Logger = None,
+            batching: BatchingPolicy = None,
+            cache: ResponseCache = None,
+            row_cache: RowCache = None,
+            single_flight: bool = False,
+            hedging: HedgingPolicy = None,
+            balancer: Balancer = None,
+            dns_refresh_seconds: float = None,
+            resolver: Resolver = None,
+            channel_mode: str = None,
+            channels_per_address: int = 1,
+            circuit_breaker: CircuitBreakerPolicy = None,
+            retry: RetryPolicy = None,
+            timeout_seconds: float = None,
+            health_check: HealthCheckPolicy = None,
         ):
         """Client to tensorflow_model_server or pyserving
 
-        Includes round-robin load balancing. Separate GRPC connections (channels)
-        will be made to each IP address returned by the name resolution request for `host`.
+        Includes load balancing. Separate GRPC connections (channels) will be made
+        to each IP address returned by the name resolution request for `host`.
 
         Args:
-            host (str) : hostname of your serving
+            host (str) : hostname of your serving, unused with a `resolver`
             port (int) : port of your serving
-            n_trys (int) : number of times to try predict/async_predict before giving up
+            n_trys (int) : number of times to try predict/async_predict before giving up,
+                unless `retry` is given
             pem: credentials of grpc
             channel_options: An optional list of key-value pairs (channel args in gRPC runtime)
             loop: asyncio event loop
+            batching: if given, concurrent predict (from several threads) and async_predict
+                calls are merged into batched requests according to this BatchingPolicy
+            cache: if given, outputs of predict/async_predict are cached in this
+                ResponseCache, keyed on the content of the inputs
+            row_cache: if given, each row (axis 0) of a batch is looked up in this
+                RowCache and only the missing rows are sent, in one smaller request.
+                Only for models whose outputs are row-independent.
+            single_flight (bool) : if True, concurrent predict/async_predict calls with
+                identical inputs and timeouts share one in-flight request and its outputs
+            hedging: if given, a request still unanswered after the delay of this
+                HedgingPolicy is also sent to another connection, the first response wins
+            balancer: an empty Balancer picking the connection of each request,
+                defaults to PowerOfTwoChoicesBalancer (RoundRobinBalancer for the former behavior)
+            dns_refresh_seconds (float) : if given, `host` is resolved in the background
+                (a thread for predict, a task of `loop` for async_predict) every this many
+                seconds, and right after a connection fails, instead of before every
+                request and retry. Only resolvers knowing the TTL of their answer
+                (SrvResolver) refresh sooner when it is shorter, `host` and DnsResolver
+                go through the system resolver, which does not tell it.
+            resolver: if given, the endpoints (addresses, ports and weights) come from this
+                Resolver (StaticResolver, DnsResolver, SrvResolver, FileResolver) instead of
+                the IPv4 addresses of `host`, the weights are passed on to the balancer
+            channel_mode (str) : 'sync' for a client only calling predict, 'async' for
+                one only calling async_predict, so that each connection has one channel
+                instead of two, or 'lazy' to make each channel on first use
+            channels_per_address (int) : HTTP/2 connections to each address, calls to an
+                address go to the one with the fewest calls in flight. More than one helps
+                with few replicas, large tensors or the stream limit of a connection.
+            circuit_breaker: if given, a connection failing calls as set by this
+                CircuitBreakerPolicy is skipped for a growing period, then probed
+                by one call at a time until it succeeds
+            retry: which failed calls are retried, with which backoff and budget, defaults
+                to a RetryPolicy of `n_trys` attempts. Retries avoid the connections
+                already tried by the call when there are others.
+            timeout_seconds (float) : default timeout of predict/async_predict calls,
+                retries included, None for none
+            health_check: if given, every connection is probed in the background (a
+                thread, or a task of `loop` started by async_predict with channel_mode
+                'async') as set by this HealthCheckPolicy, unhealthy ones are skipped
         """
         self._pem = pem
         if channel_options is None:
@@ -135,37 +375,274 @@ class Client:
 
         self._host = host
         self._port = port
+        if channel_mode not in Connection.MODES:
+            raise ValueError(f"channel_mode should be one of {Connection.MODES}")
+        self._channel_mode = channel_mode
+        if channels_per_address < 1:
+            raise ValueError("channels_per_address should be positive")
+        self._channels_per_address = channels_per_address
+        if resolver is None:
+            resolver = DnsResolver(host, family=socket.AF_INET)
+        self.resolver = resolver
 
-        self._pool = RoundRobinMap()
+        if balancer is None:
+            balancer = PowerOfTwoChoicesBalancer()
+        balancer.error_filter = _is_connection_error
+        if circuit_breaker is not None:
+            balancer.outlier_detector = OutlierDetector(circuit_breaker)
+        self._pool = balancer
         self._loop = loop
+        self._refresh_seconds = dns_refresh_seconds
+        self._refresher = None
+        self._async_refresher = None
+        self._refresher_lock = threading.Lock()
+        self._update_lock = threading.Lock()  # refreshes may run in a thread and in the loop
+        # (PredictRequests, timeout) of the last warmup and awarmup, for connections added later
+        self._warmup = None
+        self._async_warmup = None
+        self.warmup_reports = {}  # address => last WarmupReport
 
         self._setup_connections()
-        self.n_trys = n_trys
+        if retry is None:
+            retry = RetryPolicy(max_attempts=n_trys)
+        self.retrier = Retrier(retry)
+        self.n_trys = retry.max_attempts
+        self.timeout_seconds = timeout_seconds
 
         self.logger = logger or LOGGER
 
+        self.async_batcher = None
+        self.sync_batcher = None
+        if batching is not None:
+            self.async_batcher = AsyncBatcher(self._async_predict, batching, loop)
+            self.sync_batcher = ThreadBatcher(self._predict, batching)
+        self.cache = cache
+        self.row_cache = row_cache
+
+        self.single_flight = None
+        self.async_single_flight = None
+        if single_flight:
+            self.single_flight = SingleFlight()
+            self.async_single_flight = AsyncSingleFlight(loop)
+        self.hedger = None if hedging is None else Hedger(hedging)
+
+        self.health_checker = None
+        self._health_refresher = None
+        if health_check is not None:
+            request = None
+            if health_check.request is not None:
+                request = self._warmup_requests([health_check.request])[0]
+            self.health_checker = HealthChecker(health_check, self._pool, request, self.logger)
+            if channel_mode != 'async':
+                self._health_refresher = ThreadRefresher(
+                    self.health_checker.check,
+                    health_check.interval_seconds,
+                    health_check.interval_seconds,
+                    logger=self.logger,
+                    name='serving-utils-health',
+                )
+                self._health_refresher.start()
+
     def _setup_connections(self):
-        host = self._host
+        '''Resolve the endpoints and update the pool, returns the TTL of the answer or None'''
+        endpoints, ttl = self.resolver.resolve()
+        self._update_pool(endpoints)
+        return ttl
+
+    async def _async_setup_connections(self):
+        '''`_setup_connections` without blocking the event loop'''
+        endpoints, ttl = await self.resolver.async_resolve(self._loop)
+        self._update_pool(endpoints)
+        return ttl
 
-        _, _, current_addrs = socket.gethostbyname_ex(host)
-        current_addrs = set(current_addrs)
-        original_addrs = set(self._pool.keys())
-        if original_addrs == current_addrs:
+    def _update_pool(self, endpoints):
+        current = {endpoint.key: endpoint for endpoint in endpoints}
+        with self._update_lock:
+            original_addrs = set(self._pool.keys())
+            current_addrs = set(current)
+
+            missing = original_addrs - current_addrs
+            for address in missing:
+                del self._pool[address]
+                self.warmup_reports.pop(address, None)
+
+            new_addrs = current_addrs - original_addrs
+            for address in new_addrs:
+                endpoint = current[address]
+                self._pool[address] = Connection(
+                    endpoint.address,
+                    self._port if endpoint.port is None else endpoint.port,
+                    self._pem,
+                    self._channel_options,
+                    self._loop,
+                    self._channel_mode,
+                    self._channels_per_address,
+                )
+
+            for address, endpoint in current.items():
+                self._pool.set_weight(address, endpoint.weight)
+        if new_addrs:
+            self._warmup_added(list(new_addrs))
+
+    def _refresh_connections(self):
+        '''Resolve `host` before a request, unless it is done in the background'''
+        if self._refresh_seconds is None:
+            self._setup_connections()
             return
+        if self._refresher is None:
+            with self._refresher_lock:
+                if self._refresher is None:
+                    refresher = ThreadRefresher(
+                        self._setup_connections, self._refresh_seconds, logger=self.logger)
+                    refresher.start()
+                    self._refresher = refresher
+
+    def _async_refresh_connections(self):
+        if self._refresh_seconds is None:
+            self._setup_connections()
+            return
+        if self._async_refresher is None:
+            self._async_refresher = AsyncRefresher(
+                self._async_setup_connections,
+                self._refresh_seconds,
+                loop=self._loop,
+                logger=self.logger,
+            )
+            self._async_refresher.start()
+
+    def _start_async_health_checks(self):
+        if self.health_checker is not None and self._health_refresher is None:
+            interval_seconds = self.health_checker.policy.interval_seconds
+            self._health_refresher = AsyncRefresher(
+                self.health_checker.async_check,
+                interval_seconds,
+                interval_seconds,
+                loop=self._loop,
+                logger=self.logger,
+            )
+            self._health_refresher.start()
+
+    def _connection_failed(self, refresher):
+        '''Resolve `host` again after a failed call, in the background if enabled'''
+        if refresher is None:
+            self._setup_connections()
+        else:
+            refresher.trigger()
+
+    def warmup(
+            self,
+            requests: Iterable[WarmupRequest] = (),
+            timeout_seconds: float = 10.,
+        ) -> Dict[str, WarmupReport]:
+        """Connect every connection of the pool in parallel and send it the warm-up `requests`
 
-        missing = original_addrs - current_addrs
-        for address in missing:
-            del self._pool[address]
-
-        new_addrs = current_addrs - original_addrs
-        for address in new_addrs:
-            self._pool[address] = Connection(
-                address,
-                self._port,
-                self._pem,
-                self._channel_options,
-                self._loop,
+        Connections added to the pool later on are warmed up the same way in the
+        background. Errors do not raise, they are reported (and logged).
+
+        Args:
+            requests : WarmupRequest sent in turn to each connection once connected,
+                e.g. one per model and signature
+            timeout_seconds (float) : timeout of the connection and of each request
+
+        Returns:
+            address => WarmupReport(address, connect_seconds, request_seconds, error)
+        """
+        self._warmup = (self._warmup_requests(requests), timeout_seconds)
+        return self._warmup_addresses()
+
+    async def awarmup(
+            self,
+            requests: Iterable[WarmupRequest] = (),
+            timeout_seconds: float = 10.,
+        ) -> Dict[str, WarmupReport]:
+        """Async twin of `warmup`, for the channels of async_predict"""
+        self._async_warmup = (self._warmup_requests(requests), timeout_seconds)
+        return await self._async_warmup_addresses()
+
+    def _warmup_requests(self, requests):
+        return [
+            self._predict_request(
+                data=request.data,
+                model_name=request.model_name,
+                output_names=request.output_names,
+                model_signature_name=request.model_signature_name,
             )
+            for request in requests
+        ]
+
+    def _record_warmup(self, reports):
+        for report in reports:
+            if report.address not in self._pool:
+                continue
+            self.warmup_reports[report.address] = report
+            if report.error is not None:
+                self.logger.warning(
+                    f"serving_utils.Client -- warm-up of {report.address} failed: "
+                    f"{report.error!r}"
+                )
+        return {report.address: report for report in reports}
+
+    def _connections(self, addresses=None):
+        '''(address, connection) of `addresses` still in the pool, all of them if None'''
+        conns = self._pool.snapshot()
+        if addresses is None:
+            return conns
+        addresses = set(addresses)
+        return [(address, conn) for address, conn in conns if address in addresses]
+
+    def _warmup_addresses(self, addresses=None):
+        requests, timeout_seconds = self._warmup
+        conns = self._connections(addresses)
+        if not conns:
+            return {}
+        with futures.ThreadPoolExecutor(max_workers=len(conns)) as executor:
+            reports = list(executor.map(
+                lambda item: warmup_connection(*item, requests, timeout_seconds), conns))
+        return self._record_warmup(reports)
+
+    async def _async_warmup_addresses(self, addresses=None):
+        requests, timeout_seconds = self._async_warmup
+        reports = await asyncio.gather(*[
+            async_warmup_connection(address, conn, requests, timeout_seconds)
+            for address, conn in self._connections(addresses)
+        ])
+        return self._record_warmup(reports)
+
+    def _warmup_added(self, addresses):
+        '''Warm up in the background the connections added after warmup/awarmup'''
+        if self._warmup is not None:
+            threading.Thread(
+                target=self._warmup_addresses,
+                args=(addresses,),
+                name='serving-utils-warmup',
+                daemon=True,
+            ).start()
+        if self._async_warmup is not None:
+            asyncio.run_coroutine_threadsafe(
+                self._async_warmup_addresses(addresses), self._loop)
+
+    def close(self):
+        '''Stop the background refresh, health checks and batch dispatcher of the client'''
+        for refresher in (self._refresher, self._async_refresher, self._health_refresher):
+            if refresher is not None:
+                refresher.close()
+        if self.sync_batcher is not None:
+            self.sync_batcher.close()
+
+    def _deadline(self, timeout=None):
+        '''time.monotonic() at which a call of `timeout` seconds (or the default) ends'''
+        if timeout is None:
+            timeout = self.timeout_seconds
+        if timeout is None:
+            return None
+        return time.monotonic() + timeout
+
+    @staticmethod
+    def _time_left(deadline):
+        '''Timeout of an attempt of a call ending at `deadline`'''
+        if deadline is None:
+            return None
+        return max(deadline - time.monotonic(), 0.)
 
     @staticmethod
     def _predict_request(
@@ -187,35 +664,146 @@ class Client:
             else:
                 name = datum
                 value = data[datum]
-            copy_message(tf.make_tensor_proto(value), req.inputs[name])
+            make_tensor_proto(value, req.inputs[name])
         if output_names is not None:
             for output_name in output_names:
                 req.output_filter.append(output_name)
         return req
 
     @staticmethod
-    def parse_predict_response(response):
+    def compile_request(
+            model_name: str = 'default',
+            output_names: List[str] = None,
+            model_signature_name: str = None,
+        ) -> RequestPlan:
+        """Compile a reusable request plan
+
+        The plan serializes `model_spec` and `output_filter` once, pass it as
+        `plan` to `predict`/`async_predict` to only encode the inputs per call.
+        """
+        return RequestPlan(
+            model_name=model_name,
+            output_names=output_names,
+            model_signature_name=model_signature_name,
+        )
+
+    def _build_request(self, data, output_names, model_name, model_signature_name, plan):
+        if plan is not None:
+            return plan.serialize(data)
+        return self._predict_request(
+            data=data,
+            output_names=output_names,
+            model_name=model_name,
+            model_signature_name=model_signature_name,
+        )
+
+    def _request_key(self, data, output_names, model_name, model_signature_name, plan):
+        '''Content hash of the request, None if it is not needed or `data` can not be hashed'''
+        if self.cache is None and self.single_flight is None:
+            return None
+        inputs = _as_input_mapping(data)
+        if inputs is None:
+            return None
+        if plan is not None:
+            output_names = plan.output_names
+            model_name = plan.model_name
+            model_signature_name = plan.model_signature_name
+        return make_cache_key(inputs, output_names, model_name, model_signature_name)
+
+    def _lookup_rows(self, data, output_names, model_name, model_signature_name, plan):
+        '''(row keys, cached rows, inputs of the missing rows), None if data is not a batch'''
+        if self.row_cache is None:
+            return None
+        inputs = _as_input_mapping(data)
+        if inputs is None:
+            return None
+        arrays = batch_arrays(inputs)
+        if arrays is None:
+            return None
+        if plan is not None:
+            output_names = plan.output_names
+            model_name = plan.model_name
+            model_signature_name = plan.model_signature_name
+        keys = make_row_cache_keys(arrays, output_names, model_name, model_signature_name)
+        cached_rows = self.row_cache.get_rows(keys)
+
+        # identical missing rows are only sent once
+        missing = {}
+        for row, (key, outputs) in enumerate(zip(keys, cached_rows)):
+            if outputs is None:
+                missing.setdefault(key, row)
+        missing_inputs = None
+        if missing:
+            missing_rows = list(missing.values())
+            missing_inputs = {name: value[missing_rows] for name, value in arrays.items()}
+        return keys, cached_rows, missing_inputs
+
+    def _merge_rows(self, keys, cached_rows, fresh_outputs):
+        if fresh_outputs is None:
+            return merge_rows(cached_rows)
+        fresh_keys = []
+        positions = {}
+        fresh_positions = {}
+        for row, (key, outputs) in enumerate(zip(keys, cached_rows)):
+            if outputs is not None:
+                continue
+            if key not in positions:
+                positions[key] = len(fresh_keys)
+                fresh_keys.append(key)
+            fresh_positions[row] = positions[key]
+        self.row_cache.put_rows(fresh_keys, fresh_outputs)
+        return merge_rows(cached_rows, fresh_outputs, fresh_positions)
+
+    @staticmethod
+    def parse_predict_response(response, copy: bool = False):
+        """Decode the outputs of a PredictResponse
+
+        Arrays are read-only views over the response buffer unless `copy` is True.
+        """
         results = {}
         for key in response.outputs:
             tensor_proto = response.outputs[key]
-            nd_array = tf.make_ndarray(tensor_proto)
+            nd_array = make_ndarray(tensor_proto, copy=copy)
             results[key] = nd_array
         return results
 
     def list_models(self):
-        try:
-            _, conn = next(iter(self._pool))
-        except StopIteration:
-            raise EmptyPool("no connections")
+        _, conn = self._pool.pick()
         stub = list_models_pb2_grpc.ListModelsStub(conn.sync_channel)
-        response = stub.ListModels(list_models_pb2.ListModelsRequest())
+        response = stub.ListModels(
+            list_models_pb2.ListModelsRequest(), timeout=self.timeout_seconds)
         return response.models
 
-    def get_round_robin_stub(self, is_async_stub=False):
+    def _pick(self, routing_key=None, tried=None):
+        '''(address, connection) for an attempt, avoiding the addresses `tried` if possible'''
+        address_conn = None
+        if tried:
+            try:
+                address_conn = self._pool.pick(exclude=tried, routing_key=routing_key)
+            except EmptyPool:
+                pass
+        if address_conn is None:
+            address_conn = self._pool.pick(routing_key=routing_key)
+        if tried is not None:
+            tried.add(address_conn[0])
+        return address_conn
+
+    def _pick_other(self, address, routing_key=None):
+        '''(address, connection) of another connection than `address`, None if there is none'''
         try:
-            _, conn = next(iter(self._pool))
-        except StopIteration:
-            raise EmptyPool("no connections")
+            return self._pool.pick(exclude=(address,), routing_key=routing_key)
+        except EmptyPool:
+            return None
+
+    def get_round_robin_stub(self, is_async_stub=False, is_serialized_stub=False):
+        """Stub of the connection picked by the balancer"""
+        _, conn = self._pool.pick()
+        return self._stub_of(conn, is_async_stub, is_serialized_stub)
+
+    @staticmethod
+    def _stub_of(conn, is_async_stub=False, is_serialized_stub=False):
+        if is_serialized_stub:
+            return conn.async_serialized_stub if is_async_stub else conn.sync_serialized_stub
         if is_async_stub:
             return conn.async_stub
         else:
@@ -227,83 +815,515 @@ class Client:
             output_names: List[str] = None,
             model_name: str = 'default',
             model_signature_name: str = None,
+            plan: RequestPlan = None,
+            routing_key=None,
+            timeout: float = None,
         ):
+        """Send a PredictRequest and decode its outputs
 
-        self._setup_connections()
+        If `plan` (from `compile_request`) is given, the request is built from it
+        and `output_names`, `model_name` and `model_signature_name` are ignored.
+        With batching enabled, the outputs may be read-only views of a larger batch.
+        With a cache, outputs of a hit are shared read-only arrays.
+        With a row cache, only the rows missing from it are sent.
+        With single-flight, identical concurrent calls of the same `timeout` share
+        the same output arrays, each in its own dict.
+        Calls with the same `routing_key` go to the same connection with a
+        ConsistentHashBalancer, and are not merged by batching.
+        The call, retries included, ends after `timeout` seconds (defaults to
+        `timeout_seconds` of the client), the time left is sent along each request
+        for the server to give up too. A request merged by batching ends with the
+        latest deadline of its calls, each call still gives up at its own.
+        """
+        key = self._request_key(data, output_names, model_name, model_signature_name, plan)
+        if key is not None and self.cache is not None:
+            outputs = self.cache.get(key)
+            if outputs is not None:
+                return outputs
 
-        request = self._predict_request(
-            data=data,
-            output_names=output_names,
-            model_name=model_name,
-            model_signature_name=model_signature_name,
-        )
-        errors = []
-        for _ in range(self.n_trys):
+        deadline = self._deadline(timeout)
+        args = (
+            key, data, output_names, model_name, model_signature_name, plan, routing_key, deadline)
+        if key is not None and self.single_flight is not None:
+            # calls of different timeouts do not share a deadline
+            outputs = self.single_flight.do((key, timeout), self._predict_uncached, *args)
+            return dict(outputs)
+        return self._predict_uncached(*args)
 
+    def _predict_uncached(
+            self, key, data, output_names, model_name, model_signature_name, plan, routing_key,
+            deadline):
+        rows = self._lookup_rows(data, output_names, model_name, model_signature_name, plan)
+        if rows is None:
+            outputs = self._send(
+                data, output_names, model_name, model_signature_name, plan, routing_key, deadline)
+        else:
+            keys, cached_rows, missing_inputs = rows
+            fresh_outputs = None
+            if missing_inputs is not None:
+                fresh_outputs = self._send(
+                    missing_inputs, output_names, model_name, model_signature_name, plan,
+                    routing_key, deadline,
+                )
+            outputs = self._merge_rows(keys, cached_rows, fresh_outputs)
+
+        if key is not None and self.cache is not None:
+            outputs = self.cache.put(key, outputs)
+        return outputs
+
+    def _send(
+            self, data, output_names, model_name, model_signature_name, plan, routing_key,
+            deadline):
+        if self.sync_batcher is not None and plan is None and routing_key is None:
+            inputs = _as_input_mapping(data)
+            if inputs is not None:
+                try:
+                    return self.sync_batcher.predict(
+                        inputs, output_names, model_name, model_signature_name, deadline)
+                except futures.TimeoutError as e:
+                    raise RetryFailed("Deadline exceeded waiting for the batch", errors=[e])
+        return self._predict(
+            data, output_names, model_name, model_signature_name, plan, routing_key, deadline)
+
+    def _predict(
+            self,
+            data,
+            output_names=None,
+            model_name='default',
+            model_signature_name=None,
+            plan=None,
+            routing_key=None,
+            deadline=None,
+        ):
+        if self._channel_mode == 'async':
+            raise ValueError("predict is not available with channel_mode 'async'")
+        self._refresh_connections()
+
+        if deadline is None:
+            deadline = self._deadline()
+        request = self._build_request(
+            data, output_names, model_name, model_signature_name, plan)
+        state = self.retrier.start_call()
+        while True:
             try:
-                stub = self.get_round_robin_stub(is_async_stub=False)
-                response = stub.Predict(request)
-            except EmptyPool as e:
-                self.logger.warning("serving_utils.Client -- empty pool")
-                self._setup_connections()
-                errors.append(e)
-            except grpc.RpcError as e:
-                if e.code() == grpc.StatusCode.NOT_FOUND and "Model" in e.details():
-                    raise
-                self.logger.exception(e)
-                self._setup_connections()
-                errors.append(e)
+                response = self._call_predict(
+                    request, model_name, plan, routing_key, state.tried, self._time_left(deadline))
             except Exception as e:
-                self.logger.exception(e)
-                self._setup_connections()
-                errors.append(e)
+                delay = self._attempt_failed(state, e, self._refresher, deadline)
+                if delay:
+                    time.sleep(delay)
             else:
                 break
-        else:
-            raise RetryFailed(f"Failed after {self.n_trys} tries", errors=errors)
         return self.parse_predict_response(response)
 
+    def _attempt_failed(self, state: RetryState, exception, refresher, deadline):
+        '''Record a failed attempt of predict/async_predict, returns the backoff before the next
+
+        Raises the error of a missing model as is, RetryFailed if the call is not retried.
+        '''
+        if _is_model_not_found(exception):
+            raise exception
+        if isinstance(exception, EmptyPool):
+            self.logger.warning("serving_utils.Client -- empty pool")
+        else:
+            self.logger.exception(exception)
+        if _is_connection_error(exception):
+            self._connection_failed(refresher)
+        state.errors.append(exception)
+        delay = self.retrier.next_delay(state, deadline)
+        if delay is None:
+            raise RetryFailed(f"Failed after {len(state.errors)} tries", errors=state.errors)
+        return delay
+
+    def _call_predict(
+            self, request, model_name, plan, routing_key=None, tried=None, timeout=None):
+        if self.hedger is None:
+            address, conn = self._pick(routing_key, tried)
+            channel = conn.pick_channel(is_async=False)
+            stub = channel.get_stub(plan is not None)
+            with self._pool.track(address), channel.track():
+                return stub.Predict(request, timeout=timeout)
+
+        if plan is not None:
+            model_name = plan.model_name
+        hedger = self.hedger
+        hedger.start_call()
+        address, conn = self._pick(routing_key, tried)
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        done = queue.Queue()
+        calls = [self._start_call(address, conn, request, plan is not None, timeout)]
+        calls[0].add_done_callback(done.put)
+        try:
+            try:
+                first = done.get(timeout=hedger.delay(model_name))
+            except queue.Empty:
+                other = self._pick_other(address, routing_key)
+                if other is not None and hedger.try_hedge():
+                    if tried is not None:
+                        tried.add(other[0])
+                    hedge = self._start_call(
+                        *other, request, plan is not None, self._time_left(deadline))
+                    hedge.add_done_callback(done.put)
+                    calls.append(hedge)
+                first = done.get()
+            if first.exception() is not None and len(calls) > 1:
+                # the other one may still succeed
+                second = done.get()
+                if second.exception() is None:
+                    first = second
+            response = first.result()
+            hedger.record(model_name, time.monotonic() - start, hedge_won=first is not calls[0])
+            return response
+        finally:
+            for call in calls:
+                call.cancel()
+
+    def _start_call(self, address, conn, request, is_serialized, timeout=None):
+        '''grpc future of a Predict call on `conn`, tracked by the pool and the channel'''
+        channel = conn.pick_channel(is_async=False)
+        call = channel.get_stub(is_serialized).Predict.future(request, timeout=timeout)
+        return self._pool.track_future(address, channel.track_future(call))
+
     async def async_predict(
             self,
             data: List[PredictInput],
             output_names: List[str] = None,
             model_name: str = 'default',
             model_signature_name: str = None,
+            plan: RequestPlan = None,
+            routing_key=None,
+            timeout: float = None,
         ):
+        """Send a PredictRequest and decode its outputs
 
-        self._setup_connections()
+        If `plan` (from `compile_request`) is given, the request is built from it
+        and `output_names`, `model_name` and `model_signature_name` are ignored.
+        With batching enabled, the outputs may be read-only views of a larger batch.
+        With a cache, outputs of a hit are shared read-only arrays.
+        With a row cache, only the rows missing from it are sent.
+        With single-flight, identical concurrent calls of the same `timeout` share
+        the same output arrays, each in its own dict.
+        Calls with the same `routing_key` go to the same connection with a
+        ConsistentHashBalancer, and are not merged by batching.
+        The call, retries included, ends after `timeout` seconds (defaults to
+        `timeout_seconds` of the client), the time left is sent along each request
+        for the server to give up too. A request merged by batching ends with the
+        latest deadline of its calls, each call still gives up at its own.
+        """
+        key = self._request_key(data, output_names, model_name, model_signature_name, plan)
+        if key is not None and self.cache is not None:
+            outputs = self.cache.get(key)
+            if outputs is not None:
+                return outputs
 
-        request = self._predict_request(
-            data=data,
-            output_names=output_names,
-            model_name=model_name,
-            model_signature_name=model_signature_name,
-        )
-        errors = []
-        for _ in range(self.n_trys):
+        deadline = self._deadline(timeout)
+        args = (
+            key, data, output_names, model_name, model_signature_name, plan, routing_key, deadline)
+        if key is not None and self.async_single_flight is not None:
+            outputs = await self.async_single_flight.do(
+                (key, timeout), self._async_predict_uncached, *args)
+            return dict(outputs)
+        return await self._async_predict_uncached(*args)
+
+    async def _async_predict_uncached(
+            self, key, data, output_names, model_name, model_signature_name, plan, routing_key,
+            deadline):
+        rows = self._lookup_rows(data, output_names, model_name, model_signature_name, plan)
+        if rows is None:
+            outputs = await self._async_send(
+                data, output_names, model_name, model_signature_name, plan, routing_key, deadline)
+        else:
+            keys, cached_rows, missing_inputs = rows
+            fresh_outputs = None
+            if missing_inputs is not None:
+                fresh_outputs = await self._async_send(
+                    missing_inputs, output_names, model_name, model_signature_name, plan,
+                    routing_key, deadline,
+                )
+            outputs = self._merge_rows(keys, cached_rows, fresh_outputs)
+
+        if key is not None and self.cache is not None:
+            outputs = self.cache.put(key, outputs)
+        return outputs
 
+    async def _async_send(
+            self, data, output_names, model_name, model_signature_name, plan, routing_key,
+            deadline):
+        if self.async_batcher is not None and plan is None and routing_key is None:
+            inputs = _as_input_mapping(data)
+            if inputs is not None:
+                try:
+                    return await self.async_batcher.predict(
+                        inputs, output_names, model_name, model_signature_name, deadline)
+                except asyncio.TimeoutError as e:
+                    raise RetryFailed("Deadline exceeded waiting for the batch", errors=[e])
+        return await self._async_predict(
+            data, output_names, model_name, model_signature_name, plan, routing_key, deadline)
+
+    async def _async_predict(
+            self,
+            data,
+            output_names=None,
+            model_name='default',
+            model_signature_name=None,
+            plan=None,
+            routing_key=None,
+            deadline=None,
+        ):
+        if self._channel_mode == 'sync':
+            raise ValueError("async_predict is not available with channel_mode 'sync'")
+        self._async_refresh_connections()
+        self._start_async_health_checks()
+
+        if deadline is None:
+            deadline = self._deadline()
+        request = self._build_request(
+            data, output_names, model_name, model_signature_name, plan)
+        state = self.retrier.start_call()
+        while True:
             try:
-                stub = self.get_round_robin_stub(is_async_stub=True)
-                response = await stub.Predict(request)
+                response = await self._async_call_predict(
+                    request, model_name, plan, routing_key, state.tried, self._time_left(deadline))
             except asyncio.CancelledError:
                 raise
-            except EmptyPool as e:
-                self.logger.warning("serving_utils.Client -- empty pool")
-                self._setup_connections()
-                errors.append(e)
-            except GRPCError as e:
-                if e.status == Status.NOT_FOUND and "Model" in e.message:  # noqao: B306
-                    raise
-                self.logger.exception(e)
-                self._setup_connections()
-                errors.append(e)
             except Exception as e:
-                self.logger.exception(e)
-                self._setup_connections()
-                errors.append(e)
+                delay = self._attempt_failed(state, e, self._async_refresher, deadline)
+                if delay:
+                    await asyncio.sleep(delay)
             else:
                 break
-        else:
-            raise RetryFailed(f"Failed after {self.n_trys} tries", errors=errors)
 
         return self.parse_predict_response(response)
+
+    async def _async_call_predict(
+            self, request, model_name, plan, routing_key=None, tried=None, timeout=None):
+        if self.hedger is None:
+            address, conn = self._pick(routing_key, tried)
+            channel = conn.pick_channel(is_async=True)
+            stub = channel.get_stub(plan is not None)
+            with self._pool.track(address), channel.track():
+                return await stub.Predict(request, timeout=timeout)
+
+        if plan is not None:
+            model_name = plan.model_name
+        hedger = self.hedger
+        hedger.start_call()
+        address, conn = self._pick(routing_key, tried)
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        calls = [self._start_async_call(address, conn, request, plan is not None, timeout)]
+        try:
+            done, _ = await asyncio.wait(calls, timeout=hedger.delay(model_name))
+            if not done:
+                other = self._pick_other(address, routing_key)
+                if other is not None and hedger.try_hedge():
+                    if tried is not None:
+                        tried.add(other[0])
+                    calls.append(self._start_async_call(
+                        *other, request, plan is not None, self._time_left(deadline)))
+                done, _ = await asyncio.wait(calls, return_when=asyncio.FIRST_COMPLETED)
+            succeeded = [call for call in calls if call in done and call.exception() is None]
+            if not succeeded and len(calls) > 1:
+                # the other one may still succeed
+                await asyncio.wait(calls)
+                succeeded = [call for call in calls if call.exception() is None]
+            first = succeeded[0] if succeeded else calls[0]
+            response = first.result()
+            hedger.record(model_name, time.monotonic() - start, hedge_won=first is not calls[0])
+            return response
+        finally:
+            for call in calls:
+                if call.done() and not call.cancelled():
+                    call.exception()  # retrieved, the loser's error is not logged
+                else:
+                    call.cancel()
+
+    def _start_async_call(self, address, conn, request, is_serialized, timeout=None):
+        '''Task of a Predict call on `conn`, tracked by the pool and the channel'''
+        channel = conn.pick_channel(is_async=True)
+        call = asyncio.ensure_future(
+            channel.get_stub(is_serialized).Predict(request, timeout=timeout), loop=self._loop)
+        return self._pool.track_future(address, channel.track_future(call))
+
+    def _default_concurrency(self):
+        # keep a couple of requests in flight on every connection
+        return 2 * max(len(self._pool), 1)
+
+    def predict_many(
+            self,
+            inputs: Iterable[Union[ORIGINAL_DATA_TYPE, NEW_DATA_TYPE]],
+            output_names: List[str] = None,
+            model_name: str = 'default',
+            model_signature_name: str = None,
+            plan: RequestPlan = None,
+            concurrency: int = None,
+            ordered: bool = True,
+            timeout: float = None,
+        ) -> Iterator[PredictResult]:
+        """Predict every item of `inputs` with a bounded number of requests in flight
+
+        Inputs are consumed lazily. Requests are spread over the connection pool
+        like `predict` calls. A failing item does not stop the run, its error is
+        reported in its PredictResult.
+
+        Args:
+            inputs: iterable of `data` as accepted by `predict`
+            concurrency (int) : max requests in flight, defaults to 2 per connection
+            ordered (bool) : yield results in input order, or as they complete if False
+            timeout (float) : timeout of each item, as in `predict`
+
+        Returns:
+            iterator of PredictResult(index, outputs, error)
+        """
+        if concurrency is None:
+            concurrency = self._default_concurrency()
+        predict = partial(
+            self.predict,
+            output_names=output_names,
+            model_name=model_name,
+            model_signature_name=model_signature_name,
+            plan=plan,
+            timeout=timeout,
+        )
+        return bounded_map(predict, inputs, concurrency, ordered=ordered)
+
+    def async_predict_many(
+            self,
+            inputs: Iterable[Union[ORIGINAL_DATA_TYPE, NEW_DATA_TYPE]],
+            output_names: List[str] = None,
+            model_name: str = 'default',
+            model_signature_name: str = None,
+            plan: RequestPlan = None,
+            concurrency: int = None,
+            ordered: bool = True,
+            timeout: float = None,
+        ):
+        """Async twin of `predict_many`, to be used with `async for`"""
+        if concurrency is None:
+            concurrency = self._default_concurrency()
+        predict = partial(
+            self.async_predict,
+            output_names=output_names,
+            model_name=model_name,
+            model_signature_name=model_signature_name,
+            plan=plan,
+            timeout=timeout,
+        )
+        return async_bounded_map(predict, inputs, concurrency, ordered=ordered, loop=self._loop)
+
+    def astream_predict(
+            self,
+            inputs: Union[AsyncIterable, Iterable],
+            output_names: List[str] = None,
+            model_name: str = 'default',
+            model_signature_name: str = None,
+            plan: RequestPlan = None,
+            concurrency: int = None,
+            timeout: float = None,
+        ):
+        """Predict a (async) stream of inputs, as an async generator of outputs
+
+        Inputs are pulled lazily and only while fewer than `concurrency` requests
+        are in flight, so a fast producer is held back and memory stays flat however
+        many items are streamed. Outputs come in input order. Each item goes through
+        `async_predict` (retries, connection pool, batching). The first item that
+        still fails stops the stream with its error.
+
+        Args:
+            inputs: async iterable (or iterable) of `data` as accepted by `async_predict`
+            concurrency (int) : max requests in flight, defaults to 2 per connection
+            timeout (float) : timeout of each item, as in `async_predict`
+        """
+        if concurrency is None:
+            concurrency = self._default_concurrency()
+        predict = partial(
+            self.async_predict,
+            output_names=output_names,
+            model_name=model_name,
+            model_signature_name=model_signature_name,
+            plan=plan,
+            timeout=timeout,
+        )
+        return async_stream_map(predict, inputs, concurrency, loop=self._loop)
+
+    def _shard_inputs(self, data, max_shard_rows, max_shard_bytes, output_bytes_per_row):
+        inputs = _as_input_mapping(data)
+        if inputs is None:
+            raise ValueError("data should be a mapping or a list of PredictInput")
+        shards = shard_batch(inputs, max_shard_rows, max_shard_bytes, output_bytes_per_row)
+        return shards, OutputGatherer(shards[-1][0].stop)
+
+    def scatter_predict(
+            self,
+            data: Union[ORIGINAL_DATA_TYPE, NEW_DATA_TYPE],
+            output_names: List[str] = None,
+            model_name: str = 'default',
+            model_signature_name: str = None,
+            plan: RequestPlan = None,
+            max_shard_rows: int = None,
+            max_shard_bytes: int = DEFAULT_MAX_SHARD_BYTES,
+            output_bytes_per_row: int = None,
+            timeout: float = None,
+        ):
+        """Predict one large batch as shards sent in parallel to every connection
+
+        The batch is split along axis 0 into shards of at most `max_shard_rows` rows
+        and `max_shard_bytes` bytes of encoded inputs, and of outputs if the expected
+        `output_bytes_per_row` is given (e.g. 768 * 4 for a float32 embedding of 768),
+        as responses are limited by the max receive size of the client (4 MB by default).
+        Shards are sent concurrently, one per connection in the pool, each retried on
+        its own like a `predict` call, and their outputs are copied in order into
+        preallocated arrays. `timeout` bounds the whole batch, as in `predict`.
+        """
+        shards, gatherer = self._shard_inputs(
+            data, max_shard_rows, max_shard_bytes, output_bytes_per_row)
+        predict = partial(
+            self._predict,
+            output_names=output_names,
+            model_name=model_name,
+            model_signature_name=model_signature_name,
+            plan=plan,
+            deadline=self._deadline(timeout),
+        )
+        concurrency = min(max(len(self._pool), 1), len(shards))
+        results = bounded_map(predict, [shard for _, shard in shards], concurrency, False)
+        for result in results:
+            if result.error is not None:
+                results.close()
+                raise result.error
+            gatherer.add(shards[result.index][0], result.outputs)
+        return gatherer.result()
+
+    async def async_scatter_predict(
+            self,
+            data: Union[ORIGINAL_DATA_TYPE, NEW_DATA_TYPE],
+            output_names: List[str] = None,
+            model_name: str = 'default',
+            model_signature_name: str = None,
+            plan: RequestPlan = None,
+            max_shard_rows: int = None,
+            max_shard_bytes: int = DEFAULT_MAX_SHARD_BYTES,
+            output_bytes_per_row: int = None,
+            timeout: float = None,
+        ):
+        """Async twin of `scatter_predict`"""
+        shards, gatherer = self._shard_inputs(
+            data, max_shard_rows, max_shard_bytes, output_bytes_per_row)
+        predict = partial(
+            self._async_predict,
+            output_names=output_names,
+            model_name=model_name,
+            model_signature_name=model_signature_name,
+            plan=plan,
+            deadline=self._deadline(timeout),
+        )
+        concurrency = min(max(len(self._pool), 1), len(shards))
+        results = async_bounded_map(
+            predict, [shard for _, shard in shards], concurrency, False, loop=self._loop)
+        async for result in results:
+            if result.error is not None:
+                await results.aclose()
+                raise result.error
+            gatherer.add(shards[result.index][0], result.outputs)
+        return gatherer.result()
@@ -0,0 +1,253 @@
+'''
+Active health checks of the connections of a Client
+
+Every `interval_seconds`, each connection is probed with the standard
+grpc.health.v1 Check, ListModels or a Predict, the first one the server
+implements. A connection failing `unhealthy_threshold` probes in a row is
+marked unhealthy and skipped by its balancer, unless all of them are, until
+`healthy_threshold` probes in a row succeed. Dead replicas are found without
+failing user requests first.
+'''
+import asyncio
+import collections
+from concurrent import futures
+import logging
+import time
+
+from grpclib.health.v1 import health_grpc, health_pb2
+
+from .protos import list_models_grpc, list_models_pb2, list_models_pb2_grpc
+from .retry import status_name
+from .warmup import WarmupRequest
+
+
+LOGGER = logging.getLogger(__name__)
+
+HEALTH = 'health'
+LIST_MODELS = 'list_models'
+PREDICT = 'predict'
+METHODS = (HEALTH, LIST_MODELS, PREDICT)
+
+HEALTH_CHECK_METHOD = '/grpc.health.v1.Health/Check'
+
+
+HealthStatus = collections.namedtuple(
+    'HealthStatus', ['address', 'healthy', 'latency_seconds', 'error', 'method'])
+HealthStatus.__doc__ = '''Health of one connection after its last probe
+
+`healthy` is whether the balancer picks it, `latency_seconds` the latency of
+the last probe, None if it failed with `error`, and `method` how it was probed.
+'''
+
+
+class NotServing(Exception):
+    '''A health check answered with another status than SERVING'''
+
+
+class HealthCheckPolicy:
+
+    def __init__(
+            self,
+            interval_seconds: float = 5.,
+            timeout_seconds: float = 1.,
+            unhealthy_threshold: int = 2,
+            healthy_threshold: int = 1,
+            method: str = None,
+            service: str = '',
+            request: WarmupRequest = None,
+        ):
+        """How connections are probed and when they are marked (un)healthy
+
+        Args:
+            interval_seconds (float) : time between two probes of a connection
+            timeout_seconds (float) : timeout of a probe
+            unhealthy_threshold (int) : failed probes in a row marking a connection unhealthy
+            healthy_threshold (int) : successful probes in a row marking it healthy again
+            method (str) : 'health' (grpc.health.v1 Check), 'list_models' or 'predict',
+                None to use the first one implemented by the server, in this order
+            service (str) : service name of the health checks, '' for the whole server
+            request : WarmupRequest sent by 'predict' probes, they are not made without it
+        """
+        if interval_seconds <= 0:
+            raise ValueError("interval_seconds should be positive")
+        if method not in (None,) + METHODS:
+            raise ValueError(f"method should be None or one of {METHODS}")
+        if method == PREDICT and request is None:
+            raise ValueError("'predict' probes need a request")
+        self.interval_seconds = interval_seconds
+        self.timeout_seconds = timeout_seconds
+        self.unhealthy_threshold = unhealthy_threshold
+        self.healthy_threshold = healthy_threshold
+        self.method = method
+        self.service = service
+        self.request = request
+
+
+def _check_serving(response):
+    if response.status != health_pb2.HealthCheckResponse.SERVING:
+        status = health_pb2.HealthCheckResponse.ServingStatus.Name(response.status)
+        raise NotServing(f"health check status {status}")
+
+
+def probe(conn, method, service, request, timeout_seconds):
+    '''Probe `conn` by `method` on its grpcio channel, raises if it fails'''
+    channel = conn.sync_channel
+    if method == HEALTH:
+        check = channel.unary_unary(
+            HEALTH_CHECK_METHOD,
+            request_serializer=health_pb2.HealthCheckRequest.SerializeToString,
+            response_deserializer=health_pb2.HealthCheckResponse.FromString,
+        )
+        response = check(health_pb2.HealthCheckRequest(service=service), timeout=timeout_seconds)
+        _check_serving(response)
+    elif method == LIST_MODELS:
+        stub = list_models_pb2_grpc.ListModelsStub(channel)
+        stub.ListModels(list_models_pb2.ListModelsRequest(), timeout=timeout_seconds)
+    else:
+        conn.sync_stub.Predict(request, timeout=timeout_seconds)
+
+
+async def async_probe(conn, method, service, request, timeout_seconds):
+    '''Async twin of `probe`, on the grpclib channel'''
+    channel = conn.async_channel
+    if method == HEALTH:
+        stub = health_grpc.HealthStub(channel)
+        response = await stub.Check(
+            health_pb2.HealthCheckRequest(service=service), timeout=timeout_seconds)
+        _check_serving(response)
+    elif method == LIST_MODELS:
+        stub = list_models_grpc.ListModelsStub(channel)
+        await stub.ListModels(list_models_pb2.ListModelsRequest(), timeout=timeout_seconds)
+    else:
+        await conn.async_stub.Predict(request, timeout=timeout_seconds)
+
+
+class HealthChecker:
+
+    def __init__(
+            self,
+            policy: HealthCheckPolicy,
+            balancer,
+            request=None,
+            logger: logging.Logger = None,
+        ):
+        """Probes of the connections of `balancer`, marking them healthy or not
+
+        Args:
+            policy : HealthCheckPolicy
+            balancer : Balancer of the connections
+            request : PredictRequest of the 'predict' probes
+        """
+        self.policy = policy
+        self.balancer = balancer
+        self.request = request
+        self.logger = logger or LOGGER
+        self.probe_count = 0
+        self.statuses = {}  # address => last HealthStatus
+        self._methods = {}  # address => method the server answered
+        self._streaks = {}  # address => (successes, failures) in a row
+
+    def _methods_to_try(self, address):
+        if self.policy.method is not None:
+            return [self.policy.method]
+        method = self._methods.get(address)
+        if method is not None:
+            return [method]
+        methods = [HEALTH, LIST_MODELS]
+        if self.request is not None:
+            methods.append(PREDICT)
+        return methods
+
+    def _probe_args(self):
+        return self.policy.service, self.request, self.policy.timeout_seconds
+
+    def _probed(self, address, methods, method, error):
+        '''Whether to stop probing `address` with `method`, and its error if it failed'''
+        if status_name(error) == 'UNIMPLEMENTED' and self.policy.method is None:
+            if method != methods[-1]:
+                return False, None
+            # the server answers, there is nothing more to probe
+            error = None
+        if error is None and self.policy.method is None:
+            self._methods[address] = method
+        return True, error
+
+    def _probe(self, address, conn):
+        methods = self._methods_to_try(address)
+        for method in methods:
+            start = time.monotonic()
+            try:
+                probe(conn, method, *self._probe_args())
+                error = None
+            except Exception as e:
+                error = e
+            done, error = self._probed(address, methods, method, error)
+            if done:
+                return address, method, time.monotonic() - start, error
+
+    async def _async_probe(self, address, conn):
+        methods = self._methods_to_try(address)
+        for method in methods:
+            start = time.monotonic()
+            try:
+                await async_probe(conn, method, *self._probe_args())
+                error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+            done, error = self._probed(address, methods, method, error)
+            if done:
+                return address, method, time.monotonic() - start, error
+
+    def _connections(self):
+        conns = self.balancer.snapshot()
+        addresses = {address for address, _ in conns}
+        for address in list(self.statuses):
+            if address not in addresses:
+                self.statuses.pop(address, None)
+                self._methods.pop(address, None)
+                self._streaks.pop(address, None)
+        return conns
+
+    def check(self):
+        '''Probe every connection in parallel threads and record their health'''
+        conns = self._connections()
+        if not conns:
+            return
+        with futures.ThreadPoolExecutor(max_workers=len(conns)) as executor:
+            results = list(executor.map(lambda item: self._probe(*item), conns))
+        for result in results:
+            self._record(*result)
+
+    async def async_check(self):
+        '''Async twin of `check`'''
+        results = await asyncio.gather(*[
+            self._async_probe(address, conn) for address, conn in self._connections()
+        ])
+        for result in results:
+            self._record(*result)
+
+    def _record(self, address, method, latency_seconds, error):
+        if address not in self.balancer:
+            return
+        self.probe_count += 1
+        policy = self.policy
+        successes, failures = self._streaks.get(address, (0, 0))
+        if error is None:
+            successes, failures = successes + 1, 0
+        else:
+            successes, failures = 0, failures + 1
+            latency_seconds = None
+        self._streaks[address] = (successes, failures)
+
+        healthy = self.balancer.healthy(address)
+        if healthy and failures >= policy.unhealthy_threshold:
+            healthy = False
+            self.logger.warning(
+                f"serving_utils.Client -- {address} is unhealthy: {error!r}")
+        elif not healthy and successes >= policy.healthy_threshold:
+            healthy = True
+            self.logger.info(f"serving_utils.Client -- {address} is healthy again")
+        self.balancer.set_healthy(address, healthy)
+        self.statuses[address] = HealthStatus(address, healthy, latency_seconds, error, method)
@@ -0,0 +1,108 @@
+'''
+Hedged requests
+
+If a request has no response after a delay, the same request is sent to
+another connection and the first response wins. The delay is either fixed
+or a percentile of the latencies observed for the model, and a token bucket
+keeps the extra load below a fraction of the calls.
+'''
+import collections
+import threading
+
+import numpy as np
+
+
+class HedgingPolicy:
+
+    def __init__(
+            self,
+            delay_seconds: float = 0.05,
+            delay_percentile: float = None,
+            min_samples: int = 20,
+            window_size: int = 1000,
+            max_extra_load: float = 0.1,
+            max_burst: int = 10,
+        ):
+        """When to send a hedge and how many
+
+        Args:
+            delay_seconds (float) : send a hedge if there is no response after this long
+            delay_percentile (float) : if given, the delay is this percentile (e.g. 95) of
+                the latencies observed for the model, `delay_seconds` is only used until
+                `min_samples` latencies are observed
+            min_samples (int) : latencies needed before the percentile is used
+            window_size (int) : number of most recent latencies kept per model
+            max_extra_load (float) : hedges sent are at most this fraction of the calls
+            max_burst (int) : hedges that can be sent in a row while the budget allows
+        """
+        if not 0 <= max_extra_load <= 1:
+            raise ValueError("max_extra_load should be between 0 and 1")
+        self.delay_seconds = delay_seconds
+        self.delay_percentile = delay_percentile
+        self.min_samples = min_samples
+        self.window_size = window_size
+        self.max_extra_load = max_extra_load
+        self.max_burst = max_burst
+
+
+class _LatencyWindow:
+
+    # the percentile is recomputed after this many new latencies
+    REFRESH_EVERY = 16
+
+    def __init__(self, size):
+        self.latencies = collections.deque(maxlen=size)
+        self.n_new = 0
+        self.percentile = None
+
+
+class Hedger:
+    '''Delays, budget and metrics of hedged requests, shared by predict and async_predict'''
+
+    def __init__(self, policy: HedgingPolicy):
+        self.policy = policy
+        self.call_count = 0
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self._tokens = float(policy.max_burst)
+        self._windows = {}  # model name => _LatencyWindow
+        self._lock = threading.Lock()
+
+    def delay(self, model_name: str) -> float:
+        '''Seconds to wait for a response before hedging a call to `model_name`'''
+        policy = self.policy
+        if policy.delay_percentile is None:
+            return policy.delay_seconds
+        with self._lock:
+            window = self._windows.get(model_name)
+            if window is None or len(window.latencies) < policy.min_samples:
+                return policy.delay_seconds
+            if window.percentile is None or window.n_new >= window.REFRESH_EVERY:
+                window.percentile = float(
+                    np.percentile(window.latencies, policy.delay_percentile))
+                window.n_new = 0
+            return window.percentile
+
+    def start_call(self):
+        with self._lock:
+            self.call_count += 1
+            self._tokens = min(self._tokens + self.policy.max_extra_load, self.policy.max_burst)
+
+    def try_hedge(self) -> bool:
+        '''Take a hedge from the budget, False if it is spent'''
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.hedges_sent += 1
+            return True
+
+    def record(self, model_name: str, latency_seconds: float, hedge_won: bool = False):
+        with self._lock:
+            if hedge_won:
+                self.hedges_won += 1
+            window = self._windows.get(model_name)
+            if window is None:
+                window = self._windows[model_name] = _LatencyWindow(self.policy.window_size)
+            window.latencies.append(latency_seconds)
+            window.n_new += 1
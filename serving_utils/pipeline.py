@@ -0,0 +1,151 @@
+'''
+Bounded-concurrency pipelines for predicting many inputs
+
+At most `concurrency` items are in flight (encode -> RPC -> decode) at once,
+inputs are consumed lazily and a failing item is reported in its result
+instead of aborting the run.
+'''
+import asyncio
+import collections
+from concurrent import futures
+from typing import AsyncIterable, Callable, Iterable, Iterator, Union
+
+
+PredictResult = collections.namedtuple('PredictResult', ['index', 'outputs', 'error'])
+PredictResult.__doc__ = '''Result of one input of predict_many
+
+`outputs` is None and `error` the raised exception if the item failed.
+'''
+
+
+def _result_of_future(index, future) -> PredictResult:
+    try:
+        return PredictResult(index, future.result(), None)
+    except Exception as e:
+        return PredictResult(index, None, e)
+
+
+def bounded_map(
+        fn: Callable,
+        iterable: Iterable,
+        concurrency: int,
+        ordered: bool = True,
+    ) -> Iterator[PredictResult]:
+    '''Apply `fn` to each item from a thread pool with at most `concurrency` in flight'''
+    if concurrency < 1:
+        raise ValueError("concurrency should be positive")
+
+    with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = collections.OrderedDict()  # future => index
+
+        def wait_one():
+            if ordered:
+                future, index = in_flight.popitem(last=False)
+            else:
+                done, _ = futures.wait(in_flight, return_when=futures.FIRST_COMPLETED)
+                future = next(iter(done))
+                index = in_flight.pop(future)
+            return _result_of_future(index, future)
+
+        try:
+            for index, item in enumerate(iterable):
+                if len(in_flight) >= concurrency:
+                    yield wait_one()
+                in_flight[executor.submit(fn, item)] = index
+            while in_flight:
+                yield wait_one()
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+
+async def async_bounded_map(
+        fn: Callable,
+        iterable: Iterable,
+        concurrency: int,
+        ordered: bool = True,
+        loop: asyncio.AbstractEventLoop = None,
+    ):
+    '''Await `fn` on each item with at most `concurrency` in flight, as an async generator'''
+    if concurrency < 1:
+        raise ValueError("concurrency should be positive")
+
+    in_flight = collections.OrderedDict()  # task => index
+
+    async def wait_one():
+        if ordered:
+            task = next(iter(in_flight))
+            await asyncio.wait([task])
+        else:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            task = next(iter(done))
+        index = in_flight.pop(task)
+        return _result_of_future(index, task)
+
+    try:
+        for index, item in enumerate(iterable):
+            if len(in_flight) >= concurrency:
+                yield await wait_one()
+            in_flight[asyncio.ensure_future(fn(item), loop=loop)] = index
+        while in_flight:
+            yield await wait_one()
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+
+async def _iterate_async(iterable):
+    for item in iterable:
+        yield item
+
+
+async def async_stream_map(
+        fn: Callable,
+        iterable: Union[AsyncIterable, Iterable],
+        concurrency: int,
+        loop: asyncio.AbstractEventLoop = None,
+    ):
+    '''Await `fn` on each item of a (async) iterable and yield the results in order
+
+    Backpressure: the next item is only pulled while fewer than `concurrency`
+    results are in flight or waiting to be yielded, so at most `concurrency + 1`
+    items are held at any time however long the stream is. The first error
+    is raised after cancelling the calls still in flight.
+    '''
+    if concurrency < 1:
+        raise ValueError("concurrency should be positive")
+    if not hasattr(iterable, '__aiter__'):
+        iterable = _iterate_async(iterable)
+    iterator = iterable.__aiter__()
+
+    in_flight = collections.deque()
+    next_item = None
+    exhausted = False
+    try:
+        while True:
+            if next_item is None and not exhausted and len(in_flight) < concurrency:
+                next_item = asyncio.ensure_future(iterator.__anext__(), loop=loop)
+
+            waiting = [] if next_item is None else [next_item]
+            if in_flight:
+                waiting.append(in_flight[0])
+            if not waiting:
+                return
+            await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+            if next_item is not None and next_item.done():
+                try:
+                    item = next_item.result()
+                except StopAsyncIteration:
+                    exhausted = True
+                else:
+                    in_flight.append(asyncio.ensure_future(fn(item), loop=loop))
+                next_item = None
+
+            while in_flight and in_flight[0].done():
+                yield in_flight.popleft().result()
+    finally:
+        if next_item is not None:
+            next_item.cancel()
+        for task in in_flight:
+            task.cancel()
@@ -0,0 +1,169 @@
+'''
+Background refresh of the connection pool
+
+Name resolution runs out of the request path: every `interval_seconds`
+(sooner if the TTL of the answer is shorter), and as soon as possible after
+a connection fails. Refreshes are at least `min_interval_seconds` apart, so a
+burst of failures makes one lookup, not one per failed call.
+'''
+import asyncio
+import logging
+import threading
+import time
+from typing import Awaitable, Callable, Optional
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class _Refresher:
+
+    def __init__(
+            self,
+            refresh,
+            interval_seconds: float,
+            min_interval_seconds: float = 1.,
+            logger: logging.Logger = None,
+        ):
+        if interval_seconds <= 0:
+            raise ValueError("interval_seconds should be positive")
+        self.refresh = refresh
+        self.interval_seconds = interval_seconds
+        self.min_interval_seconds = min(min_interval_seconds, interval_seconds)
+        self.logger = logger or LOGGER
+        self.refresh_count = 0
+        self.error_count = 0
+        self._last_refresh = time.monotonic()
+
+    def _next_delay(self, ttl_seconds):
+        if ttl_seconds is None:
+            return self.interval_seconds
+        return min(self.interval_seconds, max(ttl_seconds, self.min_interval_seconds))
+
+    def _rate_limit_delay(self):
+        return self._last_refresh + self.min_interval_seconds - time.monotonic()
+
+    def _done(self, ttl_seconds=None, error=None):
+        '''Seconds until the next refresh'''
+        self._last_refresh = time.monotonic()
+        self.refresh_count += 1
+        if error is not None:
+            # keep the current connections until the next attempt
+            self.error_count += 1
+            self.logger.warning(f"serving_utils -- refresh failed: {error!r}")
+        return self._next_delay(ttl_seconds)
+
+
+class ThreadRefresher(_Refresher):
+
+    def __init__(
+            self,
+            refresh: Callable[[], Optional[float]],
+            interval_seconds: float,
+            min_interval_seconds: float = 1.,
+            logger: logging.Logger = None,
+            name: str = 'serving-utils-refresh',
+        ):
+        """Calls `refresh` in a daemon thread
+
+        Args:
+            refresh (callable) : resolves and updates the pool, returns the TTL
+                of the answer in seconds or None if it is unknown
+            interval_seconds (float) : max time between two refreshes
+            min_interval_seconds (float) : min time between two refreshes
+            name (str) : name of the thread
+        """
+        super().__init__(refresh, interval_seconds, min_interval_seconds, logger)
+        self.name = name
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run,
+            name=self.name,
+            daemon=True,
+        )
+        self._thread.start()
+
+    def trigger(self):
+        '''Refresh as soon as the min interval allows'''
+        self._wake.set()
+
+    def close(self):
+        self._closed.set()
+        self._wake.set()
+
+    def _run(self):
+        delay = self.interval_seconds
+        while True:
+            if self._wake.wait(delay):
+                if self._closed.wait(max(self._rate_limit_delay(), 0)):
+                    return
+                self._wake.clear()
+            if self._closed.is_set():
+                return
+            try:
+                ttl_seconds = self.refresh()
+            except Exception as e:
+                delay = self._done(error=e)
+            else:
+                delay = self._done(ttl_seconds)
+
+
+class AsyncRefresher(_Refresher):
+
+    def __init__(
+            self,
+            refresh: Callable[[], Awaitable[Optional[float]]],
+            interval_seconds: float,
+            min_interval_seconds: float = 1.,
+            loop: asyncio.AbstractEventLoop = None,
+            logger: logging.Logger = None,
+        ):
+        """Awaits `refresh` in a task of `loop`
+
+        Args:
+            refresh (coroutine function) : resolves and updates the pool, returns
+                the TTL of the answer in seconds or None if it is unknown
+            interval_seconds (float) : max time between two refreshes
+            min_interval_seconds (float) : min time between two refreshes
+        """
+        super().__init__(refresh, interval_seconds, min_interval_seconds, logger)
+        self._loop = loop
+        self._wake = None
+        self._task = None
+
+    def start(self):
+        '''Start the task, from the event loop'''
+        self._wake = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run(), loop=self._loop)
+
+    def trigger(self):
+        '''Refresh as soon as the min interval allows, from the event loop'''
+        if self._wake is not None:
+            self._wake.set()
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        delay = self.interval_seconds
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                await asyncio.sleep(max(self._rate_limit_delay(), 0))
+                self._wake.clear()
+            try:
+                ttl_seconds = await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                delay = self._done(error=e)
+            else:
+                delay = self._done(ttl_seconds)
@@ -0,0 +1,196 @@
+'''
+Pre-serialized PredictRequest templates
+
+The `model_spec` and `output_filter` of a PredictRequest are the same on every
+call for a given model, so `RequestPlan` serializes them once and only encodes
+the inputs per call. Fields of a protobuf message can be concatenated on the
+wire, and keeping them in field number order (model_spec, inputs, output_filter)
+gives the same bytes as `Client._predict_request(...).SerializeToString()`.
+'''
+from typing import List, Mapping
+
+import grpclib.client
+import numpy as np
+
+from .protos import predict_pb2
+from .tensor_utils import (
+    make_tensor_proto,
+    get_data_type,
+    _TENSOR_CONTENT_DTYPES,
+    _to_ndarray,
+)
+
+
+PREDICT_METHOD = '/tensorflow.serving.PredictionService/Predict'
+
+# (field number << 3) | wire type 2 (length-delimited)
+_PREDICT_REQUEST_INPUTS_TAG = b'\x12'
+_MAP_ENTRY_KEY_TAG = b'\x0a'
+_MAP_ENTRY_VALUE_TAG = b'\x12'
+# (field number << 3) | wire type 0 (varint)
+_TENSOR_DTYPE_TAG = b'\x08'
+_TENSOR_SHAPE_TAG = b'\x12'
+_TENSOR_CONTENT_TAG = b'\x22'
+_SHAPE_DIM_TAG = b'\x12'
+_DIM_SIZE_TAG = b'\x08'
+
+
+def _encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _length_delimited(tag: bytes, payload: bytes) -> bytes:
+    return tag + _encode_varint(len(payload)) + payload
+
+
+class SerializedPredictRequest:
+    '''A PredictRequest already encoded on the wire'''
+
+    __slots__ = ('data',)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def SerializeToString(self) -> bytes:
+        # both grpcio (as request_serializer) and grpclib's codec call this
+        return self.data
+
+    def __bytes__(self):
+        return self.data
+
+
+class _InputEncoder:
+    '''Encoding recipe of one named input
+
+    Caches the encoded map key and the dtype + shape header of
+    `tensor_content` tensors for the last seen dtypes and shapes.
+    '''
+
+    MAX_CACHED_HEADERS = 64
+
+    def __init__(self, name: str):
+        self._key = _length_delimited(_MAP_ENTRY_KEY_TAG, name.encode('utf-8'))
+        self._headers = {}
+
+    def _header(self, dtype, shape):
+        try:
+            return self._headers[(dtype, shape)]
+        except KeyError:
+            pass
+        dims = b''.join(
+            _length_delimited(_SHAPE_DIM_TAG, _DIM_SIZE_TAG + _encode_varint(size))
+            for size in shape
+        )
+        header = b''.join([
+            _TENSOR_DTYPE_TAG,
+            _encode_varint(get_data_type(dtype)),
+            _length_delimited(_TENSOR_SHAPE_TAG, dims),
+        ])
+        if len(self._headers) >= self.MAX_CACHED_HEADERS:
+            self._headers.clear()
+        self._headers[(dtype, shape)] = header
+        return header
+
+    def encode(self, value) -> List[bytes]:
+        '''Wire chunks of the `inputs` map entry for `value`'''
+        nparray = _to_ndarray(value)
+        if nparray.dtype in _TENSOR_CONTENT_DTYPES and nparray.size > 1:
+            if nparray.nbytes >= (1 << 31):
+                raise ValueError("Cannot create a tensor proto whose content is larger than 2GB.")
+            nparray = np.ascontiguousarray(nparray)
+            header = self._header(nparray.dtype, nparray.shape)
+            content_len = _encode_varint(nparray.nbytes)
+            tensor_len = len(header) + 1 + len(content_len) + nparray.nbytes
+            head = b''.join([
+                self._key,
+                _MAP_ENTRY_VALUE_TAG,
+                _encode_varint(tensor_len),
+                header,
+                _TENSOR_CONTENT_TAG,
+                content_len,
+            ])
+            entry_len = len(head) + nparray.nbytes
+            # the array buffer is copied only once, by the final join
+            return [_PREDICT_REQUEST_INPUTS_TAG + _encode_varint(entry_len) + head, nparray]
+
+        tensor = make_tensor_proto(value).SerializeToString()
+        entry = self._key + _length_delimited(_MAP_ENTRY_VALUE_TAG, tensor)
+        return [_length_delimited(_PREDICT_REQUEST_INPUTS_TAG, entry)]
+
+
+class RequestPlan:
+    '''Reusable PredictRequest template of one model, signature and output filter
+
+    Created by `Client.compile_request`.
+    '''
+
+    def __init__(
+            self,
+            model_name: str = 'default',
+            output_names: List[str] = None,
+            model_signature_name: str = None,
+        ):
+        self.model_name = model_name
+        self.output_names = None if output_names is None else list(output_names)
+        self.model_signature_name = model_signature_name
+
+        req = predict_pb2.PredictRequest()
+        req.model_spec.name = model_name
+        if model_signature_name is not None:
+            req.model_spec.signature_name = model_signature_name
+        self.prefix = req.SerializeToString()
+
+        req = predict_pb2.PredictRequest()
+        if output_names is not None:
+            req.output_filter.extend(output_names)
+        self.suffix = req.SerializeToString()
+
+        self._input_encoders = {}
+
+    def _input_encoder(self, name):
+        try:
+            return self._input_encoders[name]
+        except KeyError:
+            encoder = _InputEncoder(name)
+            self._input_encoders[name] = encoder
+            return encoder
+
+    def serialize(self, data) -> SerializedPredictRequest:
+        '''Encode `data` (a mapping or a list of PredictInput) into a request'''
+        items = data.items() if isinstance(data, Mapping) else data
+        chunks = [self.prefix]
+        for name, value in items:
+            chunks.extend(self._input_encoder(name).encode(value))
+        chunks.append(self.suffix)
+        return SerializedPredictRequest(b''.join(chunks))
+
+    def to_proto(self, data) -> predict_pb2.PredictRequest:
+        return predict_pb2.PredictRequest.FromString(self.serialize(data).data)
+
+
+class SerializedPredictionServiceStub:
+    '''grpcio stub whose Predict sends a SerializedPredictRequest as is'''
+
+    def __init__(self, channel):
+        self.Predict = channel.unary_unary(
+            PREDICT_METHOD,
+            request_serializer=SerializedPredictRequest.SerializeToString,
+            response_deserializer=predict_pb2.PredictResponse.FromString,
+        )
+
+
+class AsyncSerializedPredictionServiceStub:
+    '''grpclib stub whose Predict sends a SerializedPredictRequest as is'''
+
+    def __init__(self, channel: grpclib.client.Channel):
+        self.Predict = grpclib.client.UnaryUnaryMethod(
+            channel,
+            PREDICT_METHOD,
+            SerializedPredictRequest,
+            predict_pb2.PredictResponse,
+        )
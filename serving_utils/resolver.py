@@ -0,0 +1,215 @@
+'''
+Resolution of the endpoints of a Client
+
+A resolver returns the current endpoints (address, port, weight) and the
+TTL of the answer. The client diffs them into its connection pool, and
+passes the weights on to its balancer.
+'''
+import asyncio
+from collections import namedtuple
+import json
+import os
+import socket
+from typing import Iterable, List, Optional, Tuple, Union
+
+
+class Endpoint(namedtuple('Endpoint', ['address', 'port', 'weight'])):
+    '''`port` None is the port of the client, `weight` the relative share of the calls'''
+
+    __slots__ = ()
+
+    def __new__(cls, address: str, port: int = None, weight: float = 1.):
+        return super().__new__(cls, address, port, weight)
+
+    @property
+    def key(self) -> str:
+        '''Key of the endpoint in the pool, its address if it has no port of its own'''
+        if self.port is None:
+            return self.address
+        if ':' in self.address:
+            return f'[{self.address}]:{self.port}'
+        return f'{self.address}:{self.port}'
+
+    @classmethod
+    def parse(cls, endpoint: Union['Endpoint', str, tuple, dict]) -> 'Endpoint':
+        '''Endpoint from 'address', 'address:port', '[ipv6]:port', a tuple or a dict'''
+        if isinstance(endpoint, cls):
+            return endpoint
+        if isinstance(endpoint, dict):
+            return cls(**endpoint)
+        if isinstance(endpoint, (tuple, list)):
+            return cls(*endpoint)
+        if endpoint.startswith('['):
+            address, _, port = endpoint[1:].partition(']:')
+            return cls(address.rstrip(']'), int(port) if port else None)
+        if endpoint.count(':') == 1:
+            address, port = endpoint.split(':')
+            return cls(address, int(port))
+        return cls(endpoint)
+
+
+ResolveResult = Tuple[List[Endpoint], Optional[float]]
+
+
+class Resolver:
+    '''Base of resolvers
+
+    Subclasses implement `resolve`, and `async_resolve` if resolving blocks.
+    '''
+
+    def resolve(self) -> ResolveResult:
+        '''(endpoints, TTL of the answer in seconds or None if unknown)'''
+        raise NotImplementedError
+
+    async def async_resolve(self, loop: asyncio.AbstractEventLoop) -> ResolveResult:
+        return self.resolve()
+
+
+class StaticResolver(Resolver):
+
+    def __init__(self, endpoints: Iterable[Union[Endpoint, str, tuple, dict]]):
+        """A fixed list of endpoints
+
+        Args:
+            endpoints : Endpoint, 'address', 'address:port', (address, port, weight)
+                or {'address': ..., 'port': ..., 'weight': ...} each
+        """
+        self.endpoints = [Endpoint.parse(endpoint) for endpoint in endpoints]
+
+    def resolve(self):
+        return list(self.endpoints), None
+
+
+class DnsResolver(Resolver):
+
+    def __init__(self, host: str, family: int = socket.AF_UNSPEC):
+        """The A and AAAA records of `host`, from the system resolver
+
+        The system resolver does not tell the TTL of the answer: the endpoints are
+        resolved again every `dns_refresh_seconds` of the client whatever the TTL
+        of the records. Use SrvResolver for refreshes following the DNS TTL.
+
+        Args:
+            host (str) : hostname
+            family (int) : socket.AF_INET for IPv4 only, AF_INET6 for IPv6 only
+        """
+        self.host = host
+        self.family = family
+
+    def _endpoints(self, infos):
+        addresses = dict.fromkeys(sockaddr[0] for *_, sockaddr in infos)
+        return [Endpoint(address) for address in addresses], None
+
+    def resolve(self):
+        if self.family == socket.AF_INET:
+            _, _, addresses = socket.gethostbyname_ex(self.host)
+            return [Endpoint(address) for address in addresses], None
+        return self._endpoints(
+            socket.getaddrinfo(self.host, None, family=self.family, type=socket.SOCK_STREAM))
+
+    async def async_resolve(self, loop):
+        infos = await loop.getaddrinfo(
+            self.host, None, family=self.family, type=socket.SOCK_STREAM)
+        return self._endpoints(infos)
+
+
+def _import_dns_resolver():
+    try:
+        import dns.resolver
+    except ImportError:
+        raise ImportError("SrvResolver needs dnspython, pip install dnspython")
+    return dns.resolver
+
+
+class SrvResolver(Resolver):
+
+    def __init__(self, name: str, family: int = socket.AF_UNSPEC):
+        """The targets of the SRV records of `name` (e.g. '_grpc._tcp.serving.local')
+
+        Only the records of the best (lowest) priority are used, with their ports
+        and weights (a weight of 0 counts as 1). Needs dnspython.
+
+        Args:
+            name (str) : SRV record name
+            family (int) : address family of the targets
+        """
+        self.name = name
+        self.family = family
+        self._dns_resolver = _import_dns_resolver()
+
+    def _records(self):
+        answer = self._dns_resolver.resolve(self.name, 'SRV')
+        records = list(answer)
+        best = min(record.priority for record in records)
+        return [record for record in records if record.priority == best], answer.rrset.ttl
+
+    def _endpoints(self, records, target_infos):
+        endpoints = []
+        for record, infos in zip(records, target_infos):
+            for address in dict.fromkeys(sockaddr[0] for *_, sockaddr in infos):
+                endpoints.append(Endpoint(address, record.port, max(record.weight, 1)))
+        return endpoints
+
+    def resolve(self):
+        records, ttl = self._records()
+        target_infos = [
+            socket.getaddrinfo(
+                record.target.to_text(omit_final_dot=True),
+                record.port,
+                family=self.family,
+                type=socket.SOCK_STREAM,
+            )
+            for record in records
+        ]
+        return self._endpoints(records, target_infos), ttl
+
+    async def async_resolve(self, loop):
+        records, ttl = await loop.run_in_executor(None, self._records)
+        target_infos = await asyncio.gather(*[
+            loop.getaddrinfo(
+                record.target.to_text(omit_final_dot=True),
+                record.port,
+                family=self.family,
+                type=socket.SOCK_STREAM,
+            )
+            for record in records
+        ])
+        return self._endpoints(records, target_infos), ttl
+
+
+class FileResolver(Resolver):
+
+    def __init__(self, path: str):
+        """Endpoints listed in a JSON or YAML (.yaml or .yml, needs PyYAML) file
+
+        The file holds a list of endpoints as accepted by StaticResolver, or a
+        mapping with this list under 'endpoints'. It is read again when its
+        modification time changes, so the pool follows the edits of the file.
+
+        Args:
+            path (str) : path of the file
+        """
+        self.path = path
+        self._mtime = None
+        self._endpoints = []
+
+    def _load(self):
+        with open(self.path) as f:
+            if self.path.endswith(('.yaml', '.yml')):
+                try:
+                    import yaml
+                except ImportError:
+                    raise ImportError("YAML files need PyYAML, pip install pyyaml")
+                content = yaml.safe_load(f)
+            else:
+                content = json.load(f)
+        if isinstance(content, dict):
+            content = content['endpoints']
+        return [Endpoint.parse(endpoint) for endpoint in content]
+
+    def resolve(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self._mtime:
+            self._endpoints = self._load()
+            self._mtime = mtime
+        return list(self._endpoints), None
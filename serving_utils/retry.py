@@ -0,0 +1,132 @@
+'''
+Retries of failed calls
+
+A failed call is retried if its error is retryable (transport errors and
+some status codes), after an exponential backoff with jitter, on another
+connection than the ones already tried when there is one. A token bucket
+shared by all the calls of a client keeps the retries below a fraction of
+the calls, so that an outage does not multiply the load on the servers.
+'''
+import random
+import threading
+import time
+
+import grpc
+from grpclib.exceptions import GRPCError
+
+
+DEFAULT_RETRYABLE_CODES = frozenset({'UNAVAILABLE', 'RESOURCE_EXHAUSTED', 'ABORTED'})
+
+
+def status_name(exception):
+    '''Name of the status code of a grpcio or grpclib error, None for other exceptions'''
+    if isinstance(exception, GRPCError):
+        return exception.status.name
+    if isinstance(exception, grpc.RpcError) and hasattr(exception, 'code'):
+        return exception.code().name
+    return None
+
+
+class RetryPolicy:
+
+    def __init__(
+            self,
+            max_attempts: int = 3,
+            initial_backoff_seconds: float = 0.05,
+            max_backoff_seconds: float = 1.,
+            backoff_multiplier: float = 2.,
+            jitter: float = 1.,
+            retryable_codes=DEFAULT_RETRYABLE_CODES,
+            budget_ratio: float = 0.1,
+            max_budget: int = 10,
+        ):
+        """Which calls are retried, when and how many
+
+        Args:
+            max_attempts (int) : tries of a call, including the first one
+            initial_backoff_seconds (float) : backoff before the first retry, multiplied
+                by `backoff_multiplier` before each next one, up to `max_backoff_seconds`
+            max_backoff_seconds (float) : longest backoff
+            backoff_multiplier (float) : growth of the backoff between retries
+            jitter (float) : fraction of the backoff drawn at random, 1 for a backoff
+                uniform between 0 and its value, 0 for none
+            retryable_codes : names of the gRPC status codes retried, e.g. 'UNAVAILABLE',
+                errors without status (connection errors, empty pool) are always retried
+            budget_ratio (float) : retries are at most this fraction of the calls
+            max_budget (int) : retries that can be sent in a row while the budget allows
+        """
+        if max_attempts < 1:
+            raise ValueError("max_attempts should be positive")
+        if not 0 <= jitter <= 1:
+            raise ValueError("jitter should be between 0 and 1")
+        if budget_ratio < 0:
+            raise ValueError("budget_ratio should not be negative")
+        self.max_attempts = max_attempts
+        self.initial_backoff_seconds = initial_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.backoff_multiplier = backoff_multiplier
+        self.jitter = jitter
+        self.retryable_codes = frozenset(code.upper() for code in retryable_codes)
+        self.budget_ratio = budget_ratio
+        self.max_budget = max_budget
+
+
+class RetryState:
+    '''Attempts of one call: their errors and the addresses they were sent to'''
+
+    def __init__(self):
+        self.errors = []
+        self.tried = set()
+
+
+class Retrier:
+    '''Backoffs, budget and metrics of retries, shared by predict and async_predict'''
+
+    def __init__(self, policy: RetryPolicy):
+        self.policy = policy
+        self.call_count = 0
+        self.retry_count = 0
+        self.budget_exhausted_count = 0
+        self._tokens = float(policy.max_budget)
+        self._lock = threading.Lock()
+        self._random = random.random
+
+    def start_call(self) -> RetryState:
+        with self._lock:
+            self.call_count += 1
+            self._tokens = min(self._tokens + self.policy.budget_ratio, self.policy.max_budget)
+        return RetryState()
+
+    def is_retryable(self, exception) -> bool:
+        name = status_name(exception)
+        return name is None or name in self.policy.retryable_codes
+
+    def backoff(self, n_retries: int) -> float:
+        '''Seconds to wait before the `n_retries`-th retry of a call'''
+        policy = self.policy
+        backoff = min(
+            policy.initial_backoff_seconds * policy.backoff_multiplier ** (n_retries - 1),
+            policy.max_backoff_seconds,
+        )
+        return backoff * (1 - policy.jitter * self._random())
+
+    def next_delay(self, state: RetryState, deadline: float = None):
+        '''Backoff before retrying the call of `state` after its last error, None to give up
+
+        The call is given up if the backoff would end past `deadline` (time.monotonic()).
+        '''
+        n_attempts = len(state.errors)
+        if n_attempts >= self.policy.max_attempts:
+            return None
+        if not self.is_retryable(state.errors[-1]):
+            return None
+        delay = self.backoff(n_attempts)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        with self._lock:
+            if self._tokens < 1:
+                self.budget_exhausted_count += 1
+                return None
+            self._tokens -= 1
+            self.retry_count += 1
+        return delay
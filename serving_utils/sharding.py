@@ -0,0 +1,98 @@
+'''
+Scatter-gather of one large batch
+
+A batch is split along axis 0 into shards small enough for one gRPC message,
+the shards are predicted in parallel over the connection pool, and their
+outputs are copied back in order into preallocated arrays.
+'''
+from typing import List, Mapping, Tuple
+
+import numpy as np
+
+from .tensor_utils import _as_bytes
+
+
+# Stay below the 4 MB default max message size of gRPC servers
+DEFAULT_MAX_SHARD_BYTES = 3 * 1024 * 1024
+
+
+def encoded_nbytes(value: np.ndarray) -> int:
+    '''Approximate size of `value` in a TensorProto
+
+    Strings count their encoded bytes and the tag and length of each element,
+    not the pointers of an object array.
+    '''
+    if value.dtype.kind not in 'SUO':
+        return value.nbytes
+    nbytes = 0
+    for x in value.flat:
+        n = len(_as_bytes(x))
+        nbytes += n + 1 + max((n.bit_length() + 6) // 7, 1)
+    return nbytes
+
+
+def shard_batch(
+        data: Mapping[str, np.ndarray],
+        max_shard_rows: int = None,
+        max_shard_bytes: int = DEFAULT_MAX_SHARD_BYTES,
+        output_bytes_per_row: int = None,
+    ) -> List[Tuple[slice, Mapping[str, np.ndarray]]]:
+    '''Split `data` along axis 0 into (rows, shard) pairs, shards are views of `data`
+
+    Shards have at most `max_shard_bytes` of encoded inputs, and of outputs if
+    the expected `output_bytes_per_row` is given, since responses are subject
+    to the max message size of the client too.
+    '''
+    n_rows = None
+    for name, value in data.items():
+        if not isinstance(value, np.ndarray) or value.ndim == 0:
+            raise ValueError(f"Input {name!r} has no batch dimension")
+        if n_rows is None:
+            n_rows = value.shape[0]
+        elif value.shape[0] != n_rows:
+            raise ValueError(
+                f"Input {name!r} has {value.shape[0]} rows, other inputs have {n_rows}")
+    if not n_rows:
+        return [(slice(0, 0), data)]
+
+    rows_per_shard = n_rows
+    if max_shard_bytes is not None:
+        bytes_per_row = sum(encoded_nbytes(value) for value in data.values()) / n_rows
+        if output_bytes_per_row is not None:
+            bytes_per_row = max(bytes_per_row, output_bytes_per_row)
+        if bytes_per_row > 0:
+            rows_per_shard = max(1, int(max_shard_bytes // bytes_per_row))
+    if max_shard_rows is not None:
+        rows_per_shard = min(rows_per_shard, max_shard_rows)
+
+    shards = []
+    for start in range(0, n_rows, rows_per_shard):
+        rows = slice(start, min(start + rows_per_shard, n_rows))
+        shards.append((rows, {name: value[rows] for name, value in data.items()}))
+    return shards
+
+
+class OutputGatherer:
+    '''Reassembles shard outputs, in any arrival order, into arrays of `n_rows` rows'''
+
+    def __init__(self, n_rows: int):
+        self.n_rows = n_rows
+        self._outputs = None
+
+    def add(self, rows: slice, outputs: Mapping[str, np.ndarray]):
+        if self._outputs is None:
+            self._outputs = {
+                name: np.empty((self.n_rows, *value.shape[1:]), dtype=value.dtype)
+                for name, value in outputs.items()
+            }
+        n_shard_rows = rows.stop - rows.start
+        for name, value in outputs.items():
+            if value.ndim == 0 or value.shape[0] != n_shard_rows:
+                raise ValueError(
+                    f"Output {name!r} of shape {value.shape} does not match "
+                    f"a shard of {n_shard_rows} rows"
+                )
+            self._outputs[name][rows] = value
+
+    def result(self) -> Mapping[str, np.ndarray]:
+        return self._outputs
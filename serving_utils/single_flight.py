@@ -0,0 +1,83 @@
+'''
+Single-flight deduplication of identical concurrent calls
+
+The first caller of a key runs the call, callers arriving with the same key
+while it is in flight wait for it and get the same result or error.
+'''
+import asyncio
+from concurrent import futures
+import threading
+from typing import Callable, Hashable
+
+
+class SingleFlight:
+    '''Thread-safe single-flight for blocking calls'''
+
+    def __init__(self):
+        self.call_count = 0
+        self.shared_count = 0
+        self._calls = {}  # key => concurrent.futures.Future
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._calls)
+
+    def do(self, key: Hashable, fn: Callable, *args):
+        with self._lock:
+            self.call_count += 1
+            shared = self._calls.get(key)
+            if shared is None:
+                self._calls[key] = future = futures.Future()
+            else:
+                self.shared_count += 1
+        if shared is not None:
+            return shared.result()
+
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            self._forget(key)
+            future.set_exception(e)
+            raise
+        self._forget(key)
+        future.set_result(result)
+        return result
+
+    def _forget(self, key):
+        with self._lock:
+            del self._calls[key]
+
+
+class AsyncSingleFlight:
+    '''Single-flight for coroutines of one event loop
+
+    The shared call runs in its own task: cancelling one waiter does not
+    cancel it for the others.
+    '''
+
+    def __init__(self, loop: asyncio.AbstractEventLoop = None):
+        self.call_count = 0
+        self.shared_count = 0
+        self._loop = loop
+        self._tasks = {}  # key => asyncio.Task
+
+    def __len__(self):
+        return len(self._tasks)
+
+    async def do(self, key: Hashable, fn: Callable, *args):
+        self.call_count += 1
+        task = self._tasks.get(key)
+        if task is not None:
+            self.shared_count += 1
+        else:
+            task = asyncio.ensure_future(fn(*args), loop=self._loop)
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # every waiter may be gone, do not warn about an unretrieved error
+            task.exception()
@@ -0,0 +1,257 @@
+'''
+NumPy <=> TensorProto conversion without TensorFlow
+
+`make_tensor_proto` produces the same message as `tf.make_tensor_proto`
+for numeric, bool and string values, but writes straight into the
+target proto instead of going through TF's dtype machinery.
+`make_ndarray` is the counterpart of `tf.make_ndarray`.
+'''
+import numpy as np
+
+from .protos import tensor_pb2, types_pb2
+
+
+# Same dtypes for which TF packs the raw buffer into `tensor_content`
+_TENSOR_CONTENT_DTYPES = frozenset([
+    np.dtype(np.float32),
+    np.dtype(np.float64),
+    np.dtype(np.int32),
+    np.dtype(np.uint8),
+    np.dtype(np.int16),
+    np.dtype(np.int8),
+    np.dtype(np.int64),
+    np.dtype(np.uint32),
+    np.dtype(np.uint64),
+])
+
+_NP_TO_DATA_TYPE = {
+    np.dtype(np.float16): types_pb2.DT_HALF,
+    np.dtype(np.float32): types_pb2.DT_FLOAT,
+    np.dtype(np.float64): types_pb2.DT_DOUBLE,
+    np.dtype(np.int8): types_pb2.DT_INT8,
+    np.dtype(np.int16): types_pb2.DT_INT16,
+    np.dtype(np.int32): types_pb2.DT_INT32,
+    np.dtype(np.int64): types_pb2.DT_INT64,
+    np.dtype(np.uint8): types_pb2.DT_UINT8,
+    np.dtype(np.uint16): types_pb2.DT_UINT16,
+    np.dtype(np.uint32): types_pb2.DT_UINT32,
+    np.dtype(np.uint64): types_pb2.DT_UINT64,
+    np.dtype(np.complex64): types_pb2.DT_COMPLEX64,
+    np.dtype(np.complex128): types_pb2.DT_COMPLEX128,
+    np.dtype(np.bool_): types_pb2.DT_BOOL,
+}
+
+
+def _as_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode('utf-8')
+    raise TypeError(f"Expected bytes or str, got {value!r} of type {type(value).__name__}")
+
+
+def _flatten_to_strings(values):
+    if isinstance(values, (list, tuple)):
+        for inner in values:
+            yield from _flatten_to_strings(inner)
+    else:
+        yield values
+
+
+def _append_half(tensor_proto, flat):
+    tensor_proto.half_val.extend(flat.view(np.uint16).tolist())
+
+
+def _append_complex(field_name):
+    def append(tensor_proto, flat):
+        getattr(tensor_proto, field_name).extend(
+            flat.view(flat.real.dtype).tolist())
+    return append
+
+
+def _append_to(field_name):
+    def append(tensor_proto, flat):
+        getattr(tensor_proto, field_name).extend(flat.tolist())
+    return append
+
+
+def _append_strings(tensor_proto, flat):
+    tensor_proto.string_val.extend([_as_bytes(x) for x in flat.tolist()])
+
+
+_NP_TO_APPEND_FN = {
+    np.dtype(np.float16): _append_half,
+    np.dtype(np.float32): _append_to('float_val'),
+    np.dtype(np.float64): _append_to('double_val'),
+    np.dtype(np.int8): _append_to('int_val'),
+    np.dtype(np.int16): _append_to('int_val'),
+    np.dtype(np.int32): _append_to('int_val'),
+    np.dtype(np.uint8): _append_to('int_val'),
+    np.dtype(np.uint16): _append_to('int_val'),
+    np.dtype(np.int64): _append_to('int64_val'),
+    np.dtype(np.uint32): _append_to('uint32_val'),
+    np.dtype(np.uint64): _append_to('uint64_val'),
+    np.dtype(np.complex64): _append_complex('scomplex_val'),
+    np.dtype(np.complex128): _append_complex('dcomplex_val'),
+    np.dtype(np.bool_): _append_to('bool_val'),
+}
+
+
+_DATA_TYPE_TO_NP = {v: k for k, v in _NP_TO_DATA_TYPE.items()}
+_DATA_TYPE_TO_NP[types_pb2.DT_STRING] = np.dtype(np.object_)
+
+# DataType => (typed value field, dtype the field holds on the wire)
+_DATA_TYPE_TO_VAL_FIELD = {
+    types_pb2.DT_HALF: ('half_val', np.dtype(np.uint16)),
+    types_pb2.DT_FLOAT: ('float_val', np.dtype(np.float32)),
+    types_pb2.DT_DOUBLE: ('double_val', np.dtype(np.float64)),
+    types_pb2.DT_INT8: ('int_val', np.dtype(np.int8)),
+    types_pb2.DT_INT16: ('int_val', np.dtype(np.int16)),
+    types_pb2.DT_INT32: ('int_val', np.dtype(np.int32)),
+    types_pb2.DT_UINT8: ('int_val', np.dtype(np.uint8)),
+    types_pb2.DT_UINT16: ('int_val', np.dtype(np.uint16)),
+    types_pb2.DT_INT64: ('int64_val', np.dtype(np.int64)),
+    types_pb2.DT_UINT32: ('uint32_val', np.dtype(np.uint32)),
+    types_pb2.DT_UINT64: ('uint64_val', np.dtype(np.uint64)),
+    types_pb2.DT_COMPLEX64: ('scomplex_val', np.dtype(np.float32)),
+    types_pb2.DT_COMPLEX128: ('dcomplex_val', np.dtype(np.float64)),
+    types_pb2.DT_BOOL: ('bool_val', np.dtype(np.bool_)),
+}
+
+
+def _is_string_dtype(dtype):
+    return dtype.kind in ('S', 'U', 'O')
+
+
+def _to_ndarray(values):
+    if isinstance(values, np.ndarray):
+        return values
+    if isinstance(values, np.generic):
+        return np.asarray(values)
+    if hasattr(values, '__array__'):
+        return np.asarray(values)
+    if values is None:
+        raise ValueError("None values not supported.")
+
+    nparray = np.array(values)
+    # Python numbers are narrowed the same way `tf.make_tensor_proto` does
+    if nparray.dtype == np.float64:
+        nparray = nparray.astype(np.float32)
+    elif nparray.dtype == np.int64:
+        downcasted = nparray.astype(np.int32)
+        if np.array_equal(downcasted, nparray):
+            nparray = downcasted
+    return nparray
+
+
+def get_data_type(dtype):
+    '''Map a numpy dtype to a `types_pb2.DataType` enum value'''
+    dtype = np.dtype(dtype)
+    if _is_string_dtype(dtype):
+        return types_pb2.DT_STRING
+    try:
+        return _NP_TO_DATA_TYPE[dtype]
+    except KeyError:
+        raise TypeError(f"Unsupported numpy dtype: {dtype}")
+
+
+def make_tensor_proto(values, tensor_proto=None):
+    """Encode `values` into a TensorProto
+
+    Args:
+        values: numpy array, numpy scalar or (nested) python values
+        tensor_proto: an existing TensorProto to fill in place, e.g. `req.inputs[name]`.
+            A new one is created if not given.
+
+    Returns:
+        The filled TensorProto
+    """
+    nparray = _to_ndarray(values)
+    if tensor_proto is None:
+        tensor_proto = tensor_pb2.TensorProto()
+
+    dtype = nparray.dtype
+    tensor_proto.dtype = get_data_type(dtype)
+    tensor_proto.tensor_shape.SetInParent()
+    dims = tensor_proto.tensor_shape.dim
+    for size in nparray.shape:
+        dims.add().size = size
+
+    if dtype in _TENSOR_CONTENT_DTYPES and nparray.size > 1:
+        if nparray.nbytes >= (1 << 31):
+            raise ValueError("Cannot create a tensor proto whose content is larger than 2GB.")
+        tensor_proto.tensor_content = nparray.tobytes()
+        return tensor_proto
+
+    if _is_string_dtype(dtype) and not isinstance(values, np.ndarray):
+        tensor_proto.string_val.extend(
+            [_as_bytes(x) for x in _flatten_to_strings(values)])
+        return tensor_proto
+
+    flat = nparray.ravel()
+    if _is_string_dtype(dtype):
+        _append_strings(tensor_proto, flat)
+    else:
+        _NP_TO_APPEND_FN[dtype](tensor_proto, flat)
+    return tensor_proto
+
+
+def _read_only(nparray):
+    nparray.flags.writeable = False
+    return nparray
+
+
+def _make_string_ndarray(tensor_proto, shape, num_elements):
+    values = list(tensor_proto.string_val)
+    padding = num_elements - len(values)
+    if padding > 0:
+        last = values[-1] if values else b""
+        values.extend([last] * padding)
+    nparray = np.empty(len(values), dtype=np.object_)
+    nparray[:] = values
+    return nparray.reshape(shape)
+
+
+def make_ndarray(tensor_proto, copy=False):
+    """Decode a TensorProto into a numpy array
+
+    Dense `tensor_content` is wrapped with `np.frombuffer` without copying.
+    Otherwise values are read from the typed `*_val` fields, where a short
+    field is padded with its last value like `tf.make_ndarray` does.
+
+    Args:
+        tensor_proto: the TensorProto to decode
+        copy: return a writeable copy instead of a read-only array
+
+    Returns:
+        numpy array of the tensor's dtype and shape
+    """
+    data_type = tensor_proto.dtype
+    try:
+        dtype = _DATA_TYPE_TO_NP[data_type]
+    except KeyError:
+        raise TypeError(f"Unsupported tensor type: {data_type}")
+    shape = [dim.size for dim in tensor_proto.tensor_shape.dim]
+
+    if tensor_proto.tensor_content:
+        nparray = np.frombuffer(tensor_proto.tensor_content, dtype=dtype).reshape(shape)
+        return nparray.copy() if copy else nparray
+
+    num_elements = 1
+    for size in shape:
+        num_elements *= size
+
+    if data_type == types_pb2.DT_STRING:
+        nparray = _make_string_ndarray(tensor_proto, shape, num_elements)
+        return nparray if copy else _read_only(nparray)
+
+    field_name, field_dtype = _DATA_TYPE_TO_VAL_FIELD[data_type]
+    values = np.array(getattr(tensor_proto, field_name), dtype=field_dtype).view(dtype)
+
+    if values.size == 0:
+        nparray = np.zeros(shape, dtype)
+    elif values.size != num_elements:
+        nparray = np.pad(values, (0, num_elements - values.size), 'edge').reshape(shape)
+    else:
+        nparray = values.reshape(shape)
+    return nparray if copy else _read_only(nparray)
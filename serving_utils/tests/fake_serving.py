@@ -0,0 +1,139 @@
+'''In-process stand-ins of a model server, computing c = a + 2 * b like train_for_test.py
+
+Also the inputs, resolver patch and clock shared by the tests of the client.
+'''
+import asyncio
+from concurrent import futures
+import time
+from unittest.mock import patch
+
+import grpc
+import grpclib.server
+from grpclib.const import Status
+from grpclib.exceptions import GRPCError
+import numpy as np
+
+from ..protos import predict_pb2, prediction_service_pb2_grpc, prediction_service_grpc
+from ..tensor_utils import make_ndarray, make_tensor_proto
+
+
+class FakeClock:
+    '''Stand-in of time.monotonic, moved by setting `now`'''
+
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+
+def make_data(value=1, n_rows=1):
+    '''Inputs of the fake model, `n_rows` rows of a filled with `value` and of b with 1'''
+    return {
+        'a': np.full((n_rows, 2), value, np.float32),
+        'b': np.ones((n_rows, 2), np.float32),
+    }
+
+
+def make_response(request):
+    a = make_ndarray(request.inputs['a'])
+    b = make_ndarray(request.inputs['b'])
+    response = predict_pb2.PredictResponse()
+    make_tensor_proto(a + 2 * b, response.outputs['c'])
+    return response
+
+
+class FakePredictionServicer(prediction_service_pb2_grpc.PredictionServiceServicer):
+    '''`fail_times` first requests fail with `fail_code`, responses take `delay_seconds`'''
+
+    def __init__(self, fail_times=0, delay_seconds=0, fail_code='UNAVAILABLE'):
+        self.requests = []
+        self.fail_times = fail_times
+        self.delay_seconds = delay_seconds
+        self.fail_code = fail_code
+
+    def Predict(self, request, context):
+        self.requests.append(request)
+        if self.delay_seconds:
+            time.sleep(self.delay_seconds)
+        if len(self.requests) <= self.fail_times:
+            context.abort(grpc.StatusCode[self.fail_code], "fake failure")
+        return make_response(request)
+
+
+class AsyncFakePredictionService(prediction_service_grpc.PredictionServiceBase):
+    '''`fail_times` first requests fail with `fail_code`, responses take `delay_seconds`'''
+
+    def __init__(self, fail_times=0, delay_seconds=0, fail_code='UNAVAILABLE'):
+        self.requests = []
+        self.fail_times = fail_times
+        self.delay_seconds = delay_seconds
+        self.fail_code = fail_code
+
+    async def Predict(self, stream):
+        request = await stream.recv_message()
+        self.requests.append(request)
+        if self.delay_seconds:
+            await asyncio.sleep(self.delay_seconds)
+        if len(self.requests) <= self.fail_times:
+            raise GRPCError(Status[self.fail_code], "fake failure")
+        await stream.send_message(make_response(request))
+
+
+def start_sync_server(servicer, host='127.0.0.1', port=0, handlers=()):
+    '''Start a grpcio server (on a free port by default), returns (server, port)
+
+    `handlers` are generic rpc handlers of other services.
+    '''
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    prediction_service_pb2_grpc.add_PredictionServiceServicer_to_server(servicer, server)
+    server.add_generic_rpc_handlers(handlers)
+    port = server.add_insecure_port(f'{host}:{port}')
+    server.start()
+    return server, port
+
+
+async def start_async_server(service, host='127.0.0.1', port=0, other_services=()):
+    '''Start a grpclib server (on a free port by default), returns (server, port)'''
+    server = grpclib.server.Server([service, *other_services])
+    await server.start(host, port)
+    return server, server._server.sockets[0].getsockname()[1]
+
+
+async def stop_async_server(server):
+    server.close()
+    await server.wait_closed()
+
+
+def start_sync_servers(servicers):
+    '''Start one grpcio server per servicer on 127.0.0.1, 127.0.0.2, ... with the same port
+
+    Returns (servers, addresses, port), resolve the client host to `addresses` to use them all.
+    '''
+    servers = []
+    addresses = []
+    port = 0
+    for i, servicer in enumerate(servicers, 1):
+        address = f'127.0.0.{i}'
+        server, port = start_sync_server(servicer, address, port)
+        servers.append(server)
+        addresses.append(address)
+    return servers, addresses, port
+
+
+async def start_async_servers(services):
+    '''Async twin of `start_sync_servers`'''
+    servers = []
+    addresses = []
+    port = 0
+    for i, service in enumerate(services, 1):
+        address = f'127.0.0.{i}'
+        server, port = await start_async_server(service, address, port)
+        servers.append(server)
+        addresses.append(address)
+    return servers, addresses, port
+
+
+def resolve_to(addresses):
+    '''Patch of the system resolver resolving any host to `addresses`, e.g. of start_sync_servers'''
+    return patch('socket.gethostbyname_ex', return_value=('localhost', [], list(addresses)))
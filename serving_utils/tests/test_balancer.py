@@ -0,0 +1,407 @@
+import asyncio as aio
+from concurrent import futures
+
+import pytest
+
+from ..balancer import (
+    ConsistentHashBalancer,
+    EmptyPool,
+    LatencyAwareBalancer,
+    PowerOfTwoChoicesBalancer,
+    RoundRobinBalancer,
+)
+from ..client import Client
+from .fake_serving import (
+    FakeClock,
+    FakePredictionServicer,
+    AsyncFakePredictionService,
+    make_data,
+    make_response,
+    resolve_to,
+    start_sync_servers,
+    start_async_servers,
+    stop_async_server,
+)
+
+
+def make_pool(balancer_class, keys='abc'):
+    pool = balancer_class()
+    for key in keys:
+        pool[key] = key.upper()
+    return pool
+
+
+@pytest.mark.parametrize(
+    'balancer_class',
+    [RoundRobinBalancer, PowerOfTwoChoicesBalancer, LatencyAwareBalancer],
+)
+def test_balancer_is_a_mapping(balancer_class):
+    pool = make_pool(balancer_class, 'abcd')
+    assert len(pool) == 4
+    assert pool['b'] == 'B'
+
+    del pool['a']
+    pool['c'] = 'C2'
+    assert set(pool.keys()) == {'b', 'c', 'd'}
+    assert sorted(pool.values()) == ['B', 'C2', 'D']
+    assert {pool.pick()[0] for _ in range(30)} == {'b', 'c', 'd'}
+
+    for key in 'bcd':
+        del pool[key]
+    with pytest.raises(EmptyPool):
+        pool.pick()
+
+
+@pytest.mark.parametrize('balancer_class', [RoundRobinBalancer, PowerOfTwoChoicesBalancer])
+def test_without_calls_in_flight_picks_in_turn(balancer_class):
+    pool = make_pool(balancer_class)
+    picks = [pool.pick()[0] for _ in range(9)]
+    assert picks[:3] == picks[3:6] == picks[6:]
+    assert sorted(picks[:3]) == ['a', 'b', 'c']
+
+
+def test_power_of_two_choices_avoids_busy_connection():
+    pool = make_pool(PowerOfTwoChoicesBalancer)
+    for _ in range(5):
+        pool.started('a')
+    assert pool.in_flight('a') == 5
+
+    picks = [pool.pick()[0] for _ in range(100)]
+    assert 'a' not in picks
+
+    for _ in range(5):
+        pool.finished('a', 0.1)
+    assert 'a' in [pool.pick()[0] for _ in range(3)]
+
+    rr_pool = make_pool(RoundRobinBalancer)
+    rr_pool.started('a')
+    assert 'a' in [rr_pool.pick()[0] for _ in range(3)]
+
+
+def test_pick_exclude():
+    pool = make_pool(PowerOfTwoChoicesBalancer)
+    pool.started('b')
+    assert pool.pick(exclude=('a',)) == ('c', 'C')
+    with pytest.raises(EmptyPool):
+        pool.pick(exclude='abc')
+
+
+@pytest.mark.parametrize(
+    'balancer_class',
+    [RoundRobinBalancer, PowerOfTwoChoicesBalancer, ConsistentHashBalancer],
+)
+def test_unhealthy_connections_are_skipped(balancer_class):
+    pool = make_pool(balancer_class)
+    pool.set_healthy('a', False)
+    pool.set_healthy('z', False)
+    assert not pool.healthy('a') and pool.healthy('z')
+    assert {pool.pick()[0] for _ in range(30)} == {'b', 'c'}
+    assert {pool.pick(routing_key=i)[0] for i in range(30)} == {'b', 'c'}
+
+    # all unhealthy, all picked
+    pool.set_healthy('b', False)
+    pool.set_healthy('c', False)
+    assert {pool.pick()[0] for _ in range(30)} == {'a', 'b', 'c'}
+
+    pool.set_healthy('c', True)
+    assert {pool.pick()[0] for _ in range(30)} == {'c'}
+    del pool['a']
+    assert pool.healthy('a')
+
+
+def test_track_calls():
+    pool = make_pool(RoundRobinBalancer)
+    with pool.track('a'):
+        assert pool.in_flight('a') == 1
+    with pytest.raises(ValueError):
+        with pool.track('a'):
+            raise ValueError()
+    assert pool.in_flight('a') == 0
+
+    future = pool.track_future('b', futures.Future())
+    assert pool.in_flight('b') == 1
+    future.set_result(None)
+    assert pool.in_flight('b') == 0
+
+    # a connection removed while its call is in flight
+    future = pool.track_future('c', futures.Future())
+    del pool['c']
+    future.cancel()
+    assert pool.in_flight('c') == 0
+
+
+def record_calls(pool, k, latency_seconds, n=1, error=False):
+    for _ in range(n):
+        pool.started(k)
+        pool.finished(k, latency_seconds, error)
+
+
+def count_picks(pool, n=2000):
+    picks = [pool.pick()[0] for _ in range(n)]
+    return {k: picks.count(k) for k in pool}
+
+
+def make_latency_aware_pool(keys='ab'):
+    pool = make_pool(LatencyAwareBalancer, keys)
+    pool._clock = clock = FakeClock()
+    return pool, clock
+
+
+def test_latency_aware_routes_in_proportion_to_capacity():
+    pool, _ = make_latency_aware_pool()
+    pool.probe_probability = 0
+    record_calls(pool, 'a', 0.01)
+    record_calls(pool, 'b', 0.04)
+    assert pool.estimates('a') == pytest.approx((0.01, 0), rel=1e-3)
+
+    counts = count_picks(pool)
+    assert counts['a'] / counts['b'] == pytest.approx(4, rel=0.3)
+
+    # errors cut the capacity of b
+    record_calls(pool, 'c', 0.04, error=True)
+    pool['c'] = 'C'
+    record_calls(pool, 'c', 0.04, error=True)
+    assert pool.estimates('c')[1] == pytest.approx(1, rel=1e-3)
+    assert pool.capacity('c') < pool.capacity('b') / 20
+
+    # so do calls in flight
+    pool.started('a')
+    assert pool.capacity('a') == pytest.approx(2 * pool.capacity('b'))
+
+
+def test_latency_aware_decays_and_probes():
+    pool, clock = make_latency_aware_pool()
+    pool.decay_seconds = 0.05
+    pool.probe_probability = 0
+    record_calls(pool, 'a', 0.01)
+    record_calls(pool, 'b', 1)
+    assert pool.capacity('b') < pool.capacity('a') / 10
+
+    # stale estimates fade towards the average latency of all calls
+    clock.now += 0.3
+    latency_a, _ = pool.estimates('a')
+    latency_b, _ = pool.estimates('b')
+    assert latency_a == pytest.approx(latency_b, abs=0.005)
+    assert latency_b < 0.25
+
+    record_calls(pool, 'b', 1, n=3)
+    pool.probe_probability = 1
+    counts = count_picks(pool)
+    assert counts['b'] == pytest.approx(1000, rel=0.2)
+
+    del pool['b']
+    assert 'b' not in pool._stats
+
+
+class BlockedService(AsyncFakePredictionService):
+    '''Answers once `release` is set'''
+
+    def __init__(self):
+        super().__init__()
+        self.release = aio.Event()
+
+    async def Predict(self, stream):
+        request = await stream.recv_message()
+        self.requests.append(request)
+        await self.release.wait()
+        await stream.send_message(make_response(request))
+
+
+async def predict_while_one_connection_is_busy(balancer):
+    slow = BlockedService()
+    fast = AsyncFakePredictionService()
+    servers, addresses, port = await start_async_servers([slow, fast])
+    data = make_data()
+
+    async def predict():
+        # returns once the call is answered by fast or is in flight on slow
+        n_slow = len(slow.requests)
+        call = aio.ensure_future(client.async_predict(data))
+        while not call.done() and len(slow.requests) == n_slow:
+            await aio.sleep(0.001)
+        return call
+
+    try:
+        with resolve_to(addresses):
+            client = Client(host='localhost', port=port, balancer=balancer)
+            calls = [await predict() for _ in range(8)]
+            slow.release.set()
+            await aio.gather(*calls)
+    finally:
+        slow.release.set()
+        for server in servers:
+            await stop_async_server(server)
+    return len(slow.requests), len(fast.requests)
+
+
+@pytest.mark.asyncio
+async def test_client_power_of_two_choices():
+    assert await predict_while_one_connection_is_busy(PowerOfTwoChoicesBalancer()) == (1, 7)
+    assert await predict_while_one_connection_is_busy(RoundRobinBalancer()) == (4, 4)
+
+
+@pytest.mark.asyncio
+async def test_client_latency_aware():
+    slow = AsyncFakePredictionService(delay_seconds=0.05)
+    fast = AsyncFakePredictionService()
+    servers, addresses, port = await start_async_servers([slow, fast])
+    data = make_data()
+    try:
+        with resolve_to(addresses):
+            balancer = LatencyAwareBalancer(probe_probability=0)
+            client = Client(host='localhost', port=port, balancer=balancer)
+            for _ in range(40):
+                await client.async_predict(data)
+    finally:
+        for server in servers:
+            await stop_async_server(server)
+
+    assert len(slow.requests) <= 10
+    assert len(fast.requests) >= 30
+
+
+def route(pool, routing_keys):
+    return {routing_key: pool.pick(routing_key=routing_key)[0] for routing_key in routing_keys}
+
+
+def test_consistent_hash_moves_few_keys():
+    pool = make_pool(ConsistentHashBalancer, 'abcd')
+    routing_keys = [f'user-{i}' for i in range(2000)]
+    before = route(pool, routing_keys)
+    assert route(pool, routing_keys) == before
+
+    counts = [list(before.values()).count(k) for k in 'abcd']
+    assert min(counts) > 2000 / 4 * 0.7
+
+    pool['e'] = 'E'
+    after_add = route(pool, routing_keys)
+    moved = [key for key in routing_keys if after_add[key] != before[key]]
+    assert all(after_add[key] == 'e' for key in moved)
+    assert 0.1 < len(moved) / len(routing_keys) < 0.3
+
+    del pool['b']
+    after_remove = route(pool, routing_keys)
+    moved = [key for key in routing_keys if after_remove[key] != after_add[key]]
+    assert all(after_add[key] == 'b' for key in moved)
+
+    # hedges and retries go to the next address on the ring
+    address = pool.pick(routing_key='user-1')[0]
+    assert pool.pick(exclude=(address,), routing_key='user-1')[0] != address
+    with pytest.raises(EmptyPool):
+        pool.pick(exclude='acde', routing_key='user-1')
+
+
+def test_consistent_hash_bounded_load():
+    pool = make_pool(ConsistentHashBalancer, 'abcd')
+    plain = [pool.pick(routing_key='hot')[0] for _ in range(3)]
+    assert len(set(plain)) == 1
+
+    bounded = ConsistentHashBalancer(load_factor=1.25)
+    for key in 'abcd':
+        bounded[key] = key
+    for _ in range(20):
+        address, _ = bounded.pick(routing_key='hot')
+        bounded.started(address)
+    # at most ceil(1.25 * 20 / 4) calls in flight on the hot key's address
+    assert max(bounded.in_flight(key) for key in 'abcd') <= 7
+    assert bounded.in_flight(plain[0]) == 7
+
+    # calls without a key are balanced on calls in flight
+    assert pool.pick()[0] in 'abcd'
+    with pytest.raises(ValueError):
+        ConsistentHashBalancer(load_factor=0.5)
+
+
+def test_client_predict_with_routing_key():
+    servicers = [FakePredictionServicer(), FakePredictionServicer()]
+    servers, addresses, port = start_sync_servers(servicers)
+    data = make_data()
+    try:
+        with resolve_to(addresses):
+            client = Client(host='localhost', port=port, balancer=ConsistentHashBalancer())
+            for _ in range(5):
+                client.predict(data, routing_key='user-1')
+            assert sorted(len(servicer.requests) for servicer in servicers) == [0, 5]
+            for i in range(20):
+                client.predict(data, routing_key=f'user-{i}')
+    finally:
+        for server in servers:
+            server.stop(None)
+
+    assert min(len(servicer.requests) for servicer in servicers) >= 3
+
+
+def test_weights():
+    pool = make_pool(RoundRobinBalancer, 'ab')
+    pool.set_weight('a', 3)
+    assert pool.weight('a') == 3 and pool.weight('b') == 1
+    picks = [pool.pick()[0] for _ in range(8)]
+    assert picks.count('a') == 6
+    assert picks[:4] != ['a', 'a', 'a', 'b']  # spread out
+
+    pool['c'] = 'C'
+    assert count_picks(pool, 10) == {'a': 6, 'b': 2, 'c': 2}
+    del pool['a']
+    assert count_picks(pool, 10) == {'b': 5, 'c': 5}
+    assert pool._slots is pool._keys
+
+    with pytest.raises(ValueError):
+        pool.set_weight('b', 0)
+    with pytest.raises(KeyError):
+        pool.set_weight('a', 2)
+
+
+def test_snapshot_while_keys_change():
+    pool = make_pool(RoundRobinBalancer)
+    assert pool.snapshot() == [('a', 'A'), ('b', 'B'), ('c', 'C')]
+
+    def churn():
+        for i in range(2000):
+            pool[i] = i
+            del pool[i]
+
+    with futures.ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(churn)
+        while not future.done():
+            assert {'a', 'b', 'c'} <= {key for key, _ in pool.snapshot()}
+        future.result()
+
+
+@pytest.mark.parametrize('weights', [(10, 15), (2, 3), (1, 1.4), (1, 100, 1000), (0.5, 0.5)])
+def test_weight_ratios(weights):
+    keys = 'abc'[:len(weights)]
+    pool = make_pool(RoundRobinBalancer, keys)
+    for key, weight in zip(keys, weights):
+        pool.set_weight(key, weight)
+    n = len(pool._slots)
+    counts = count_picks(pool, n)
+    for key, weight in zip(keys, weights):
+        assert counts[key] / n == pytest.approx(weight / sum(weights), abs=1 / pool.MAX_SLOTS)
+
+
+def test_power_of_two_choices_weights():
+    pool = make_pool(PowerOfTwoChoicesBalancer, 'ab')
+    pool.set_weight('a', 4)
+    for _ in range(3):
+        pool.started('a')
+    # 3 calls in flight on 4 times the capacity of b
+    pool.started('b')
+    assert {pool.pick()[0] for _ in range(20)} == {'a'}
+    assert pool.pick(exclude=('c',))[0] == 'a'
+
+
+def test_consistent_hash_weights():
+    pool = make_pool(ConsistentHashBalancer, 'ab')
+    pool.set_weight('a', 3)
+    routing_keys = [f'user-{i}' for i in range(2000)]
+    shares = list(route(pool, routing_keys).values())
+    assert shares.count('a') / len(shares) == pytest.approx(0.75, abs=0.08)
+
+    bounded = ConsistentHashBalancer(load_factor=1)
+    for key in 'ab':
+        bounded[key] = key
+    bounded.set_weight('a', 3)
+    for _ in range(8):
+        address, _ = bounded.pick(routing_key='hot')
+        bounded.started(address)
+    assert (bounded.in_flight('a'), bounded.in_flight('b')) == (6, 2)
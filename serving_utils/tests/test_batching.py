@@ -0,0 +1,351 @@
+import asyncio as aio
+from concurrent import futures
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from ..batching import AsyncBatcher, BatchingPolicy, ThreadBatcher
+from ..client import Client, RetryFailed
+from .fake_serving import (
+    FakePredictionServicer,
+    AsyncFakePredictionService,
+    start_sync_server,
+    start_async_server,
+    stop_async_server,
+)
+
+
+class FakeSend:
+
+    def __init__(self, error=None):
+        self.requests = []
+        self.deadlines = []
+        self.error = error
+
+    async def __call__(self, data, output_names, model_name, model_signature_name, deadline):
+        self.requests.append((data, output_names, model_name, model_signature_name))
+        self.deadlines.append(deadline)
+        await aio.sleep(0)
+        if self.error is not None:
+            raise self.error
+        return {'c': data['a'] + 2 * data['b']}
+
+
+SCALARS = {'a': np.float32(1), 'b': np.float32(2)}
+
+
+def make_data(n_rows, value=1, width=3):
+    a = np.full((n_rows, width), value, dtype=np.float32)
+    return {'a': a, 'b': np.ones_like(a)}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_are_merged_into_one_request():
+    send = FakeSend()
+    policy = BatchingPolicy(max_batch_size=8, max_wait_seconds=10)
+    batcher = AsyncBatcher(send, policy, aio.get_event_loop())
+
+    results = await aio.gather(*[
+        batcher.predict(make_data(1, value=i), ['c'], 'm', 's') for i in range(8)
+    ])
+
+    assert len(send.requests) == 1
+    data, output_names, model_name, model_signature_name = send.requests[0]
+    assert data['a'].shape == (8, 3)
+    assert (output_names, model_name, model_signature_name) == (['c'], 'm', 's')
+    for i, result in enumerate(results):
+        np.testing.assert_array_equal(result['c'], np.full((1, 3), i + 2))
+    assert batcher.batch_count == 1
+    assert batcher.call_count == 8
+    assert batcher.mean_batch_size == 8
+
+
+@pytest.mark.asyncio
+async def test_flush_after_max_wait_and_max_batch_size():
+    send = FakeSend()
+    policy = BatchingPolicy(max_batch_size=4, max_wait_seconds=0.01)
+    batcher = AsyncBatcher(send, policy, aio.get_event_loop())
+
+    results = await aio.gather(*[batcher.predict(make_data(3), None, 'm', None) for _ in range(3)])
+
+    # 3 + 3 > 4, so every call ends up in its own batch
+    assert [len(data['a']) for data, *_ in send.requests] == [3, 3, 3]
+    assert all(result['c'].shape == (3, 3) for result in results)
+
+    send.requests.clear()
+    await aio.gather(*[batcher.predict(make_data(1), None, 'm', None) for _ in range(3)])
+    assert [len(data['a']) for data, *_ in send.requests] == [3]
+
+
+@pytest.mark.asyncio
+async def test_incompatible_calls_are_not_merged():
+    send = FakeSend()
+    batcher = AsyncBatcher(send, BatchingPolicy(max_wait_seconds=0.01), aio.get_event_loop())
+
+    await aio.gather(
+        batcher.predict(make_data(1, width=3), None, 'm', None),
+        batcher.predict(make_data(1, width=4), None, 'm', None),
+        batcher.predict(make_data(1), None, 'other', None),
+        batcher.predict(make_data(1), ['c'], 'm', None),
+        batcher.predict({'a': np.float32(1), 'b': np.float32(1)}, None, 'm', None),
+    )
+
+    assert len(send.requests) == 5
+
+
+@pytest.mark.asyncio
+async def test_padding_variable_length_inputs():
+    send = FakeSend()
+    policy = BatchingPolicy(max_wait_seconds=0.01, pad_values={'a': -1, 'b': 0})
+    batcher = AsyncBatcher(send, policy, aio.get_event_loop())
+
+    short, long = await aio.gather(
+        batcher.predict(make_data(1, width=2), None, 'm', None),
+        batcher.predict(make_data(2, width=4), None, 'm', None),
+    )
+
+    assert len(send.requests) == 1
+    np.testing.assert_array_equal(
+        send.requests[0][0]['a'],
+        [[1, 1, -1, -1], [1, 1, 1, 1], [1, 1, 1, 1]],
+    )
+    np.testing.assert_array_equal(short['c'], [[3, 3, -1, -1]])
+    assert long['c'].shape == (2, 4)
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_caller():
+    send = FakeSend(error=RuntimeError("boom"))
+    batcher = AsyncBatcher(send, BatchingPolicy(max_wait_seconds=0.01), aio.get_event_loop())
+
+    results = await aio.gather(
+        *[batcher.predict(make_data(1), None, 'm', None) for _ in range(3)],
+        return_exceptions=True,
+    )
+
+    assert len(send.requests) == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_cancelling_one_caller_keeps_the_batch():
+    send = FakeSend()
+    batcher = AsyncBatcher(send, BatchingPolicy(max_wait_seconds=0.01), aio.get_event_loop())
+
+    cancelled = aio.ensure_future(batcher.predict(make_data(1, value=5), None, 'm', None))
+    kept = aio.ensure_future(batcher.predict(make_data(1, value=7), None, 'm', None))
+    await aio.sleep(0)
+    cancelled.cancel()
+
+    result = await kept
+    np.testing.assert_array_equal(result['c'], np.full((1, 3), 9))
+    assert cancelled.cancelled()
+    assert send.requests[0][0]['a'].shape == (1, 3)
+
+
+@pytest.mark.asyncio
+async def test_unsplittable_outputs():
+
+    async def send(data, *_, **__):
+        return {'c': np.float32(1)}
+
+    batcher = AsyncBatcher(send, BatchingPolicy(max_wait_seconds=0.01), aio.get_event_loop())
+    with pytest.raises(ValueError):
+        await batcher.predict(make_data(1), None, 'm', None)
+
+
+@pytest.mark.asyncio
+async def test_client_async_predict_with_batching():
+    service = AsyncFakePredictionService()
+    server, port = await start_async_server(service)
+    try:
+        client = Client(
+            host='127.0.0.1',
+            port=port,
+            batching=BatchingPolicy(max_batch_size=16, max_wait_seconds=0.05),
+        )
+        results = await aio.gather(*[
+            client.async_predict(make_data(1, value=i), output_names=['c'], model_name='m')
+            for i in range(16)
+        ])
+    finally:
+        await stop_async_server(server)
+
+    assert len(service.requests) == 1
+    assert list(service.requests[0].output_filter) == ['c']
+    for i, result in enumerate(results):
+        np.testing.assert_array_equal(result['c'], np.full((1, 3), i + 2))
+        assert not result['c'].flags.writeable
+    assert client.async_batcher.mean_batch_size == 16
+
+
+class FakeSyncSend:
+
+    def __init__(self, error=None):
+        self.requests = []
+        self.deadlines = []
+        self.error = error
+        self.lock = threading.Lock()
+
+    def __call__(self, data, output_names, model_name, model_signature_name, deadline):
+        with self.lock:
+            self.requests.append((data, output_names, model_name, model_signature_name))
+            self.deadlines.append(deadline)
+        if self.error is not None:
+            raise self.error
+        return {'c': data['a'] + 2 * data['b']}
+
+
+def predict_from_threads(batcher, datas, output_names=None, model_name='m', deadlines=None):
+    barrier = threading.Barrier(len(datas))
+
+    def predict(data, deadline):
+        barrier.wait()
+        return batcher.predict(data, output_names, model_name, None, deadline)
+
+    with futures.ThreadPoolExecutor(max_workers=len(datas)) as executor:
+        fs = [
+            executor.submit(predict, data, deadline)
+            for data, deadline in zip(datas, deadlines or [None] * len(datas))
+        ]
+        return [f.exception() or f.result() for f in fs]
+
+
+def test_thread_batcher_merges_concurrent_calls():
+    send = FakeSyncSend()
+    batcher = ThreadBatcher(send, BatchingPolicy(max_batch_size=8, max_wait_seconds=10))
+
+    results = predict_from_threads(batcher, [make_data(1, value=i) for i in range(8)])
+    batcher.close()
+
+    assert len(send.requests) == 1
+    assert send.requests[0][0]['a'].shape == (8, 3)
+    for i, result in enumerate(results):
+        np.testing.assert_array_equal(result['c'], np.full((1, 3), i + 2))
+    assert batcher.batch_sizes == {8: 1}
+    assert batcher.mean_batch_size == 8
+
+
+def test_thread_batcher_flushes_after_max_wait():
+    send = FakeSyncSend()
+    batcher = ThreadBatcher(send, BatchingPolicy(max_batch_size=100, max_wait_seconds=0.05))
+
+    results = predict_from_threads(batcher, [make_data(2) for _ in range(3)])
+    single = batcher.predict(make_data(1), None, 'm', None)
+    batcher.close()
+
+    assert sum(len(data['a']) for data, *_ in send.requests) == 7
+    assert len(send.requests) <= 2
+    assert all(result['c'].shape == (2, 3) for result in results)
+    assert single['c'].shape == (1, 3)
+    assert batcher.call_count == 4
+
+
+def test_thread_batcher_errors_reach_every_caller():
+    send = FakeSyncSend(error=RuntimeError("boom"))
+    batcher = ThreadBatcher(send, BatchingPolicy(max_batch_size=4, max_wait_seconds=10))
+
+    results = predict_from_threads(batcher, [make_data(1) for _ in range(4)])
+    batcher.close()
+
+    assert len(send.requests) == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_thread_batcher_unbatchable_and_closed():
+    send = FakeSyncSend()
+    batcher = ThreadBatcher(send, BatchingPolicy())
+
+    batcher.predict({'a': np.float32(1), 'b': np.float32(2)}, None, 'm', None)
+    assert batcher.batch_count == 0
+    assert len(send.requests) == 1
+
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.predict(make_data(1), None, 'm', None)
+
+
+def test_thread_batcher_deadlines():
+    send = FakeSyncSend()
+    batcher = ThreadBatcher(send, BatchingPolicy(max_batch_size=2, max_wait_seconds=10))
+
+    now = time.monotonic()
+    predict_from_threads(batcher, [make_data(1), make_data(1)], deadlines=[now + 5, now + 9])
+    predict_from_threads(batcher, [make_data(1), make_data(1)], deadlines=[now + 5, None])
+    batcher.predict({'a': np.float32(1), 'b': np.float32(2)}, None, 'm', None, now + 3)
+    # the batch ends with its latest call, unbatched calls with their own
+    assert send.deadlines == [now + 9, None, now + 3]
+
+    start = time.monotonic()
+    with pytest.raises(futures.TimeoutError):
+        batcher.predict(make_data(1), None, 'm', None, start + 0.05)
+    assert time.monotonic() - start < 1
+    batcher.close()
+    # the call that gave up was not sent
+    assert len(send.requests) == 3
+
+
+def test_client_predict_with_batching():
+    servicer = FakePredictionServicer()
+    server, port = start_sync_server(servicer)
+    try:
+        client = Client(
+            host='127.0.0.1',
+            port=port,
+            batching=BatchingPolicy(max_batch_size=8, max_wait_seconds=1),
+        )
+        results = predict_from_threads(client, [make_data(1, value=i) for i in range(8)], ['c'])
+        dispatcher = client.sync_batcher._dispatcher
+        client.close()
+        assert not dispatcher.is_alive()
+        with pytest.raises(RuntimeError):
+            client.sync_batcher.predict(make_data(1), None, 'm', None)
+    finally:
+        server.stop(None)
+
+    assert len(servicer.requests) == 1
+    for i, result in enumerate(results):
+        np.testing.assert_array_equal(result['c'], np.full((1, 3), i + 2))
+
+
+def test_client_predict_timeout_with_batching():
+    servicer = FakePredictionServicer(delay_seconds=0.3)
+    server, port = start_sync_server(servicer)
+    try:
+        client = Client(
+            host='127.0.0.1',
+            port=port,
+            batching=BatchingPolicy(max_batch_size=8, max_wait_seconds=1),
+        )
+        # waiting for the batch to fill, the request of the batch or a call not batched
+        for data, timeout in [(make_data(1), 0.1), (make_data(8), 0.1), (SCALARS, 0.1)]:
+            start = time.monotonic()
+            with pytest.raises(RetryFailed):
+                client.predict(data, timeout=timeout)
+            assert time.monotonic() - start < 0.3
+        client.close()
+    finally:
+        server.stop(None)
+
+    assert len(servicer.requests) <= 2
+
+
+@pytest.mark.asyncio
+async def test_client_async_predict_timeout_with_batching():
+    service = AsyncFakePredictionService(delay_seconds=0.3)
+    server, port = await start_async_server(service)
+    try:
+        client = Client(
+            host='127.0.0.1',
+            port=port,
+            batching=BatchingPolicy(max_batch_size=8, max_wait_seconds=1),
+        )
+        for data in [make_data(1), make_data(8), SCALARS]:
+            start = time.monotonic()
+            with pytest.raises(RetryFailed):
+                await client.async_predict(data, timeout=0.1)
+            assert time.monotonic() - start < 0.3
+    finally:
+        await stop_async_server(server)
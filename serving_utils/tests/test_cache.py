@@ -0,0 +1,205 @@
+import time
+
+import numpy as np
+import pytest
+
+from ..cache import (
+    ResponseCache,
+    RowCache,
+    batch_arrays,
+    make_cache_key,
+    make_row_cache_keys,
+    merge_rows,
+)
+from ..client import Client, PredictInput
+from .fake_serving import (
+    FakePredictionServicer,
+    AsyncFakePredictionService,
+    start_sync_server,
+    start_async_server,
+    stop_async_server,
+)
+
+
+def test_make_cache_key():
+    data = {'a': np.arange(4, dtype=np.int32), 'b': np.array([b'x', b'yz'])}
+    key = make_cache_key(data, ['c'], 'm', 's')
+
+    assert key == make_cache_key(
+        {'b': np.array([b'x', b'yz']), 'a': np.arange(4, dtype=np.int32)}, ['c'], 'm', 's')
+    assert key == make_cache_key(
+        {'a': np.arange(4, dtype=np.int32), 'b': np.array(['x', 'yz'])},
+        ['c'], 'm', 's',
+    )
+    different = [
+        make_cache_key(data, ['d'], 'm', 's'),
+        make_cache_key(data, None, 'm', 's'),
+        make_cache_key(data, ['c'], 'n', 's'),
+        make_cache_key(data, ['c'], 'm', None),
+        make_cache_key({**data, 'a': np.arange(4, dtype=np.int64)}, ['c'], 'm', 's'),
+        make_cache_key({**data, 'a': np.arange(4, dtype=np.int32).reshape(2, 2)}, ['c'], 'm', 's'),
+        make_cache_key({**data, 'a': np.arange(1, 5, dtype=np.int32)}, ['c'], 'm', 's'),
+        make_cache_key({**data, 'b': np.array([b'xy', b'z'])}, ['c'], 'm', 's'),
+    ]
+    assert len(set(different + [key])) == len(different) + 1
+
+
+def test_cache_lru_eviction_by_entries_and_bytes():
+    cache = ResponseCache(max_entries=2, max_bytes=100)
+    cache.put(b'1', {'c': np.zeros(4, np.float32)})
+    cache.put(b'2', {'c': np.zeros(4, np.float32)})
+    assert cache.get(b'1') is not None  # 1 is now the most recently used
+    cache.put(b'3', {'c': np.zeros(4, np.float32)})
+
+    assert cache.get(b'2') is None
+    assert cache.get(b'1') is not None
+    assert cache.evictions == 1
+
+    cache.put(b'4', {'c': np.zeros(20, np.float32)})  # 80 bytes
+    assert len(cache) == 2
+    assert cache.nbytes == 96
+    assert cache.evictions == 2
+
+    cache.put(b'5', {'c': np.zeros(100, np.float32)})  # larger than the cache
+    assert cache.get(b'5') is None
+    assert cache.hits == 2
+    assert cache.misses == 2
+    assert cache.hit_rate == 0.5
+
+
+def test_cache_ttl_and_read_only():
+    cache = ResponseCache(ttl_seconds=0.05)
+    original = np.arange(3)
+    stored = cache.put(b'k', {'c': original})
+
+    original[0] = 100
+    cached = cache.get(b'k')['c']
+    assert cached is stored['c']
+    stored['c'] = None
+    assert cache.get(b'k')['c'] is cached
+    np.testing.assert_array_equal(cached, [0, 1, 2])
+    with pytest.raises(ValueError):
+        cached[0] = 1
+
+    time.sleep(0.06)
+    assert cache.get(b'k') is None
+    assert len(cache) == 0
+
+
+def test_client_predict_with_cache():
+    servicer = FakePredictionServicer()
+    server, port = start_sync_server(servicer)
+    try:
+        client = Client(host='127.0.0.1', port=port, cache=ResponseCache())
+        data = {'a': np.ones((2, 2), np.float32), 'b': np.ones((2, 2), np.float32)}
+        first = client.predict(data, output_names=['c'])
+        first_c = first['c']
+        first['c'] = 'changed'
+        first['extra'] = 1
+        second = client.predict(dict(data), output_names=['c'])
+        second.pop('c')
+        third = client.predict(
+            [PredictInput('a', data['a']), PredictInput('b', data['b'])], output_names=['c'])
+        client.predict(data, output_names=['c'], model_name='other')
+    finally:
+        server.stop(None)
+
+    assert len(servicer.requests) == 2
+    # changing the dict of a result does not change the next hits
+    assert list(third) == ['c'] and third['c'] is first_c
+    assert not first_c.flags.writeable
+    assert client.cache.hits == 2
+    assert client.cache.misses == 2
+
+
+@pytest.mark.asyncio
+async def test_client_async_predict_with_cache():
+    service = AsyncFakePredictionService()
+    server, port = await start_async_server(service)
+    try:
+        client = Client(host='127.0.0.1', port=port, cache=ResponseCache())
+        plan = client.compile_request(output_names=['c'])
+        data = {'a': np.ones((2, 2), np.float32), 'b': np.ones((2, 2), np.float32)}
+        await client.async_predict(data, output_names=['c'])
+        outputs = await client.async_predict(data, plan=plan)
+    finally:
+        await stop_async_server(server)
+
+    assert len(service.requests) == 1
+    np.testing.assert_array_equal(outputs['c'], np.full((2, 2), 3))
+
+
+def test_row_cache_keys_and_merge():
+    arrays = batch_arrays({'a': [[1, 2], [3, 4], [1, 2]], 'b': np.array([b'x', b'y', b'x'])})
+    keys = make_row_cache_keys(arrays, ['c'], 'm', None)
+    assert len(keys) == 3
+    assert keys[0] == keys[2] != keys[1]
+    assert keys[1] == make_row_cache_keys(
+        batch_arrays({'b': [b'y'], 'a': [[3, 4]]}), ['c'], 'm', None)[0]
+    assert keys[0] != make_row_cache_keys(arrays, ['c'], 'other', None)[0]
+
+    assert batch_arrays({'a': np.zeros(3), 'b': np.zeros(2)}) is None
+    assert batch_arrays({'a': np.float32(1)}) is None
+    assert batch_arrays({'a': np.zeros((0, 2))}) is None
+
+    cache = RowCache(max_bytes=16)
+    cache.put_rows([b'1', b'2'], {'c': np.array([[1, 1], [2, 2]], np.int32)})
+    with pytest.raises(ValueError):
+        cache.put_rows([b'3'], {'c': np.zeros((2, 2))})
+    cached_rows = cache.get_rows([b'2', b'3', b'1', b'3'])
+    assert cached_rows[1] is None
+    merged = merge_rows(cached_rows, {'c': np.array([[3, 3]], np.int32)}, {1: 0, 3: 0})
+    np.testing.assert_array_equal(merged['c'], [[2, 2], [3, 3], [1, 1], [3, 3]])
+    assert merged['c'].dtype == np.int32
+    assert cache.hit_rate == 0.5
+
+    cache.put_rows([b'3', b'4'], {'c': np.zeros((2, 2), np.int32)})
+    assert cache.nbytes == 16
+    assert cache.evictions == 2
+
+
+def test_client_predict_with_row_cache():
+    servicer = FakePredictionServicer()
+    server, port = start_sync_server(servicer)
+    try:
+        client = Client(host='127.0.0.1', port=port, row_cache=RowCache())
+        a = np.arange(8, dtype=np.float32).reshape(4, 2)
+        b = np.ones((4, 2), np.float32)
+        first = client.predict({'a': a[:2], 'b': b[:2]}, output_names=['c'])
+        first['c'][0] = -1
+        first['extra'] = 1
+        second = client.predict(
+            {'a': a[[3, 1, 2, 0, 3]], 'b': np.ones((5, 2), np.float32)}, output_names=['c'])
+        third = client.predict({'a': a[[1, 0]], 'b': b[:2]}, output_names=['c'])
+    finally:
+        server.stop(None)
+
+    np.testing.assert_array_equal(second['c'], a[[3, 1, 2, 0, 3]] + 2)
+    np.testing.assert_array_equal(third['c'], a[[1, 0]] + 2)
+    assert list(third) == ['c']
+    # the second call only sends rows 3 and 2, once each
+    assert len(servicer.requests) == 2
+    assert list(servicer.requests[1].inputs['a'].tensor_shape.dim)[0].size == 2
+    assert client.row_cache.hits == 2 + 2
+    assert client.row_cache.misses == 2 + 3
+
+
+@pytest.mark.asyncio
+async def test_client_async_predict_with_row_cache():
+    service = AsyncFakePredictionService()
+    server, port = await start_async_server(service)
+    try:
+        client = Client(host='127.0.0.1', port=port, row_cache=RowCache())
+        plan = client.compile_request(output_names=['c'])
+        a = np.arange(6, dtype=np.float32).reshape(3, 2)
+        b = np.ones((3, 2), np.float32)
+        await client.async_predict({'a': a[:2], 'b': b[:2]}, plan=plan)
+        outputs = await client.async_predict({'a': a, 'b': b}, plan=plan)
+        scalar = await client.async_predict({'a': np.float32(1), 'b': np.float32(1)}, plan=plan)
+    finally:
+        await stop_async_server(server)
+
+    assert len(service.requests) == 3
+    np.testing.assert_array_equal(outputs['c'], a + 2)
+    assert scalar['c'] == 3
+    assert client.row_cache.hit_rate == 2 / 5
@@ -0,0 +1,172 @@
+import grpc
+from grpclib.const import Status
+from grpclib.exceptions import GRPCError
+import pytest
+
+from ..balancer import PowerOfTwoChoicesBalancer, RoundRobinBalancer
+from ..circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreakerPolicy,
+    OutlierDetector,
+)
+from ..client import Client, _is_connection_error
+from .fake_serving import (
+    FakeClock,
+    FakePredictionServicer,
+    make_data,
+    resolve_to,
+    start_sync_servers,
+)
+
+
+def make_detector(**kwargs):
+    detector = OutlierDetector(CircuitBreakerPolicy(**kwargs))
+    detector._clock = clock = FakeClock()
+    return detector, clock
+
+
+def fail(detector, k, n=1, n_keys=4, error=True):
+    for _ in range(n):
+        detector.started(k)
+        detector.finished(k, error, n_keys)
+
+
+def test_consecutive_failures_eject_with_growing_backoff():
+    detector, clock = make_detector(consecutive_failures=3, base_ejection_seconds=1)
+    fail(detector, 'a', 2)
+    fail(detector, 'a', error=False)
+    fail(detector, 'a', 2)
+    assert detector.state('a') == CLOSED
+    fail(detector, 'a')
+    assert detector.state('a') == OPEN
+    assert detector.unavailable() == {'a'}
+
+    # half-open after the ejection period, one probe at a time
+    clock.now = 1
+    assert detector.unavailable() == set()
+    assert detector.state('a') == HALF_OPEN
+    detector.started('a')
+    assert detector.unavailable() == {'a'}
+
+    # a failed probe ejects for twice as long
+    detector.finished('a', True, 4)
+    assert detector.state('a') == OPEN
+    clock.now = 2.9
+    assert detector.unavailable() == {'a'}
+    clock.now = 3
+    assert detector.unavailable() == set()
+
+    # a cancelled probe lets another one go
+    detector.started('a')
+    detector.finished('a', None, 4)
+    assert detector.unavailable() == set()
+    fail(detector, 'a', error=False)
+    assert detector.state('a') == CLOSED
+    assert detector.ejection_count == 2
+
+
+def test_error_rate_ejects():
+    detector, _ = make_detector(
+        consecutive_failures=100, error_rate=0.5, window_size=10, min_calls=6)
+    for _ in range(2):
+        fail(detector, 'a', error=False)
+        fail(detector, 'a')
+    assert detector.state('a') == CLOSED
+    fail(detector, 'a', error=False)
+    fail(detector, 'a')
+    assert detector.state('a') == OPEN
+
+    for _ in range(20):
+        fail(detector, 'b', error=False)
+        fail(detector, 'b')
+        fail(detector, 'b', error=False)
+    assert detector.state('b') == CLOSED
+
+    with pytest.raises(ValueError):
+        CircuitBreakerPolicy(error_rate=0)
+
+
+def test_max_ejection_fraction():
+    detector, _ = make_detector(consecutive_failures=1, max_ejection_fraction=0.5)
+    for k in 'abcd':
+        fail(detector, k, n_keys=4)
+    assert detector.unavailable() == {'a', 'b'}
+
+    # the last connection is never ejected
+    detector, _ = make_detector(consecutive_failures=1, max_ejection_fraction=1)
+    fail(detector, 'a', n_keys=1)
+    assert detector.unavailable() == set()
+    fail(detector, 'a', n_keys=2)
+    assert detector.unavailable() == {'a'}
+
+
+def test_balancer_skips_ejected_connections():
+    pool = RoundRobinBalancer()
+    for k in 'abc':
+        pool[k] = k.upper()
+    pool.outlier_detector, clock = make_detector(consecutive_failures=2)
+    pool.error_filter = lambda e: not isinstance(e, KeyError)
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            with pool.track('b'):
+                raise ValueError()
+    with pytest.raises(KeyError):
+        with pool.track('c'):
+            raise KeyError()
+    assert {pool.pick()[0] for _ in range(10)} == {'a', 'c'}
+    assert pool.pick(exclude=('a',))[0] == 'c'
+
+    clock.now = 10
+    picks = [pool.pick()[0] for _ in range(3)]
+    assert 'b' in picks
+    pool.started('b')
+    assert {pool.pick()[0] for _ in range(10)} == {'a', 'c'}
+    pool.finished('b', 0.01)
+    assert {pool.pick()[0] for _ in range(10)} == {'a', 'b', 'c'}
+
+    del pool['b']
+    assert 'b' not in pool.outlier_detector._breakers
+
+
+def test_is_connection_error():
+    assert _is_connection_error(GRPCError(Status.UNAVAILABLE, ''))
+    assert not _is_connection_error(GRPCError(Status.INVALID_ARGUMENT, ''))
+    assert _is_connection_error(ValueError())
+
+    class RpcError(grpc.RpcError):
+        def __init__(self, code):
+            self._code = code
+
+        def code(self):
+            return self._code
+
+    assert _is_connection_error(RpcError(grpc.StatusCode.DEADLINE_EXCEEDED))
+    assert not _is_connection_error(RpcError(grpc.StatusCode.NOT_FOUND))
+
+
+def test_client_ejects_failing_replica():
+    bad = FakePredictionServicer(fail_times=1000)
+    good = FakePredictionServicer()
+    servers, addresses, port = start_sync_servers([bad, good])
+    data = make_data()
+    try:
+        with resolve_to(addresses):
+            client = Client(
+                host='localhost',
+                port=port,
+                balancer=PowerOfTwoChoicesBalancer(),
+                circuit_breaker=CircuitBreakerPolicy(
+                    consecutive_failures=2, base_ejection_seconds=60),
+            )
+            for _ in range(20):
+                client.predict(data)
+    finally:
+        for server in servers:
+            server.stop(None)
+
+    assert len(bad.requests) == 2
+    assert len(good.requests) == 20
+    assert client._pool.outlier_detector.state(addresses[0]) == OPEN
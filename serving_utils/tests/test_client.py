@@ -214,7 +214,7 @@ async def test_model_not_found_error_passes_through_async_predict():
     # pyserving will send this kind of error when there is no such model
     expected_exception = create_grpc_error("NOT_FOUND", "Model XXX not found", sync=False)
 
-    def server_fails_to_Predict_because_model_doesnt_exist(request):
+    def server_fails_to_Predict_because_model_doesnt_exist(request, timeout=None):
         raise expected_exception
 
     mock_logger = mock.Mock()
@@ -278,7 +278,7 @@ async def test_model_not_found_error_passes_through_sync_predict():
     expected_exception = create_grpc_error("NOT_FOUND", "Model XXX not found", sync=True)
     assert isinstance(expected_exception, grpc.RpcError)
 
-    def server_fails_to_Predict_because_model_doesnt_exist(request):
+    def server_fails_to_Predict_because_model_doesnt_exist(request, timeout=None):
         raise expected_exception
 
     mock_logger = mock.Mock()
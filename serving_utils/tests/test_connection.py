@@ -0,0 +1,165 @@
+import asyncio as aio
+import os
+from unittest.mock import patch
+
+import pytest
+
+from .. import client as client_module
+from ..client import Client, Connection
+from ..resolver import StaticResolver
+from .fake_serving import (
+    FakePredictionServicer,
+    AsyncFakePredictionService,
+    make_data,
+    start_sync_server,
+    start_async_server,
+    stop_async_server,
+)
+
+
+def connections_to(port):
+    '''Established TCP connections (IPv4 or IPv4-mapped IPv6) to `port`'''
+    if not os.path.exists('/proc/net/tcp'):
+        pytest.skip("needs /proc/net/tcp")
+    count = 0
+    for path in ['/proc/net/tcp', '/proc/net/tcp6']:
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            next(f)
+            for line in f:
+                _, _, remote, state = line.split()[:4]
+                if state == '01' and int(remote.split(':')[1], 16) == port:
+                    count += 1
+    return count
+
+
+def test_connection_modes():
+    with patch.object(client_module, 'Channel') as mock_channel:
+        with patch.object(client_module.grpc, 'insecure_channel') as mock_insecure_channel:
+            conn = Connection('127.0.0.1', 8500, mode='sync')
+            assert not mock_channel.called
+            assert mock_insecure_channel.call_count == 1
+            with pytest.raises(ValueError):
+                conn.async_stub
+
+            conn = Connection('127.0.0.1', 8500, mode='lazy')
+            assert mock_insecure_channel.call_count == 1
+            conn.sync_stub
+            conn.sync_serialized_stub
+            assert mock_insecure_channel.call_count == 2
+            assert not mock_channel.called
+            conn.async_stub
+            assert mock_channel.call_count == 1
+
+    with pytest.raises(ValueError):
+        Connection('127.0.0.1', 8500, mode='both')
+
+
+def test_sync_mode_opens_no_async_socket():
+    servicer = FakePredictionServicer()
+    server, port = start_sync_server(servicer)
+    try:
+        with patch.object(client_module, 'Channel', wraps=client_module.Channel) as mock_channel:
+            client = Client(
+                host=None,
+                port=port,
+                resolver=StaticResolver(['127.0.0.1']),
+                channel_mode='sync',
+            )
+            assert connections_to(port) == 0
+            for _ in range(3):
+                client.predict(make_data())
+            assert connections_to(port) == 1
+        assert not mock_channel.called
+        with pytest.raises(ValueError):
+            client.get_round_robin_stub(is_async_stub=True)
+    finally:
+        server.stop(None)
+
+
+@pytest.mark.asyncio
+async def test_async_mode_opens_no_sync_socket():
+    service = AsyncFakePredictionService()
+    server, port = await start_async_server(service)
+    try:
+        with patch.object(
+            client_module.grpc, 'insecure_channel', wraps=client_module.grpc.insecure_channel,
+        ) as mock_insecure_channel:
+            client = Client(
+                host=None,
+                port=port,
+                resolver=StaticResolver(['127.0.0.1']),
+                channel_mode='async',
+            )
+            for _ in range(3):
+                await client.async_predict(make_data())
+            assert connections_to(port) == 1
+        assert not mock_insecure_channel.called
+        with pytest.raises(ValueError):
+            client.predict(make_data())
+    finally:
+        await stop_async_server(server)
+
+
+def test_connection_channels():
+    with patch.object(client_module.grpc, 'insecure_channel') as mock_insecure_channel:
+        conn = Connection(
+            '127.0.0.1', 8500, channel_options=[('a', 1)], mode='sync', n_channels=3)
+        assert mock_insecure_channel.call_count == 3
+        mock_insecure_channel.assert_called_with(
+            '127.0.0.1:8500',
+            options=[('a', 1), ('grpc.use_local_subchannel_pool', 1)],
+        )
+        assert conn.sync_stub is conn.channels()[0].stub
+
+    busy = conn.pick_channel()
+    with busy.track():
+        second = conn.pick_channel()
+        assert second is not busy
+        with second.track():
+            assert conn.pick_channel() not in (busy, second)
+    assert busy.in_flight == second.in_flight == 0
+
+    with pytest.raises(ValueError):
+        Connection('127.0.0.1', 8500, n_channels=0)
+
+
+def test_client_spreads_calls_over_channels():
+    servicer = FakePredictionServicer(delay_seconds=0.2)
+    server, port = start_sync_server(servicer)
+    try:
+        client = Client(
+            host=None,
+            port=port,
+            resolver=StaticResolver(['127.0.0.1']),
+            channel_mode='sync',
+            channels_per_address=2,
+        )
+        list(client.predict_many([make_data()] * 4, concurrency=4))
+        assert connections_to(port) == 2
+        for channel in client._pool['127.0.0.1'].channels():
+            channel.channel.close()
+    finally:
+        server.stop(None)
+
+
+@pytest.mark.asyncio
+async def test_async_client_spreads_calls_over_channels():
+    service = AsyncFakePredictionService(delay_seconds=0.1)
+    server, port = await start_async_server(service)
+    try:
+        client = Client(
+            host=None,
+            port=port,
+            resolver=StaticResolver(['127.0.0.1']),
+            channel_mode='async',
+            channels_per_address=3,
+        )
+        await aio.gather(*[client.async_predict(make_data()) for _ in range(6)])
+        assert connections_to(port) == 3
+        for channel in client._pool['127.0.0.1'].channels(is_async=True):
+            assert channel.in_flight == 0
+            channel.channel.close()
+    finally:
+        await stop_async_server(server)
@@ -0,0 +1,143 @@
+import asyncio as aio
+import time
+
+import grpc
+import numpy as np
+import pytest
+
+from ..client import Client, RetryFailed
+from ..retry import RetryPolicy
+from .fake_serving import (
+    FakePredictionServicer,
+    AsyncFakePredictionService,
+    make_data,
+    make_response,
+    resolve_to,
+    start_sync_server,
+    start_async_server,
+    start_sync_servers,
+    stop_async_server,
+)
+
+
+class TimedServicer(FakePredictionServicer):
+    '''Records the time left to the deadline of each request'''
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.time_remaining = []
+
+    def Predict(self, request, context):
+        self.time_remaining.append(context.time_remaining())
+        return super().Predict(request, context)
+
+
+class CancellableService(AsyncFakePredictionService):
+    '''Records the time left to the deadline of each request and the cancelled ones'''
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.time_remaining = []
+        self.cancelled = 0
+
+    async def Predict(self, stream):
+        deadline = stream.deadline
+        self.time_remaining.append(None if deadline is None else deadline.time_remaining())
+        try:
+            await aio.sleep(self.delay_seconds)
+        except aio.CancelledError:
+            self.cancelled += 1
+            raise
+        request = await stream.recv_message()
+        self.requests.append(request)
+        await stream.send_message(make_response(request))
+
+
+def test_predict_timeout():
+    servicer = TimedServicer(delay_seconds=0.3)
+    server, port = start_sync_server(servicer)
+    try:
+        client = Client(host='127.0.0.1', port=port, timeout_seconds=0.1)
+        start = time.monotonic()
+        with pytest.raises(RetryFailed) as exc_info:
+            client.predict(make_data())
+        assert time.monotonic() - start < 0.3
+        errors = exc_info.value.errors
+        assert len(errors) == 1
+        assert errors[0].code() == grpc.StatusCode.DEADLINE_EXCEEDED
+        assert 0 < servicer.time_remaining[0] < 0.11
+
+        outputs = client.predict(make_data(), timeout=5)
+        np.testing.assert_array_equal(outputs['c'], np.full((1, 2), 3))
+        assert 4 < servicer.time_remaining[1] < 5.1
+    finally:
+        server.stop(None)
+
+
+def test_retries_share_the_deadline():
+    servicers = [FakePredictionServicer(fail_times=1000, delay_seconds=0.1) for _ in range(2)]
+    servers, addresses, port = start_sync_servers(servicers)
+    try:
+        with resolve_to(addresses):
+            client = Client(
+                host='localhost',
+                port=port,
+                retry=RetryPolicy(max_attempts=10, initial_backoff_seconds=0.001),
+            )
+            start = time.monotonic()
+            with pytest.raises(RetryFailed) as exc_info:
+                client.predict(make_data(), timeout=0.25)
+            elapsed = time.monotonic() - start
+    finally:
+        for server in servers:
+            server.stop(None)
+
+    assert 2 <= len(exc_info.value.errors) <= 3
+    assert elapsed < 0.4
+
+
+@pytest.mark.asyncio
+async def test_async_predict_timeout():
+    service = CancellableService(delay_seconds=0.3)
+    server, port = await start_async_server(service)
+    try:
+        client = Client(host='127.0.0.1', port=port, timeout_seconds=0.1)
+        with pytest.raises(RetryFailed) as exc_info:
+            await client.async_predict(make_data())
+        assert isinstance(exc_info.value.errors[0], aio.TimeoutError)
+        assert 0 < service.time_remaining[0] < 0.11
+
+        # the server gives up too
+        await aio.sleep(0.1)
+        assert service.cancelled == 1
+
+        service.delay_seconds = 0
+        outputs = await client.async_predict(make_data(), timeout=5)
+        np.testing.assert_array_equal(outputs['c'], np.full((1, 2), 3))
+    finally:
+        await stop_async_server(server)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_async_predict_resets_the_stream():
+    service = CancellableService(delay_seconds=10)
+    server, port = await start_async_server(service)
+    try:
+        client = Client(host='127.0.0.1', port=port)
+        task = aio.ensure_future(client.async_predict(make_data()))
+        for _ in range(100):
+            if service.time_remaining:
+                break
+            await aio.sleep(0.01)
+        assert service.time_remaining == [None]
+        task.cancel()
+        with pytest.raises(aio.CancelledError):
+            await task
+        for _ in range(100):
+            if service.cancelled:
+                break
+            await aio.sleep(0.01)
+        assert service.cancelled == 1
+        assert client._pool._total_in_flight == 0
+    finally:
+        await stop_async_server(server)
@@ -0,0 +1,181 @@
+import asyncio as aio
+import time
+
+import grpc
+from grpclib.health.check import ServiceStatus
+from grpclib.health.service import OVERALL, Health
+from grpclib.health.v1 import health_pb2
+import pytest
+
+from ..client import Client
+from ..health import HEALTH, LIST_MODELS, PREDICT, HealthCheckPolicy, NotServing
+from ..resolver import StaticResolver
+from ..warmup import WarmupRequest
+from .fake_serving import (
+    FakePredictionServicer,
+    AsyncFakePredictionService,
+    make_data,
+    resolve_to,
+    start_async_server,
+    start_sync_server,
+    start_sync_servers,
+    stop_async_server,
+)
+
+
+REQUEST = WarmupRequest(data=make_data())
+
+
+class HealthServicer:
+    '''grpc.health.v1 Check answering `status`'''
+
+    def __init__(self):
+        self.status = health_pb2.HealthCheckResponse.SERVING
+        self.services = []
+
+    def Check(self, request, context):
+        self.services.append(request.service)
+        return health_pb2.HealthCheckResponse(status=self.status)
+
+    def handler(self):
+        return grpc.method_handlers_generic_handler('grpc.health.v1.Health', {
+            'Check': grpc.unary_unary_rpc_method_handler(
+                self.Check,
+                request_deserializer=health_pb2.HealthCheckRequest.FromString,
+                response_serializer=health_pb2.HealthCheckResponse.SerializeToString,
+            ),
+        })
+
+
+def test_policy():
+    with pytest.raises(ValueError):
+        HealthCheckPolicy(method='ping')
+    with pytest.raises(ValueError):
+        HealthCheckPolicy(method=PREDICT)
+    with pytest.raises(ValueError):
+        HealthCheckPolicy(interval_seconds=0)
+
+
+def make_client(port, addresses, **kwargs):
+    policy = HealthCheckPolicy(interval_seconds=60, timeout_seconds=0.5, **kwargs)
+    return Client(
+        host=None, port=port, resolver=StaticResolver(addresses), health_check=policy)
+
+
+def test_health_checks_mark_unhealthy_connections():
+    health = HealthServicer()
+    server, port = start_sync_server(
+        FakePredictionServicer(), handlers=[health.handler()])
+    health_address, down_address = '127.0.0.1', '127.0.0.2'
+    try:
+        client = make_client(port, [health_address, down_address], unhealthy_threshold=2)
+        checker = client.health_checker
+        checker.check()
+        statuses = checker.statuses
+        assert statuses[health_address].healthy and statuses[health_address].method == HEALTH
+        assert statuses[health_address].latency_seconds < 0.5
+        assert statuses[down_address].healthy
+        assert statuses[down_address].error is not None
+        assert statuses[down_address].latency_seconds is None
+
+        checker.check()
+        assert not checker.statuses[down_address].healthy
+        assert {client._pool.pick()[0] for _ in range(10)} == {health_address}
+
+        # NOT_SERVING, then every connection is unhealthy and all of them are picked again
+        health.status = health_pb2.HealthCheckResponse.NOT_SERVING
+        checker.check()
+        checker.check()
+        assert isinstance(checker.statuses[health_address].error, NotServing)
+        assert not client._pool.healthy(health_address)
+        assert {client._pool.pick()[0] for _ in range(10)} == {health_address, down_address}
+
+        health.status = health_pb2.HealthCheckResponse.SERVING
+        checker.check()
+        assert checker.statuses[health_address].healthy
+        assert health.services == [''] * 5
+        assert checker.probe_count == 10
+    finally:
+        client.close()
+        server.stop(None)
+
+
+def test_health_checks_fall_back_to_other_methods():
+    servicer = FakePredictionServicer()
+    servers, addresses, port = start_sync_servers([servicer])
+    try:
+        client = make_client(port, addresses, request=REQUEST)
+        client.health_checker.check()
+        status = client.health_checker.statuses[addresses[0]]
+        assert status.healthy and status.error is None and status.method == PREDICT
+        assert len(servicer.requests) == 1
+
+        # without a request, a server answering UNIMPLEMENTED is healthy
+        client = make_client(port, addresses)
+        client.health_checker.check()
+        status = client.health_checker.statuses[addresses[0]]
+        assert status.healthy and status.error is None and status.method == LIST_MODELS
+        assert len(servicer.requests) == 1
+    finally:
+        for server in servers:
+            server.stop(None)
+
+
+def test_health_checks_run_in_a_thread():
+    servicers = [FakePredictionServicer(fail_times=1000), FakePredictionServicer()]
+    servers, addresses, port = start_sync_servers(servicers)
+    try:
+        with resolve_to(addresses):
+            client = Client(
+                host='localhost',
+                port=port,
+                health_check=HealthCheckPolicy(
+                    interval_seconds=0.05, unhealthy_threshold=1, request=REQUEST),
+            )
+            deadline = time.monotonic() + 3
+            while client._pool.healthy(addresses[0]) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert not client._pool.healthy(addresses[0])
+
+            for _ in range(10):
+                client.predict(make_data())
+            assert client.retrier.retry_count == 0
+            assert len(servicers[1].requests) >= 10
+    finally:
+        client.close()
+        for server in servers:
+            server.stop(None)
+
+
+@pytest.mark.asyncio
+async def test_async_health_checks():
+    status = ServiceStatus()
+    status.set(True)
+    server, port = await start_async_server(
+        AsyncFakePredictionService(), other_services=[Health({OVERALL: [status]})])
+    try:
+        client = Client(
+            host=None,
+            port=port,
+            resolver=StaticResolver(['127.0.0.1', '127.0.0.2']),
+            channel_mode='async',
+            health_check=HealthCheckPolicy(interval_seconds=0.05, unhealthy_threshold=1),
+        )
+        await client.async_predict(make_data())
+        for _ in range(100):
+            if len(client.health_checker.statuses) == 2:
+                break
+            await aio.sleep(0.01)
+        statuses = client.health_checker.statuses
+        assert statuses['127.0.0.1'].healthy and statuses['127.0.0.1'].method == HEALTH
+        assert not statuses['127.0.0.2'].healthy
+
+        status.set(False)
+        for _ in range(100):
+            if not client._pool.healthy('127.0.0.1'):
+                break
+            await aio.sleep(0.01)
+        assert isinstance(client.health_checker.statuses['127.0.0.1'].error, NotServing)
+    finally:
+        client.close()
+        await stop_async_server(server)
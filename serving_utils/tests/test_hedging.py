@@ -0,0 +1,120 @@
+import asyncio as aio
+import time
+
+import numpy as np
+import pytest
+
+from ..client import Client
+from ..hedging import Hedger, HedgingPolicy
+from .fake_serving import (
+    FakePredictionServicer,
+    AsyncFakePredictionService,
+    make_data,
+    resolve_to,
+    start_sync_servers,
+    start_async_servers,
+    stop_async_server,
+)
+
+
+def test_hedger_delay_from_observed_percentile():
+    hedger = Hedger(HedgingPolicy(delay_seconds=1, delay_percentile=50, min_samples=4))
+    for latency in [0.1, 0.2, 0.3]:
+        hedger.record('m', latency)
+    assert hedger.delay('m') == 1
+
+    hedger.record('m', 0.4)
+    assert hedger.delay('m') == pytest.approx(0.25)
+    assert hedger.delay('other') == 1
+
+    assert Hedger(HedgingPolicy(delay_seconds=0.5)).delay('m') == 0.5
+    with pytest.raises(ValueError):
+        HedgingPolicy(max_extra_load=2)
+
+
+def test_hedger_budget():
+    hedger = Hedger(HedgingPolicy(max_extra_load=0.25, max_burst=1))
+    hedger.start_call()
+    assert hedger.try_hedge()
+    assert not hedger.try_hedge()
+
+    for _ in range(3):
+        hedger.start_call()
+        assert not hedger.try_hedge()
+    hedger.start_call()
+    assert hedger.try_hedge()
+    assert hedger.hedges_sent == 2
+    assert hedger.call_count == 5
+
+
+def test_client_predict_hedges_slow_replica():
+    slow = FakePredictionServicer(delay_seconds=1)
+    fast = FakePredictionServicer()
+    servers, addresses, port = start_sync_servers([slow, fast])
+    try:
+        with resolve_to(addresses):
+            client = Client(
+                host='localhost',
+                port=port,
+                hedging=HedgingPolicy(delay_seconds=0.05, max_extra_load=1),
+            )
+            for _ in range(4):
+                start = time.monotonic()
+                outputs = client.predict(make_data(), output_names=['c'])
+                assert time.monotonic() - start < 0.5
+                np.testing.assert_array_equal(outputs['c'], [[3, 3]])
+    finally:
+        for server in servers:
+            server.stop(None)
+
+    assert len(slow.requests) == 2
+    assert len(fast.requests) == 4
+    assert client.hedger.hedges_sent == 2
+    assert client.hedger.hedges_won == 2
+
+
+@pytest.mark.asyncio
+async def test_client_async_predict_hedges_slow_replica():
+    slow = AsyncFakePredictionService(delay_seconds=1)
+    fast = AsyncFakePredictionService()
+    servers, addresses, port = await start_async_servers([slow, fast])
+    try:
+        with resolve_to(addresses):
+            client = Client(
+                host='localhost',
+                port=port,
+                hedging=HedgingPolicy(delay_seconds=0.05, max_extra_load=1),
+            )
+            start = time.monotonic()
+            results = await aio.gather(
+                *[client.async_predict(make_data(), output_names=['c']) for _ in range(4)])
+            assert time.monotonic() - start < 0.5
+    finally:
+        for server in servers:
+            await stop_async_server(server)
+
+    for outputs in results:
+        np.testing.assert_array_equal(outputs['c'], [[3, 3]])
+    assert client.hedger.hedges_sent == 2
+    assert client.hedger.hedges_won == 2
+
+
+def test_client_predict_without_hedge_budget():
+    slow = FakePredictionServicer(delay_seconds=0.1)
+    servers, addresses, port = start_sync_servers([slow, FakePredictionServicer()])
+    try:
+        with resolve_to(addresses):
+            client = Client(
+                host='localhost',
+                port=port,
+                hedging=HedgingPolicy(delay_seconds=0.01, max_extra_load=0, max_burst=0),
+            )
+            for _ in range(2):
+                client.predict(make_data())
+    finally:
+        for server in servers:
+            server.stop(None)
+
+    assert len(slow.requests) == 1
+    assert client.hedger.hedges_sent == 0
+    assert client.hedger.call_count == 2
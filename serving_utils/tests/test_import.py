@@ -0,0 +1,98 @@
+import json
+import subprocess
+import sys
+from os.path import abspath, dirname
+
+import pytest
+
+# Budget for `from serving_utils import Client`, see README
+IMPORT_TIME_BUDGET_SECONDS = 2.0
+IMPORT_PEAK_RSS_BUDGET_MB = 150
+
+ROOT_DIR = dirname(dirname(dirname(abspath(__file__))))
+
+# Runs in a fresh interpreter with tensorflow made unimportable
+CLIENT_ONLY_IMPORT = '''
+import json
+import resource
+import sys
+import time
+
+
+class BlockTensorflow:
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname.split('.')[0] == 'tensorflow':
+            raise ImportError(f"{fullname} is blocked")
+
+
+sys.meta_path.insert(0, BlockTensorflow())
+
+start = time.perf_counter()
+from serving_utils import Client  # noqa: E402
+import_time = time.perf_counter() - start
+
+try:
+    # unlike ru_maxrss, VmHWM does not carry over the peak of the forking parent
+    with open('/proc/self/status') as f:
+        peak_rss = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:')) * 1024
+except (OSError, StopIteration):
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak_rss *= 1024  # kilobytes on linux, bytes on macOS
+
+print(json.dumps({
+    'import_time': import_time,
+    'peak_rss_mb': peak_rss / 1024 / 1024,
+    'tensorflow_imported': any(m.split('.')[0] == 'tensorflow' for m in sys.modules),
+}))
+'''
+
+
+# Runs in a fresh interpreter where tensorflow can be imported
+LAZY_IMPORT = '''
+import json
+import sys
+
+
+def tensorflow_imported():
+    return any(m.split('.')[0] == 'tensorflow' for m in sys.modules)
+
+
+import serving_utils  # noqa: E402
+from serving_utils import Client  # noqa: E402, F401
+after_import = tensorflow_imported()
+serving_utils.Saver
+print(json.dumps({'after_import': after_import, 'after_saver': tensorflow_imported()}))
+'''
+
+
+def run_client_only_import():
+    output = subprocess.check_output(
+        [sys.executable, '-c', CLIENT_ONLY_IMPORT],
+        cwd=ROOT_DIR,
+    )
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def test_client_import_without_tensorflow_within_budget():
+    result = run_client_only_import()
+
+    assert not result['tensorflow_imported']
+    assert result['import_time'] < IMPORT_TIME_BUDGET_SECONDS
+    assert result['peak_rss_mb'] < IMPORT_PEAK_RSS_BUDGET_MB
+
+
+def test_saver_and_loader_are_lazy():
+    pytest.importorskip('tensorflow')
+    output = subprocess.check_output([sys.executable, '-c', LAZY_IMPORT], cwd=ROOT_DIR)
+    result = json.loads(output.decode().strip().splitlines()[-1])
+    assert result == {'after_import': False, 'after_saver': True}
+
+    import serving_utils
+    from serving_utils.saver import Saver
+    from serving_utils.loader import Loader
+
+    assert serving_utils.Saver is Saver
+    assert serving_utils.Loader is Loader
+    assert 'Saver' in dir(serving_utils)
@@ -0,0 +1,215 @@
+import asyncio as aio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from ..client import Client, RetryFailed
+from ..pipeline import PredictResult, bounded_map, async_bounded_map, async_stream_map
+from .fake_serving import (
+    FakePredictionServicer,
+    AsyncFakePredictionService,
+    start_sync_server,
+    start_async_server,
+    stop_async_server,
+)
+
+
+class InFlightCounter:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.max = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.current += 1
+            self.max = max(self.max, self.current)
+
+    def __exit__(self, *_):
+        with self.lock:
+            self.current -= 1
+
+
+def test_bounded_map_keeps_order_and_bounds_concurrency():
+    counter = InFlightCounter()
+
+    def fn(i):
+        with counter:
+            time.sleep(0.01 * (i % 3))
+            if i == 4:
+                raise ValueError(i)
+            return i * 10
+
+    results = list(bounded_map(fn, range(10), concurrency=3))
+
+    assert [r.index for r in results] == list(range(10))
+    assert [r.outputs for r in results] == [i * 10 if i != 4 else None for i in range(10)]
+    assert isinstance(results[4].error, ValueError)
+    assert all(r.error is None for r in results if r.index != 4)
+    assert counter.max <= 3
+
+
+def test_bounded_map_unordered_and_lazy():
+    consumed = []
+
+    def inputs():
+        for i in range(6):
+            consumed.append(i)
+            yield i
+
+    def fn(i):
+        time.sleep(0.05 if i == 0 else 0)
+        return i
+
+    results = bounded_map(fn, inputs(), concurrency=2, ordered=False)
+    first = next(results)
+    assert len(consumed) <= 3
+    rest = list(results)
+
+    assert first.index != 0
+    assert sorted(r.index for r in [first] + rest) == list(range(6))
+
+    with pytest.raises(ValueError):
+        list(bounded_map(fn, [1], concurrency=0))
+
+
+@pytest.mark.asyncio
+async def test_async_bounded_map():
+    in_flight = 0
+    max_in_flight = 0
+
+    async def fn(i):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await aio.sleep(0.01 * (i % 3))
+        in_flight -= 1
+        if i == 2:
+            raise ValueError(i)
+        return i
+
+    ordered = [r async for r in async_bounded_map(fn, range(8), concurrency=3)]
+    assert [r.index for r in ordered] == list(range(8))
+    assert isinstance(ordered[2].error, ValueError)
+    assert max_in_flight <= 3
+
+    unordered = [r async for r in async_bounded_map(fn, range(8), 3, ordered=False)]
+    assert sorted(r.index for r in unordered) == list(range(8))
+    assert [r.index for r in unordered] != list(range(8))
+
+
+def make_inputs(n):
+    inputs = [
+        {'a': np.full((2, 3), i, dtype=np.float32), 'b': np.ones((2, 3), dtype=np.float32)}
+        for i in range(n)
+    ]
+    del inputs[1]['b']  # the server fails on this one
+    return inputs
+
+
+def assert_predict_results(results, n):
+    assert [r.index for r in results] == list(range(n))
+    assert isinstance(results[1].error, RetryFailed)
+    for r in results:
+        assert isinstance(r, PredictResult)
+        if r.index != 1:
+            np.testing.assert_array_equal(r.outputs['c'], np.full((2, 3), r.index + 2))
+
+
+def test_client_predict_many():
+    server, port = start_sync_server(FakePredictionServicer())
+    try:
+        client = Client(host='127.0.0.1', port=port, n_trys=1)
+        results = list(client.predict_many(make_inputs(10), output_names=['c'], concurrency=4))
+    finally:
+        server.stop(None)
+
+    assert_predict_results(results, 10)
+
+
+@pytest.mark.asyncio
+async def test_client_async_predict_many():
+    server, port = await start_async_server(AsyncFakePredictionService())
+    try:
+        client = Client(host='127.0.0.1', port=port, n_trys=1)
+        results = [
+            r async for r in client.async_predict_many(make_inputs(10), output_names=['c'])
+        ]
+    finally:
+        await stop_async_server(server)
+
+    assert_predict_results(results, 10)
+
+
+@pytest.mark.asyncio
+async def test_async_stream_map_backpressure():
+    produced = 0
+    in_flight = 0
+    max_ahead = 0
+
+    async def producer():
+        nonlocal produced
+        for i in range(500):
+            produced += 1
+            yield i
+
+    async def fn(i):
+        nonlocal in_flight
+        in_flight += 1
+        await aio.sleep(0.001 * (i % 2))
+        in_flight -= 1
+        return -i
+
+    consumed = 0
+    async for output in async_stream_map(fn, producer(), concurrency=4):
+        assert output == -consumed
+        consumed += 1
+        max_ahead = max(max_ahead, produced - consumed)
+        assert in_flight <= 4
+
+    assert consumed == 500
+    # items pulled but not yet consumed stay bounded by the window
+    assert max_ahead <= 4 + 1
+
+
+@pytest.mark.asyncio
+async def test_async_stream_map_errors_and_sync_iterables():
+    started = []
+
+    async def fn(i):
+        started.append(i)
+        await aio.sleep(0.01 if i == 1 else 0.05)
+        if i == 1:
+            raise ValueError(i)
+        return i
+
+    outputs = []
+    with pytest.raises(ValueError):
+        async for output in async_stream_map(fn, range(100), concurrency=3):
+            outputs.append(output)
+
+    assert outputs == [0]
+    assert len(started) <= 4
+
+
+@pytest.mark.asyncio
+async def test_client_astream_predict():
+
+    async def inputs():
+        for i in range(20):
+            await aio.sleep(0)
+            yield {'a': np.full((1, 2), i, dtype=np.float32), 'b': np.ones((1, 2), np.float32)}
+
+    server, port = await start_async_server(AsyncFakePredictionService())
+    try:
+        client = Client(host='127.0.0.1', port=port, n_trys=1)
+        outputs = [o async for o in client.astream_predict(inputs(), concurrency=3)]
+    finally:
+        await stop_async_server(server)
+
+    assert len(outputs) == 20
+    for i, output in enumerate(outputs):
+        np.testing.assert_array_equal(output['c'], [[i + 2, i + 2]])
@@ -0,0 +1,155 @@
+import asyncio as aio
+import time
+from unittest.mock import patch
+
+import pytest
+
+from ..client import Client
+from ..refresh import AsyncRefresher, ThreadRefresher
+from .fake_serving import (
+    FakePredictionServicer,
+    AsyncFakePredictionService,
+    make_data,
+    start_sync_server,
+    start_async_server,
+    stop_async_server,
+)
+
+
+def wait_until(condition, timeout=3):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_thread_refresher_interval_trigger_and_ttl():
+    ttls = []
+    refresher = ThreadRefresher(lambda: ttls[-1] if ttls else None, 0.05, 0.01)
+    refresher.start()
+    try:
+        time.sleep(0.3)
+        assert 3 <= refresher.refresh_count <= 7
+
+        # a long interval, then a trigger refreshes right away
+        refresher.interval_seconds = 60
+        time.sleep(0.1)
+        count = refresher.refresh_count
+        refresher.trigger()
+        assert wait_until(lambda: refresher.refresh_count == count + 1, timeout=1)
+
+        # a short TTL wins over the interval
+        ttls.append(0.05)
+        refresher.trigger()
+        time.sleep(0.3)
+        assert refresher.refresh_count >= count + 4
+    finally:
+        refresher.close()
+    time.sleep(0.1)
+    assert not refresher._thread.is_alive()
+
+
+def test_thread_refresher_rate_limit_and_errors():
+    calls = []
+
+    def refresh():
+        calls.append(time.monotonic())
+        raise OSError("no resolution")
+
+    refresher = ThreadRefresher(refresh, 60, min_interval_seconds=0.2)
+    refresher.start()
+    try:
+        for _ in range(20):
+            refresher.trigger()
+            time.sleep(0.02)
+        assert wait_until(lambda: len(calls) == 2, timeout=1)
+    finally:
+        refresher.close()
+    assert calls[1] - calls[0] >= 0.19
+    assert refresher.error_count == len(calls)
+    with pytest.raises(ValueError):
+        ThreadRefresher(refresh, 0)
+
+
+@pytest.mark.asyncio
+async def test_async_refresher():
+    calls = []
+
+    async def refresh():
+        calls.append(time.monotonic())
+        return 0.01 if len(calls) > 1 else None
+
+    refresher = AsyncRefresher(refresh, 60, min_interval_seconds=0.1)
+    refresher.start()
+    try:
+        await aio.sleep(0.1)
+        assert calls == []
+        refresher.trigger()
+        await aio.sleep(0.01)
+        assert len(calls) == 1
+        for _ in range(3):
+            refresher.trigger()
+            await aio.sleep(0.01)
+        assert len(calls) == 1
+
+        # answers after the first have a TTL shorter than the min interval
+        await aio.sleep(0.5)
+        assert 4 <= len(calls) <= 7
+    finally:
+        refresher.close()
+    await aio.sleep(0.01)
+    assert refresher._task.cancelled()
+
+
+def test_client_predict_without_dns_in_steady_state():
+    servicer = FakePredictionServicer(fail_times=1)
+    server, port = start_sync_server(servicer)
+    try:
+        with patch(
+            'socket.gethostbyname_ex',
+            return_value=('localhost', [], ['127.0.0.1']),
+        ) as mock_gethostbyname_ex:
+            client = Client(host='localhost', port=port, n_trys=2, dns_refresh_seconds=60)
+            assert mock_gethostbyname_ex.call_count == 1
+
+            # the failed first try makes the refresher resolve again in its thread
+            client.predict(make_data())
+            assert wait_until(lambda: mock_gethostbyname_ex.call_count == 2)
+            for _ in range(5):
+                client.predict(make_data())
+            assert mock_gethostbyname_ex.call_count == 2
+            client.close()
+    finally:
+        server.stop(None)
+    assert len(servicer.requests) == 7
+
+
+@pytest.mark.asyncio
+async def test_client_async_predict_resolves_in_the_loop():
+    service = AsyncFakePredictionService(fail_times=1)
+    server, port = await start_async_server(service)
+    loop = aio.get_event_loop()
+    try:
+        with patch(
+            'socket.gethostbyname_ex',
+            return_value=('localhost', [], ['127.0.0.1']),
+        ) as mock_gethostbyname_ex, patch.object(
+            loop, 'getaddrinfo', wraps=loop.getaddrinfo,
+        ) as mock_getaddrinfo:
+            client = Client(host='127.0.0.1', port=port, n_trys=2, dns_refresh_seconds=60)
+            client._async_refresher = AsyncRefresher(
+                client._async_setup_connections, 60, min_interval_seconds=0.01)
+            client._async_refresher.start()
+
+            await client.async_predict(make_data())
+            await aio.sleep(0.1)
+            assert mock_getaddrinfo.call_count == 1
+            for _ in range(5):
+                await client.async_predict(make_data())
+            assert mock_getaddrinfo.call_count == 1
+            assert mock_gethostbyname_ex.call_count == 1
+            client.close()
+    finally:
+        await stop_async_server(server)
+    assert list(client._pool) == ['127.0.0.1']
+    assert len(service.requests) == 7
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from ..client import Client, PredictInput
+from ..request_plan import RequestPlan, SerializedPredictRequest
+from .fake_serving import (
+    FakePredictionServicer,
+    AsyncFakePredictionService,
+    start_sync_server,
+    start_async_server,
+    stop_async_server,
+)
+
+
+@pytest.mark.parametrize('data', [
+    {'a': np.int16(2), 'b': np.int16(3)},
+    {'x': np.random.rand(4, 768).astype(np.float32)},
+    {'x': np.arange(24, dtype=np.int64).reshape(2, 3, 4)[:, ::2]},
+    {'x': np.arange(300 * 300, dtype=np.uint8).reshape(300, 300)},
+    {'x': np.array([b'abc', b'de']), 'y': np.array([True, False])},
+    {'中文': np.arange(3, dtype=np.int32), 'len': 5},
+    [PredictInput('a', np.float64(1.5)), PredictInput('b', np.ones((2, 1), np.float16))],
+])
+@pytest.mark.parametrize('output_names,model_signature_name', [
+    (None, None),
+    (['c', 'd'], 'test'),
+])
+def test_plan_builds_same_request(data, output_names, model_signature_name):
+    plan = Client.compile_request(
+        model_name='test_model',
+        output_names=output_names,
+        model_signature_name=model_signature_name,
+    )
+    expected = Client._predict_request(
+        data=data,
+        output_names=output_names,
+        model_name='test_model',
+        model_signature_name=model_signature_name,
+    )
+
+    assert plan.to_proto(data) == expected
+    # the plan can be reused
+    assert plan.to_proto(data) == expected
+
+
+def test_plan_single_input_same_bytes():
+    data = {'x': np.random.rand(32, 128).astype(np.float32)}
+    plan = RequestPlan(model_name='m', output_names=['y'], model_signature_name='s')
+    expected = Client._predict_request(
+        data=data, output_names=['y'], model_name='m', model_signature_name='s')
+
+    request = plan.serialize(data)
+    assert isinstance(request, SerializedPredictRequest)
+    assert request.SerializeToString() == expected.SerializeToString()
+
+
+@pytest.fixture
+def sync_server_port():
+    server, port = start_sync_server(FakePredictionServicer())
+    yield port
+    server.stop(None)
+
+
+@pytest.fixture
+async def async_server_port():
+    server, port = await start_async_server(AsyncFakePredictionService())
+    yield port
+    await stop_async_server(server)
+
+
+def test_predict_with_plan(sync_server_port):
+    client = Client(host='127.0.0.1', port=sync_server_port, n_trys=1)
+    plan = client.compile_request(model_name='test_model', output_names=['c'])
+    a = np.arange(6, dtype=np.float32).reshape(2, 3)
+
+    output = client.predict({'a': a, 'b': np.ones_like(a)}, plan=plan)
+
+    np.testing.assert_array_equal(output['c'], a + 2)
+
+
+@pytest.mark.asyncio
+async def test_async_predict_with_plan(async_server_port):
+    client = Client(host='127.0.0.1', port=async_server_port, n_trys=1)
+    plan = client.compile_request(model_name='test_model', output_names=['c'])
+    a = np.arange(6, dtype=np.float32).reshape(2, 3)
+
+    output = await client.async_predict({'a': a, 'b': np.ones_like(a)}, plan=plan)
+
+    np.testing.assert_array_equal(output['c'], a + 2)
@@ -0,0 +1,161 @@
+import json
+import os
+import socket
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+from ..balancer import RoundRobinBalancer
+from ..client import Client
+from ..resolver import (
+    DnsResolver,
+    Endpoint,
+    FileResolver,
+    SrvResolver,
+    StaticResolver,
+)
+from .fake_serving import FakePredictionServicer, make_data, start_sync_server
+
+
+def test_endpoint_parse():
+    assert Endpoint.parse('10.0.0.1') == Endpoint('10.0.0.1', None, 1.)
+    assert Endpoint.parse('10.0.0.1:8501') == Endpoint('10.0.0.1', 8501)
+    assert Endpoint.parse('::1') == Endpoint('::1')
+    assert Endpoint.parse('[::1]:8501') == Endpoint('::1', 8501)
+    assert Endpoint.parse(('10.0.0.1', 8501, 2)).weight == 2
+    assert Endpoint.parse({'address': '10.0.0.1', 'weight': 3}) == Endpoint('10.0.0.1', None, 3)
+
+    assert Endpoint('10.0.0.1').key == '10.0.0.1'
+    assert Endpoint('10.0.0.1', 8501).key == '10.0.0.1:8501'
+    assert Endpoint('::1', 8501).key == '[::1]:8501'
+
+
+def test_static_resolver():
+    resolver = StaticResolver(['10.0.0.1', ('10.0.0.2', 8501, 2)])
+    endpoints, ttl = resolver.resolve()
+    assert endpoints == [Endpoint('10.0.0.1'), Endpoint('10.0.0.2', 8501, 2)]
+    assert ttl is None
+
+
+@pytest.mark.asyncio
+async def test_dns_resolver(event_loop):
+    endpoints, ttl = DnsResolver('localhost').resolve()
+    assert Endpoint('127.0.0.1') in endpoints
+    assert ttl is None
+    endpoints, _ = await DnsResolver('localhost').async_resolve(event_loop)
+    assert Endpoint('127.0.0.1') in endpoints
+
+    with patch('socket.gethostbyname_ex', return_value=('h', [], ['1.2.3.4'])):
+        endpoints, _ = DnsResolver('h', family=socket.AF_INET).resolve()
+    assert endpoints == [Endpoint('1.2.3.4')]
+
+
+def make_srv_record(priority, weight, port, target):
+    record = MagicMock(priority=priority, weight=weight, port=port)
+    record.target.to_text.return_value = target
+    return record
+
+
+def test_srv_resolver():
+    records = [
+        make_srv_record(10, 3, 8501, 'localhost'),
+        make_srv_record(10, 0, 8502, 'localhost'),
+        make_srv_record(20, 1, 8503, 'backup.invalid'),
+    ]
+    answer = MagicMock()
+    answer.__iter__.return_value = records
+    answer.rrset.ttl = 30
+    dns_resolver = MagicMock()
+    dns_resolver.resolve.return_value = answer
+
+    with patch('serving_utils.resolver._import_dns_resolver', return_value=dns_resolver):
+        resolver = SrvResolver('_grpc._tcp.serving.local', family=socket.AF_INET)
+    endpoints, ttl = resolver.resolve()
+    dns_resolver.resolve.assert_called_once_with('_grpc._tcp.serving.local', 'SRV')
+    assert endpoints == [Endpoint('127.0.0.1', 8501, 3), Endpoint('127.0.0.1', 8502, 1)]
+    assert ttl == 30
+
+
+def test_srv_resolver_needs_dnspython():
+    try:
+        import dns.resolver  # noqa: F401
+    except ImportError:
+        with pytest.raises(ImportError):
+            SrvResolver('_grpc._tcp.serving.local')
+    else:
+        pytest.skip("dnspython is installed")
+
+
+def test_file_resolver(tmpdir):
+    path = str(tmpdir.join('endpoints.json'))
+    with open(path, 'w') as f:
+        json.dump(['10.0.0.1', {'address': '10.0.0.2', 'port': 8501, 'weight': 2}], f)
+    resolver = FileResolver(path)
+    assert resolver.resolve() == (
+        [Endpoint('10.0.0.1'), Endpoint('10.0.0.2', 8501, 2)], None)
+
+    # not read again while unchanged
+    with patch.object(resolver, '_load') as mock_load:
+        resolver.resolve()
+    assert not mock_load.called
+
+    with open(path, 'w') as f:
+        json.dump({'endpoints': ['10.0.0.3']}, f)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+    assert resolver.resolve() == ([Endpoint('10.0.0.3')], None)
+
+
+def test_file_resolver_yaml(tmpdir):
+    pytest.importorskip('yaml')
+    path = str(tmpdir.join('endpoints.yaml'))
+    with open(path, 'w') as f:
+        f.write("endpoints:\n  - 10.0.0.1:8501\n  - {address: 10.0.0.2, weight: 2}\n")
+    endpoints, _ = FileResolver(path).resolve()
+    assert endpoints == [Endpoint('10.0.0.1', 8501), Endpoint('10.0.0.2', None, 2)]
+
+
+def test_client_with_weighted_endpoints():
+    big = FakePredictionServicer()
+    small = FakePredictionServicer()
+    big_server, big_port = start_sync_server(big)
+    small_server, small_port = start_sync_server(small)
+    resolver = StaticResolver([
+        ('127.0.0.1', big_port, 3),
+        f'127.0.0.1:{small_port}',
+    ])
+    try:
+        client = Client(
+            host=None,
+            port=8500,
+            resolver=resolver,
+            balancer=RoundRobinBalancer(),
+        )
+        assert set(client._pool) == {f'127.0.0.1:{big_port}', f'127.0.0.1:{small_port}'}
+        for _ in range(8):
+            client.predict(make_data())
+        assert (len(big.requests), len(small.requests)) == (6, 2)
+
+        # the endpoints are diffed into the pool, weights included
+        resolver.endpoints = [Endpoint('127.0.0.1', small_port, 2)]
+        client._setup_connections()
+        assert list(client._pool) == [f'127.0.0.1:{small_port}']
+        assert client._pool.weight(f'127.0.0.1:{small_port}') == 2
+    finally:
+        big_server.stop(None)
+        small_server.stop(None)
+
+
+def test_client_over_ipv6():
+    servicer = FakePredictionServicer()
+    try:
+        server, port = start_sync_server(servicer, host='[::1]')
+    except RuntimeError:
+        pytest.skip("no IPv6")
+    try:
+        client = Client(host=None, port=port, resolver=StaticResolver(['::1']))
+        outputs = client.predict(make_data(), output_names=['c'])
+    finally:
+        server.stop(None)
+    np.testing.assert_array_equal(outputs['c'], [[3, 3]])
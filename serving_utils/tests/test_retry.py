@@ -0,0 +1,145 @@
+from grpclib.const import Status
+from grpclib.exceptions import GRPCError
+import numpy as np
+import pytest
+
+from ..balancer import EmptyPool, RoundRobinBalancer
+from ..client import Client, RetryFailed
+from ..retry import Retrier, RetryPolicy
+from .fake_serving import (
+    FakePredictionServicer,
+    AsyncFakePredictionService,
+    make_data,
+    resolve_to,
+    start_sync_servers,
+    start_async_servers,
+    stop_async_server,
+)
+
+
+def test_backoff():
+    retrier = Retrier(RetryPolicy(
+        initial_backoff_seconds=0.1, max_backoff_seconds=0.3, backoff_multiplier=2, jitter=0))
+    assert [retrier.backoff(n) for n in range(1, 5)] == pytest.approx([0.1, 0.2, 0.3, 0.3])
+
+    retrier = Retrier(RetryPolicy(initial_backoff_seconds=0.1, jitter=0.5))
+    retrier._random = lambda: 1.
+    assert retrier.backoff(1) == pytest.approx(0.05)
+    retrier._random = lambda: 0.
+    assert retrier.backoff(1) == pytest.approx(0.1)
+
+    with pytest.raises(ValueError):
+        RetryPolicy(jitter=2)
+    with pytest.raises(ValueError):
+        RetryPolicy(max_attempts=0)
+
+
+def test_retryable_errors_and_attempts():
+    retrier = Retrier(RetryPolicy(max_attempts=3, jitter=0))
+    state = retrier.start_call()
+    state.errors.append(GRPCError(Status.INVALID_ARGUMENT, ''))
+    assert retrier.next_delay(state) is None
+
+    state = retrier.start_call()
+    state.errors.append(GRPCError(Status.UNAVAILABLE, ''))
+    assert retrier.next_delay(state) == pytest.approx(0.05)
+    state.errors.append(EmptyPool())
+    assert retrier.next_delay(state) == pytest.approx(0.1)
+    state.errors.append(ConnectionError())
+    assert retrier.next_delay(state) is None
+    assert retrier.retry_count == 2
+
+    retrier = Retrier(RetryPolicy(retryable_codes=['internal']))
+    assert retrier.is_retryable(GRPCError(Status.INTERNAL, ''))
+    assert not retrier.is_retryable(GRPCError(Status.UNAVAILABLE, ''))
+
+
+def test_retry_budget():
+    retrier = Retrier(RetryPolicy(max_attempts=10, budget_ratio=0.5, max_budget=2))
+    state = retrier.start_call()
+    delays = []
+    for _ in range(5):
+        state.errors.append(ConnectionError())
+        delays.append(retrier.next_delay(state))
+    assert [delay is not None for delay in delays] == [True, True, False, False, False]
+    assert retrier.budget_exhausted_count == 3
+
+    # calls refill it
+    retrier.start_call()
+    retrier.start_call()
+    assert retrier.next_delay(state) is not None
+    assert retrier.next_delay(state) is None
+
+
+def test_predict_retries_on_another_replica():
+    bad = FakePredictionServicer(fail_times=1000)
+    good = FakePredictionServicer()
+    servers, addresses, port = start_sync_servers([bad, good])
+    try:
+        with resolve_to(addresses):
+            client = Client(
+                host='localhost',
+                port=port,
+                balancer=RoundRobinBalancer(),
+                retry=RetryPolicy(max_attempts=2, initial_backoff_seconds=0.001),
+            )
+            for _ in range(10):
+                outputs = client.predict(make_data())
+                np.testing.assert_array_equal(outputs['c'], np.full((1, 2), 3))
+    finally:
+        for server in servers:
+            server.stop(None)
+
+    assert len(bad.requests) == 5
+    assert len(good.requests) == 10
+    assert client.retrier.retry_count == 5
+
+
+def test_predict_does_not_retry_request_errors():
+    servicer = FakePredictionServicer(fail_times=1000, fail_code='INVALID_ARGUMENT')
+    servers, addresses, port = start_sync_servers([servicer])
+    try:
+        with resolve_to(addresses):
+            client = Client(host='localhost', port=port, n_trys=3)
+            with pytest.raises(RetryFailed) as exc_info:
+                client.predict(make_data())
+    finally:
+        for server in servers:
+            server.stop(None)
+
+    assert len(exc_info.value.errors) == 1
+    assert len(servicer.requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_async_predict_retries_on_another_replica():
+    services = [AsyncFakePredictionService(fail_times=1000), AsyncFakePredictionService()]
+    servers, addresses, port = await start_async_servers(services)
+    try:
+        with resolve_to(addresses):
+            client = Client(
+                host='localhost',
+                port=port,
+                balancer=RoundRobinBalancer(),
+                retry=RetryPolicy(max_attempts=2, initial_backoff_seconds=0.001),
+            )
+            for _ in range(10):
+                outputs = await client.async_predict(make_data())
+                np.testing.assert_array_equal(outputs['c'], np.full((1, 2), 3))
+
+            # until the budget is spent
+            services[1].fail_times = 1000
+            client.retrier = Retrier(RetryPolicy(
+                max_attempts=3, initial_backoff_seconds=0.001, budget_ratio=0, max_budget=5))
+            n_errors = []
+            for _ in range(4):
+                with pytest.raises(RetryFailed) as exc_info:
+                    await client.async_predict(make_data())
+                n_errors.append(len(exc_info.value.errors))
+            assert n_errors == [3, 3, 2, 1]
+            assert client.retrier.budget_exhausted_count == 2
+    finally:
+        for server in servers:
+            await stop_async_server(server)
+
+    assert sum(len(service.requests) for service in services) == 10 + 5 + 9
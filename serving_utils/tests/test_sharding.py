@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from ..client import Client, RetryFailed
+from ..sharding import OutputGatherer, shard_batch
+from ..tensor_utils import make_tensor_proto
+from .fake_serving import (
+    FakePredictionServicer,
+    AsyncFakePredictionService,
+    start_sync_server,
+    start_async_server,
+    stop_async_server,
+)
+
+
+def make_batch(n_rows, width=4):
+    a = np.arange(n_rows * width, dtype=np.float32).reshape(n_rows, width)
+    return {'a': a, 'b': np.ones_like(a)}
+
+
+def test_shard_batch_by_rows_and_bytes():
+    data = make_batch(10)
+
+    shards = shard_batch(data, max_shard_rows=4)
+    assert [rows for rows, _ in shards] == [slice(0, 4), slice(4, 8), slice(8, 10)]
+    assert np.shares_memory(shards[1][1]['a'], data['a'])
+    np.testing.assert_array_equal(shards[2][1]['a'], data['a'][8:])
+
+    # a row of a and b is 32 bytes
+    shards = shard_batch(data, max_shard_bytes=100)
+    assert [rows.stop - rows.start for rows, _ in shards] == [3, 3, 3, 1]
+
+    shards = shard_batch(data, max_shard_rows=2, max_shard_bytes=100)
+    assert len(shards) == 5
+
+    assert len(shard_batch(data)) == 1
+
+
+def test_shard_batch_strings_and_outputs():
+    sentence = 'a sentence of about a hundred characters, counted as such, not as a pointer ' * 2
+    data = {'s': np.array([sentence] * 5000, dtype=object)}
+    max_shard_bytes = 64 * 1024
+    shards = shard_batch(data, max_shard_bytes=max_shard_bytes)
+    assert len(shards) > 1
+    for _, shard in shards[:-1]:
+        size = make_tensor_proto(shard['s']).ByteSize()
+        assert 0.9 * max_shard_bytes < size <= max_shard_bytes
+
+    bytes_data = {'s': np.array([sentence.encode()] * 100)}
+    assert len(shard_batch(bytes_data, max_shard_bytes=max_shard_bytes)) == 1
+
+    # small inputs, large outputs
+    data = {'tokens': np.ones((1000, 8), np.int32)}
+    assert len(shard_batch(data, max_shard_bytes=max_shard_bytes)) == 1
+    shards = shard_batch(data, max_shard_bytes=max_shard_bytes, output_bytes_per_row=768 * 4)
+    assert [rows.stop - rows.start for rows, _ in shards[:2]] == [21, 21]
+
+
+def test_shard_batch_invalid_inputs():
+    with pytest.raises(ValueError):
+        shard_batch({'a': np.float32(1)})
+    with pytest.raises(ValueError):
+        shard_batch({'a': np.ones((2, 1)), 'b': np.ones((3, 1))})
+
+
+def test_output_gatherer():
+    gatherer = OutputGatherer(5)
+    gatherer.add(slice(3, 5), {'c': np.array([[3], [4]])})
+    gatherer.add(slice(0, 3), {'c': np.array([[0], [1], [2]])})
+    np.testing.assert_array_equal(gatherer.result()['c'], np.arange(5).reshape(5, 1))
+
+    with pytest.raises(ValueError):
+        gatherer.add(slice(0, 2), {'c': np.array([[0]])})
+
+
+def test_scatter_predict_retries_failed_shards_only():
+    servicer = FakePredictionServicer(fail_times=1)
+    server, port = start_sync_server(servicer)
+    try:
+        client = Client(host='127.0.0.1', port=port, n_trys=2)
+        data = make_batch(50)
+        outputs = client.scatter_predict(data, output_names=['c'], max_shard_rows=8)
+
+        # 7 shards + 1 retry of the shard that failed
+        assert len(servicer.requests) == 8
+        np.testing.assert_array_equal(outputs['c'], data['a'] + 2)
+
+        servicer.fail_times = 100
+        with pytest.raises(RetryFailed):
+            client.scatter_predict(data, output_names=['c'], max_shard_rows=8)
+    finally:
+        server.stop(None)
+
+
+@pytest.mark.asyncio
+async def test_async_scatter_predict():
+    service = AsyncFakePredictionService(fail_times=1)
+    server, port = await start_async_server(service)
+    try:
+        client = Client(host='127.0.0.1', port=port, n_trys=2)
+        data = make_batch(50)
+        outputs = await client.async_scatter_predict(data, max_shard_bytes=32 * 10)
+    finally:
+        await stop_async_server(server)
+
+    assert len(service.requests) == 6
+    np.testing.assert_array_equal(outputs['c'], data['a'] + 2)
@@ -0,0 +1,157 @@
+import asyncio as aio
+from concurrent import futures
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from ..client import Client
+from ..single_flight import AsyncSingleFlight, SingleFlight
+from .fake_serving import (
+    FakePredictionServicer,
+    AsyncFakePredictionService,
+    make_data,
+    start_sync_server,
+    start_async_server,
+    stop_async_server,
+)
+
+
+def call_from_threads(n, fn):
+    barrier = threading.Barrier(n)
+
+    def call():
+        barrier.wait()
+        return fn()
+
+    with futures.ThreadPoolExecutor(max_workers=n) as executor:
+        fs = [executor.submit(call) for _ in range(n)]
+        return [f.exception() or f.result() for f in fs]
+
+
+def test_single_flight_shares_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    def fn(x):
+        calls.append(x)
+        time.sleep(0.05)
+        return [x]
+
+    results = call_from_threads(6, lambda: flight.do('k', fn, 1))
+
+    assert calls == [1]
+    assert all(result is results[0] for result in results)
+    assert flight.call_count == 6
+    assert flight.shared_count == 5
+    assert len(flight) == 0
+
+    # the key is free again once the call is done
+    flight.do('k', fn, 2)
+    assert calls == [1, 2]
+
+
+def test_single_flight_errors_reach_every_waiter():
+    flight = SingleFlight()
+
+    def fn():
+        time.sleep(0.05)
+        raise RuntimeError("boom")
+
+    results = call_from_threads(4, lambda: flight.do('k', fn))
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_async_single_flight():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fn(x):
+        calls.append(x)
+        await aio.sleep(0.01)
+        if x < 0:
+            raise ValueError(x)
+        return [x]
+
+    results = await aio.gather(*[flight.do('k', fn, 1) for _ in range(5)], flight.do('j', fn, 2))
+    assert calls == [1, 2]
+    assert all(result is results[0] for result in results[:5])
+    assert flight.shared_count == 4
+    assert len(flight) == 0
+
+    errors = await aio.gather(*[flight.do('e', fn, -1) for _ in range(3)], return_exceptions=True)
+    assert all(isinstance(error, ValueError) for error in errors)
+
+
+@pytest.mark.asyncio
+async def test_cancelling_one_waiter_keeps_the_shared_call():
+    flight = AsyncSingleFlight()
+
+    async def fn():
+        await aio.sleep(0.02)
+        return 'done'
+
+    cancelled = aio.ensure_future(flight.do('k', fn))
+    kept = aio.ensure_future(flight.do('k', fn))
+    await aio.sleep(0)
+    cancelled.cancel()
+
+    assert await kept == 'done'
+    assert cancelled.cancelled()
+
+
+def test_client_predict_single_flight():
+    servicer = FakePredictionServicer(delay_seconds=0.05)
+    server, port = start_sync_server(servicer)
+    try:
+        client = Client(host='127.0.0.1', port=port, single_flight=True)
+        results = call_from_threads(
+            5, lambda: client.predict(make_data(n_rows=2), output_names=['c']))
+    finally:
+        server.stop(None)
+
+    assert len(servicer.requests) == 1
+    for result in results:
+        np.testing.assert_array_equal(result['c'], np.full((2, 2), 3))
+    assert client.single_flight.shared_count == 4
+
+
+def test_client_predict_single_flight_per_timeout():
+    servicer = FakePredictionServicer(delay_seconds=0.05)
+    server, port = start_sync_server(servicer)
+    try:
+        client = Client(host='127.0.0.1', port=port, single_flight=True, timeout_seconds=5)
+        timeouts = iter([None, None, 2, 2])
+        results = call_from_threads(4, lambda: client.predict(
+            make_data(n_rows=2), output_names=['c'], timeout=next(timeouts)))
+    finally:
+        server.stop(None)
+
+    # one request per timeout
+    assert len(servicer.requests) == 2
+    assert client.single_flight.shared_count == 2
+    assert len({id(result) for result in results}) == 4
+
+
+@pytest.mark.asyncio
+async def test_client_async_predict_single_flight():
+    service = AsyncFakePredictionService()
+    server, port = await start_async_server(service)
+    try:
+        client = Client(host='127.0.0.1', port=port, single_flight=True)
+        results = await aio.gather(
+            *[client.async_predict(make_data(n_rows=2), output_names=['c']) for _ in range(5)],
+            client.async_predict(make_data(2, n_rows=2), output_names=['c']),
+        )
+    finally:
+        await stop_async_server(server)
+
+    assert len(service.requests) == 2
+    assert results[0] is not results[4] and results[0]['c'] is results[4]['c']
+    results[0]['d'] = None
+    assert 'd' not in results[4]
+    np.testing.assert_array_equal(results[5]['c'], np.full((2, 2), 4))
@@ -0,0 +1,137 @@
+import pytest
+import numpy as np
+try:
+    import tensorflow.compat.v1 as tf
+except ImportError:
+    import tensorflow as tf
+
+from ..protos import predict_pb2, tensor_pb2, types_pb2
+from ..tensor_utils import make_tensor_proto, make_ndarray, get_data_type
+
+
+@pytest.mark.parametrize('value', [
+    np.int16(2),
+    np.float32(1.5),
+    np.array(3, dtype=np.int64),
+    np.arange(12, dtype=np.float32).reshape(3, 4),
+    np.arange(12, dtype=np.float64).reshape(4, 3),
+    np.arange(6, dtype=np.int8),
+    np.arange(6, dtype=np.int16).reshape(2, 3),
+    np.arange(6, dtype=np.int32),
+    np.arange(6, dtype=np.int64).reshape(1, 6),
+    np.arange(6, dtype=np.uint8),
+    np.arange(6, dtype=np.uint16),
+    np.arange(6, dtype=np.uint32),
+    np.arange(6, dtype=np.uint64),
+    np.array([1.5, -2.25, 3.0], dtype=np.float16),
+    np.array([1 + 2j, 3 - 4j], dtype=np.complex64),
+    np.array([1 + 2j, 3 - 4j], dtype=np.complex128),
+    np.array([[True, False], [False, True]]),
+    np.True_,
+    np.zeros((0, 5), dtype=np.float32),
+    np.arange(24, dtype=np.float32).reshape(2, 3, 4)[:, ::2, 1:],  # non-contiguous
+    np.array([b'abc', b'de']),
+    np.array(['abc', '中文']),
+    np.array([b'x', 'y', b''], dtype=object),
+    np.str_('hello'),
+    'hello',
+    b'hello',
+    [b'a', [b'b']],
+    [['a', 'b'], ['c', 'd']],
+    1,
+    2 ** 40,
+    1.5,
+    [1, 2, 3],
+    [[1.5, 2.5], [3.5, 4.5]],
+    True,
+    [True, False],
+])
+def test_make_tensor_proto_same_bytes_as_tensorflow(value):
+    expected = tf.make_tensor_proto(value)
+    actual = make_tensor_proto(value)
+    assert actual.SerializeToString() == expected.SerializeToString()
+
+
+def test_make_tensor_proto_in_place():
+    req = predict_pb2.PredictRequest()
+    value = np.arange(10, dtype=np.float32).reshape(2, 5)
+    returned = make_tensor_proto(value, req.inputs['x'])
+
+    assert returned is req.inputs['x']
+    assert req.inputs['x'].SerializeToString() == \
+        tf.make_tensor_proto(value).SerializeToString()
+
+
+def test_get_data_type():
+    assert get_data_type(np.float32) == types_pb2.DT_FLOAT
+    assert get_data_type('<U3') == types_pb2.DT_STRING
+    assert get_data_type(np.dtype('S1')) == types_pb2.DT_STRING
+    with pytest.raises(TypeError):
+        get_data_type('datetime64[s]')
+
+
+def test_make_tensor_proto_none():
+    with pytest.raises(ValueError):
+        make_tensor_proto(None)
+
+
+@pytest.mark.parametrize('value', [
+    np.int16(2),
+    np.float32(1.5),
+    np.arange(12, dtype=np.float32).reshape(3, 4),
+    np.arange(6, dtype=np.int64).reshape(1, 6),
+    np.arange(6, dtype=np.uint16),
+    np.array([1.5, -2.25, 3.0], dtype=np.float16),
+    np.array([1 + 2j, 3 - 4j], dtype=np.complex64),
+    np.array([1 + 2j, 3 - 4j], dtype=np.complex128),
+    np.array([[True, False], [False, True]]),
+    np.zeros((0, 5), dtype=np.float32),
+    np.array([b'abc', b'de']),
+    np.array(['abc', '中文']),
+])
+def test_make_ndarray_same_as_tensorflow(value):
+    tensor_proto = tf.make_tensor_proto(value)
+    expected = tf.make_ndarray(tensor_proto)
+    actual = make_ndarray(tensor_proto)
+
+    assert actual.dtype == expected.dtype
+    assert actual.shape == expected.shape
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_make_ndarray_read_only_unless_copy():
+    dense = make_tensor_proto(np.arange(768 * 2, dtype=np.float32).reshape(2, 768))
+    scalar = make_tensor_proto(np.float32(1.5))
+
+    for tensor_proto in (dense, scalar):
+        nparray = make_ndarray(tensor_proto)
+        assert not nparray.flags.writeable
+        with pytest.raises(ValueError):
+            nparray[...] = 0
+
+        copied = make_ndarray(tensor_proto, copy=True)
+        assert copied.flags.writeable
+        copied[...] = 0
+        np.testing.assert_array_equal(make_ndarray(tensor_proto), nparray)
+
+
+def test_make_ndarray_pads_typed_fields():
+    tensor_proto = tensor_pb2.TensorProto(dtype=types_pb2.DT_INT32)
+    for size in (2, 3):
+        tensor_proto.tensor_shape.dim.add().size = size
+    tensor_proto.int_val.extend([7])
+    np.testing.assert_array_equal(make_ndarray(tensor_proto), np.full((2, 3), 7, np.int32))
+
+    tensor_proto = tensor_pb2.TensorProto(dtype=types_pb2.DT_UINT64)
+    tensor_proto.tensor_shape.dim.add().size = 3
+    tensor_proto.uint64_val.extend([1, 2])
+    np.testing.assert_array_equal(make_ndarray(tensor_proto), np.array([1, 2, 2], np.uint64))
+
+    tensor_proto = tensor_pb2.TensorProto(dtype=types_pb2.DT_STRING)
+    tensor_proto.tensor_shape.dim.add().size = 2
+    np.testing.assert_array_equal(make_ndarray(tensor_proto), np.array([b'', b''], object))
+
+
+def test_make_ndarray_unsupported_type():
+    with pytest.raises(TypeError):
+        make_ndarray(tensor_pb2.TensorProto(dtype=types_pb2.DT_RESOURCE))
@@ -0,0 +1,101 @@
+import asyncio as aio
+import socket
+import time
+
+import numpy as np
+import pytest
+
+from ..client import Client
+from ..resolver import StaticResolver
+from ..warmup import WarmupRequest, make_warmup_data
+from .fake_serving import (
+    FakePredictionServicer,
+    AsyncFakePredictionService,
+    start_sync_servers,
+    start_async_servers,
+    stop_async_server,
+)
+
+
+def test_make_warmup_data():
+    data = make_warmup_data({
+        'a': ((None, 3), 'float32'),
+        'b': ((2,), 'int64'),
+        'c': ((-1,), 'S'),
+    })
+    np.testing.assert_array_equal(data['a'], np.zeros((1, 3), np.float32))
+    assert data['b'].dtype == np.int64 and data['b'].shape == (2,)
+    assert data['c'].tolist() == [b'']
+
+    request = WarmupRequest(input_specs={'a': ((1, 2), 'float32')}, model_name='m')
+    assert request.data['a'].shape == (1, 2)
+    with pytest.raises(ValueError):
+        WarmupRequest()
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+WARMUP_REQUESTS = [
+    WarmupRequest(input_specs={'a': ((1, 2), 'float32'), 'b': ((1, 2), 'float32')}),
+    WarmupRequest(data={'a': np.ones((4, 2), np.float32), 'b': np.ones((4, 2), np.float32)}),
+]
+
+
+def test_warmup():
+    servicers = [FakePredictionServicer() for _ in range(3)]
+    servers, addresses, port = start_sync_servers(servicers)
+    resolver = StaticResolver(addresses[:2] + [f'127.0.0.1:{closed_port()}'])
+    try:
+        client = Client(host=None, port=port, resolver=resolver)
+        reports = client.warmup(WARMUP_REQUESTS, timeout_seconds=0.5)
+        assert set(reports) == set(client._pool)
+        for address in addresses[:2]:
+            report = reports[address]
+            assert report.connect_seconds < 0.5
+            assert report.request_seconds < 0.5
+            assert report.error is None
+        failed = [report for report in reports.values() if report.error is not None]
+        assert len(failed) == 1 and failed[0].connect_seconds is None
+        assert [len(servicer.requests) for servicer in servicers] == [2, 2, 0]
+
+        # endpoints added later are warmed up in the background
+        resolver.endpoints = StaticResolver(addresses).endpoints
+        client._setup_connections()
+        deadline = time.monotonic() + 3
+        while addresses[2] not in client.warmup_reports and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert client.warmup_reports[addresses[2]].error is None
+        assert len(servicers[2].requests) == 2
+        assert len(client.warmup_reports) == 3
+    finally:
+        for server in servers:
+            server.stop(None)
+
+
+@pytest.mark.asyncio
+async def test_awarmup():
+    services = [AsyncFakePredictionService() for _ in range(3)]
+    servers, addresses, port = await start_async_servers(services)
+    resolver = StaticResolver(addresses[:2])
+    try:
+        client = Client(host=None, port=port, resolver=resolver, channel_mode='async')
+        reports = await client.awarmup(WARMUP_REQUESTS[:1])
+        assert sorted(reports) == addresses[:2]
+        assert all(report.error is None for report in reports.values())
+        assert [len(service.requests) for service in services] == [1, 1, 0]
+
+        resolver.endpoints = StaticResolver(addresses).endpoints
+        await client._async_setup_connections()
+        for _ in range(100):
+            if addresses[2] in client.warmup_reports:
+                break
+            await aio.sleep(0.01)
+        assert client.warmup_reports[addresses[2]].connect_seconds is not None
+        assert len(services[2].requests) == 1
+    finally:
+        for server in servers:
+            await stop_async_server(server)
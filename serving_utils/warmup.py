@@ -0,0 +1,106 @@
+'''
+Warm-up of the connections of a Client
+
+Each connection is connected (TCP, TLS and HTTP/2 setup) and sent the
+warm-up requests before real traffic, so that the first requests after a
+deploy do not pay for it, nor for the lazy initialization of the model.
+'''
+import asyncio
+import collections
+import time
+from typing import List, Mapping, Tuple
+
+import grpc
+import numpy as np
+
+
+WarmupReport = collections.namedtuple(
+    'WarmupReport', ['address', 'connect_seconds', 'request_seconds', 'error'])
+WarmupReport.__doc__ = '''Warm-up of one connection
+
+`request_seconds` is the latency of the first warm-up request, None if there
+was none, and `error` the exception that stopped the warm-up, if any.
+'''
+
+
+class WarmupRequest:
+
+    def __init__(
+            self,
+            data: Mapping = None,
+            input_specs: Mapping[str, Tuple[tuple, str]] = None,
+            output_names: List[str] = None,
+            model_name: str = 'default',
+            model_signature_name: str = None,
+        ):
+        """A request sent to every connection by Client.warmup
+
+        Args:
+            data : inputs as accepted by `predict`
+            input_specs : if `data` is not given, generate inputs of zeros from
+                name => (shape, dtype), None dimensions are 1
+                e.g. {'sentence': ((None, 128), 'int32')}
+            output_names, model_name, model_signature_name : as in `predict`
+        """
+        if data is None:
+            if input_specs is None:
+                raise ValueError("data or input_specs should be given")
+            data = make_warmup_data(input_specs)
+        self.data = data
+        self.output_names = output_names
+        self.model_name = model_name
+        self.model_signature_name = model_signature_name
+
+
+def make_warmup_data(input_specs: Mapping[str, Tuple[tuple, str]]) -> Mapping[str, np.ndarray]:
+    '''Inputs of zeros (empty strings) of the shapes and dtypes in `input_specs`'''
+    data = {}
+    for name, (shape, dtype) in input_specs.items():
+        shape = tuple(1 if dim is None or dim < 0 else dim for dim in shape)
+        dtype = np.dtype(dtype)
+        if dtype.kind in 'SUO':
+            data[name] = np.full(shape, b'', dtype=object)
+        else:
+            data[name] = np.zeros(shape, dtype=dtype)
+    return data
+
+
+def warmup_connection(address, conn, requests, timeout_seconds) -> WarmupReport:
+    '''Connect the grpcio channels of `conn` and send it the PredictRequests `requests`'''
+    connect_seconds = request_seconds = None
+    try:
+        start = time.monotonic()
+        ready = [grpc.channel_ready_future(channel.channel) for channel in conn.channels()]
+        for future in ready:
+            future.result(timeout=timeout_seconds)
+        connect_seconds = time.monotonic() - start
+        for request in requests:
+            start = time.monotonic()
+            conn.sync_stub.Predict(request, timeout=timeout_seconds)
+            if request_seconds is None:
+                request_seconds = time.monotonic() - start
+    except Exception as e:
+        return WarmupReport(address, connect_seconds, request_seconds, e)
+    return WarmupReport(address, connect_seconds, request_seconds, None)
+
+
+async def async_warmup_connection(address, conn, requests, timeout_seconds) -> WarmupReport:
+    '''Async twin of `warmup_connection`, on the grpclib channel'''
+    connect_seconds = request_seconds = None
+    try:
+        start = time.monotonic()
+        await asyncio.wait_for(
+            asyncio.gather(*[channel.channel.__connect__() for channel in conn.channels(True)]),
+            timeout_seconds,
+        )
+        connect_seconds = time.monotonic() - start
+        for request in requests:
+            start = time.monotonic()
+            await conn.async_stub.Predict(request, timeout=timeout_seconds)
+            if request_seconds is None:
+                request_seconds = time.monotonic() - start
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        return WarmupReport(address, connect_seconds, request_seconds, e)
+    return WarmupReport(address, connect_seconds, request_seconds, None)